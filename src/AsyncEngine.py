@@ -0,0 +1,157 @@
+from typing import List
+import asyncio, logging
+
+from gvars import flog
+from EngineUCI import EngineEventListener, Move, parse_movelist, subprocess_args, DEFAULT_OPT, DEFAULT_ENGPATH, GAME_CONTINUITY, SEARCH_STOP_TIMEOUT
+from EngineGame import GameTracker, position_cmd
+
+logger = logging.getLogger()
+
+ASYNC_MOVETIME = 2000 # ms per position when analyse does not say
+ASYNC_START_TIMEOUT = 10 # seconds to wait the engine 'uciok' / 'readyok'
+
+# UCI engine client on asyncio: the process pipes are read by a single reader task, a search is a
+# future resolved by its bestmove. No thread and no fixed sleep, one event loop can drive many engines:
+#   engine = AsyncEngine(path)
+#   await engine.start()
+#   info = await engine.analyse(fen, 1000)
+# The listeners are the EngineEventListener of Engine, called from the event loop
+class AsyncEngine:
+    def __init__(self, enginePath=DEFAULT_ENGPATH, options=None, continuity=GAME_CONTINUITY):
+        self.enginePath = enginePath
+        self.options = DEFAULT_OPT if options is None else {**DEFAULT_OPT, **options}
+        self.uci_movetime = ASYNC_MOVETIME
+        self.eventListeners: List[EngineEventListener] = []
+        self.continuity = continuity
+        self.game = GameTracker()
+        self.process: asyncio.subprocess.Process = None
+        self.reader: asyncio.Task = None
+        self.lock = asyncio.Lock() # one search started at a time
+        self.search = None # (fen, future) of the running search
+        self.ready = None # future of the next 'uciok' / 'readyok'
+        self.infos: List[Move] = []
+        self.stopping = False
+
+    def add_event_listener(self, listener: EngineEventListener):
+        self.eventListeners.append(listener)
+
+    async def start(self):
+        self.stopping = False
+        args = subprocess_args()
+        args.pop('universal_newlines') # asyncio pipes are bytes
+        args['stderr'] = asyncio.subprocess.DEVNULL # never read
+        try:
+            self.process = await asyncio.create_subprocess_exec(self.enginePath, **args)
+        except Exception as e:
+            raise RuntimeError(f'Engine cannot start from path {self.enginePath}: {e}')
+        self.reader = asyncio.create_task(self.read_output())
+        await self.wait_ready('uci\n')
+        for option, value in self.options.items():
+            self.write(f'setoption name {option} value {value}\n')
+        await self.wait_ready('isready\n')
+        logger.info(f'Async engine started {self.enginePath}')
+
+    async def wait_ready(self, cmd):
+        self.ready = asyncio.get_running_loop().create_future()
+        self.write(cmd)
+        await asyncio.wait_for(self.ready, ASYNC_START_TIMEOUT)
+
+    async def quit(self):
+        self.stopping = True
+        if self.process is None or self.process.returncode is not None:
+            return
+        try:
+            await self.stop()
+        except RuntimeError: # no bestmove after the 'stop', the process is killed
+            return
+        self.write('quit\n')
+        try:
+            await asyncio.wait_for(self.process.wait(), ASYNC_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.process.kill()
+        self.reader.cancel()
+
+    def write(self, *messages):
+        for msg in messages:
+            flog('uci_cmdlog', msg)
+            self.process.stdin.write(msg.encode())
+
+    def position_cmds(self, fen):
+        if not self.continuity:
+            return ['ucinewgame\n', position_cmd(fen)]
+        newgame, start, moves = self.game.update(fen)
+        return (['ucinewgame\n'] if newgame else []) + [position_cmd(start, moves)]
+
+    # The Move of the bestmove of fen (None if the engine gave no info). A running search is stopped
+    # first, its own analyse get its bestmove. The search future belong to the engine: a cancelled
+    # analyse (asyncio.wait_for timeout) leave it running until its bestmove, the next search stop it
+    async def analyse(self, fen, movetime=None) -> Move:
+        async with self.lock:
+            await self.stop()
+            future = asyncio.get_running_loop().create_future()
+            self.search = (fen, future)
+            self.infos = []
+            self.write(*self.position_cmds(fen), f'go movetime {movetime or self.uci_movetime}\n')
+            await self.process.stdin.drain()
+        return await asyncio.shield(future)
+
+    # stop the running search, return its Move when there was one. An engine that does not answer the
+    # 'stop' within SEARCH_STOP_TIMEOUT is killed, its search fail with a RuntimeError
+    async def stop(self):
+        if self.search is None:
+            return None
+        fen, future = self.search
+        self.write('stop\n')
+        await self.process.stdin.drain()
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), SEARCH_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            msg = f'No bestmove {SEARCH_STOP_TIMEOUT}s after stopping "{fen}"'
+            logger.error(f'{msg}, killing the engine')
+            if self.search is not None and self.search[1] is future:
+                self.search = None
+            if not future.done():
+                future.set_exception(RuntimeError(msg))
+            self.process.kill()
+            raise RuntimeError(msg)
+
+    async def read_output(self):
+        try:
+            while True:
+                line = (await self.process.stdout.readline()).decode()
+                if not line:
+                    break
+                flog('uci_outlog', line)
+                items = line.split()
+                if not items:
+                    continue
+                if items[0] == 'info':
+                    info = Move.parse(items)
+                    if info:
+                        self.infos.append(info)
+                elif items[0] == 'bestmove':
+                    self.on_bestmove(items[1], None if len(items) < 4 else items[3])
+                elif items[0] in ('uciok', 'readyok') and self.ready is not None and not self.ready.done():
+                    self.ready.set_result(items[0])
+        except asyncio.CancelledError:
+            return
+        if self.search is not None:
+            self.search[1].set_exception(RuntimeError('UCI stopped unexpected'))
+            self.search = None
+        if not self.stopping:
+            logger.warning('Async engine output closed')
+            for l in self.eventListeners:
+                l.on_engine_fatal('UCI stopped unexpected')
+
+    def on_bestmove(self, bestmove, ponder):
+        if self.search is None:
+            logger.warning(f'Receiving bestmove log where not expected {bestmove} {ponder}')
+            return
+        (fen, future), self.search = self.search, None
+        logger.info(f'Found bestmove for "{fen}" {bestmove} {ponder}')
+        info = parse_movelist(self.infos, (bestmove, ponder))
+        self.infos = []
+        if not future.done():
+            future.set_result(info)
+        for l in self.eventListeners:
+            l.on_move_calculated(fen, info)
@@ -4,6 +4,9 @@ from abc import ABC, abstractmethod
 from enum import Enum
 import re, logging, threading
 
+from .PollScheduler import PollScheduler
+from .ListenerChannel import ListenerChannel
+
 GRID_WIDTH = 9
 GRID_HEIGHT = 10
 PIECE_NAME = 'King Advisor Elephant Rook Cannon Horse Pawn'.split()
@@ -23,6 +26,10 @@ MOVE_PTN = re.compile(r'([a-z])(\d+)([a-z])(\d+)')
 
 FILE2NUM = dict(a=1,b=2,c=3,d=4,e=5,f=6,g=7,h=8,i=9)
 
+STABLE_FRAMES = 1 # a new board is sent to the listeners once it is the same in this many frames in a row.
+                  # 1 send it at once, 2 or more skip the boards seen mid-animation but delay each move
+ASYNC_LISTENERS = False # deliver the board updates to each listener on its own thread (ListenerChannel)
+
 logger = logging.getLogger()
 
 class Side(Enum):
@@ -112,8 +119,22 @@ class MonitorResult:
     def fenfull(self):
         return f'{self.fen} {self.moveSide.opponent.fen} - - 0 1'
 
+    def copy(self) -> MonitorResult:
+        r = MonitorResult()
+        r.mySide = self.mySide
+        r.moveSide = self.moveSide
+        r.positions = [row[:] for row in self.positions]
+        r.lastMovePosition = self.lastMovePosition
+        r.lastMoveFrom = self.lastMoveFrom
+        return r
+
     def isSame(self, other: MonitorResult):
         return self.fenfull == other.fenfull
+
+    # compact hash of what isSame compare, without building the fen
+    @property
+    def stateKey(self):
+        return hash((''.join(map(''.join, self.positions)), self.moveSide, self.mySide))
     
     def isSameMove(self, other: MonitorResult):
         if not self.lastMoveFrom or not other.lastMoveFrom:
@@ -170,16 +191,32 @@ class BaseMonitor(ABC):
     def do_board_scan(self) -> MonitorResult | None:
         pass
 
-    eventListeners: List[BoardMonitorListener] = []
+    # called when the result of do_board_scan was handed to the listeners
+    def do_frame_done(self) -> None:
+        pass
+
     stopPolling = False
     pollingStopped = threading.Event()
     engine_thread = None
+    scheduler: PollScheduler = None
+    stableFrames = STABLE_FRAMES
+    frameKey = None # stateKey of the last scanned board
+    frameRepeat = 0 # number of frames in a row with that board
+    emittedKey = None # stateKey of the last board sent to the listeners
+    emittedFrames = 0
+    unstableFrames = 0 # new boards not sent yet, i.e. mid-animation
 
-    # def __init__(self) -> None:
-    #     self.do_init(params)
+    def __init__(self) -> None:
+        self.eventListeners: List[BoardMonitorListener] = []
+        self.channels: List[ListenerChannel] = [] # one per listener when the board updates are delivered asynchronously
 
+    # adding a listener twice (i.e. on a restart) does not deliver the updates twice
     def add_event_listener(self, listener: BoardMonitorListener):
+        if listener in self.eventListeners:
+            return
         self.eventListeners.append(listener)
+        if self.channels:
+            self.channels.append(ListenerChannel(listener))
 
     def send_msg(self, msg):
         for l in self.eventListeners:
@@ -194,19 +231,68 @@ class BaseMonitor(ABC):
             l.on_monitor_msg(MonitorMsgSeverity.FATAL, msg)
 
     def send_board_update_event(self, result: MonitorResult):
+        if self.channels:
+            # listeners may change the result (i.e. HelperEngine set moveSide), and now run concurrently
+            for i, c in enumerate(self.channels):
+                c.publish(result if i == 0 else result.copy())
+            return
         for l in self.eventListeners:
             l.on_board_updated(result)
 
+    # board updates not delivered because a newer one replaced them
+    @property
+    def coalescedFrames(self):
+        return sum(c.coalesced for c in self.channels)
+
+    # Follow the scanned boards, return (changed, emit)
+    #   changed: the board is not the one of the previous frame
+    #   emit: a board other than the last one sent, that stayed the same for stableFrames frames
+    def track_board(self, result: MonitorResult):
+        key = result.stateKey
+        changed = key != self.frameKey
+        self.frameRepeat = 1 if changed else self.frameRepeat + 1
+        self.frameKey = key
+        if key == self.emittedKey:
+            return changed, False
+        if self.frameRepeat < self.stableFrames:
+            self.unstableFrames += 1
+            return changed, False
+        self.emittedKey = key
+        self.emittedFrames += 1
+        return changed, True
+
+    # send the current board again even if it did not change, i.e. after a listener reset its state
+    def request_update(self):
+        self.emittedKey = None
+        if self.scheduler:
+            self.scheduler.wake()
+
     
+    # polling rate, see PollScheduler
+    @property
+    def effectiveHz(self):
+        return self.scheduler.effectiveHz if self.scheduler else 0.0
+
+    # seconds the last frame waited before the next scan
+    @property
+    def lastWait(self):
+        return self.scheduler.lastWait if self.scheduler else 0.0
+
     def start(self, params=None): #delaySecond=0.1):
-        params = {'delaySecond':0.1, **(params or {})}
+        params = {'delaySecond':0.1, **(params or {})} # delaySecond: the fastest polling period
         # params = {'delaySecond':3, **(params or {})}
         self.stop()
         self.do_init(params)
+        self.scheduler = PollScheduler.from_params(params)
+        self.stableFrames = params.get('stableFrames', STABLE_FRAMES)
+        self.frameKey = self.emittedKey = None
+        if params.get('asyncListeners', ASYNC_LISTENERS):
+            self.channels = [ListenerChannel(l) for l in self.eventListeners]
         def polling():
-            import time
             logger.info('ScreenMonitor started')
+            last = None
             while not self.stopPolling:
+                self.scheduler.frame_start()
                 # res = self.do_board_scan()
                 try:
                     res = self.do_board_scan()
@@ -214,9 +300,20 @@ class BaseMonitor(ABC):
                     logger.error(f'Error during board scan: {e}')
                     self.send_fatal('Error during board scan. Stop the app now')
                     break
+                changed = False
                 if res is not None:
-                    self.send_board_update_event(res)
-                time.sleep(params['delaySecond'])
+                    last = res
+                    changed, emit = self.track_board(res)
+                    if emit:
+                        self.send_board_update_event(res)
+                self.do_frame_done()
+                # poll fast while the opponent is to move, its move must be seen as soon as possible
+                urgent = last is not None and not last.isMyturn()
+                self.scheduler.sleep(self.scheduler.frame_done(changed, urgent))
+            for c in self.channels:
+                c.close()
+                logger.info(f'Listener {c.stats()}')
+            self.channels = []
             self.pollingStopped.set()
             self.engine_thread = None
             logger.warning('ScreenMonitor stopped')
@@ -227,6 +324,7 @@ class BaseMonitor(ABC):
         if self.engine_thread and self.engine_thread.is_alive():
             logger.info('Stopping monitor thread...')
             self.stopPolling = True
+            self.scheduler.wake()
             self.pollingStopped.wait()
             self.pollingStopped.clear()
             self.stopPolling = False
@@ -0,0 +1,68 @@
+import numpy as np
+import hashlib, logging
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+CELL_CACHE_SIZE = 1024 # max number of cell patches remembered. 0 to disable the cache
+
+try:
+    import xxhash # optional, faster than blake2b
+    def patch_hash(patch: np.ndarray):
+        return xxhash.xxh3_64_intdigest(np.ascontiguousarray(patch))
+except ImportError:
+    def patch_hash(patch: np.ndarray):
+        return hashlib.blake2b(np.ascontiguousarray(patch), digest_size=8).digest()
+
+# Bounded LRU of cell patch hash -> (symbol, confidence)
+# A piece that did not move is pixel-identical from frame to frame, so its patch is only classified once.
+# The entries are only valid for the patterns, thresholds and scan mode they were computed with, the
+# thresholds can be changed at any time (i.e. ZigaBench): the cache is cleared when the signature changes
+class CellCache:
+    def __init__(self, size=CELL_CACHE_SIZE) -> None:
+        self.size = size
+        self.entries: OrderedDict = OrderedDict()
+        self.signature = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # signature: anything that identify the patterns and settings the entries were computed with
+    def validate(self, signature):
+        if signature != self.signature:
+            if self.entries:
+                self.invalidations += 1
+                logger.debug(f'Cell cache invalidated, drop {len(self.entries)} entries')
+            self.entries.clear()
+            self.signature = signature
+
+    def key(self, patch: np.ndarray):
+        return patch_hash(patch)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, symbol, confidence):
+        self.entries[key] = (symbol, confidence)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    @property
+    def hitRate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,67 @@
+import logging, threading
+from collections import deque
+from timeit import default_timer as timer
+
+logger = logging.getLogger()
+
+DELIVERY_STATS_WINDOW = 100 # deliveries of the latency statistics
+
+# Deliver the board updates to one listener on its own thread, so a slow listener (i.e. a Selenium
+# execute_script, a webview calljs) never stall the next capture of the polling thread.
+# The queue is a single slot, latest wins: when the listener is still busy with a board, the
+# newer ones replace each other in the slot and only the last one is delivered (coalesced)
+class ListenerChannel:
+    def __init__(self, listener, name='') -> None:
+        self.listener = listener
+        self.cond = threading.Condition()
+        self.pending = None # (result, publish time)
+        self.closed = False
+        self.published = 0
+        self.delivered = 0
+        self.coalesced = 0 # results replaced in the slot before the listener got them
+        self.latency = deque(maxlen=DELIVERY_STATS_WINDOW) # seconds from publish to the listener done
+        self.maxLatency = 0.0
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name=f'listener-{name or type(listener).__name__}')
+        self.thread.start()
+
+    def publish(self, result):
+        with self.cond:
+            if self.pending is not None:
+                self.coalesced += 1
+            self.pending = (result, timer())
+            self.published += 1
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending is not None or self.closed)
+                if self.pending is None:
+                    return
+                result, published = self.pending
+                self.pending = None
+            try:
+                self.listener.on_board_updated(result)
+            except Exception as e:
+                logger.error(f'Listener {type(self.listener).__name__} failed on board update: {e}')
+            latency = timer() - published
+            self.latency.append(latency)
+            self.maxLatency = max(self.maxLatency, latency)
+            self.delivered += 1
+
+    # the result already in the slot is still delivered
+    def close(self, timeout=1.0):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    @property
+    def avgLatency(self):
+        return sum(self.latency) / len(self.latency) if self.latency else 0.0
+
+    def stats(self):
+        return (f'{type(self.listener).__name__}: {self.delivered}/{self.published} delivered, '
+                f'{self.coalesced} coalesced, latency {self.avgLatency*1000:.1f}ms avg {self.maxLatency*1000:.1f}ms max')
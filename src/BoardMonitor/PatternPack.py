@@ -0,0 +1,178 @@
+import numpy as np
+import cv2, glob, hashlib, json, logging, os, sys, threading
+from timeit import default_timer as timer
+
+from typing import Dict
+
+logger = logging.getLogger()
+
+PACK_NAME = 'pack' # the pack is pack.npy (all the pixels) + pack.json (the index), in the pattern directory
+PACK_VERSION = 1
+MASK_LEVEL = 10 # masked patterns: the pixels <= this are outside the mask
+MASKED_PATTERNS = ('border', 'lastMove') # patterns that also have a mask in the pack
+
+# read one pattern image, scaled as the monitor use it
+def read_pattern(path, name, scale):
+    img = cv2.imread(f'{path}/{name}.png', 0)
+    if img is None:
+        raise FileNotFoundError(f'Pattern {path}/{name}.png not found')
+    return cv2.resize(img, (0,0), fx=scale, fy=scale)
+
+def pattern_mask(gray):
+    _, mask = cv2.threshold(gray, MASK_LEVEL, 255, cv2.THRESH_BINARY)
+    return mask
+
+# [name, size, mtime] of every PNG of the pattern directory, only stat: the quick staleness check
+def source_stats(path):
+    stats = []
+    for fname in sorted(glob.glob(f'{path}/*.png')):
+        st = os.stat(fname)
+        stats.append([os.path.basename(fname), st.st_size, st.st_mtime_ns])
+    return stats
+
+# digest of every PNG of the pattern directory, a pack compiled from other files is stale.
+# Only computed when the file stats differ from the pack index (i.e. the files were copied or touched)
+def source_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    for fname in sorted(glob.glob(f'{path}/*.png')):
+        digest.update(os.path.basename(fname).encode())
+        with open(fname, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+# All the pattern images of a directory, already scaled, with the masks of MASKED_PATTERNS.
+# Compiled into one file that is memory mapped: loading it is one np.load, without decoding or resizing
+# any PNG, and the pixels are only read from the disk when a template is first used.
+# The images are read-only views, shared by every monitor using the same directory
+class PatternPack:
+    def __init__(self, path, scale, images: Dict[str, np.ndarray], digest=None, sources=None) -> None:
+        self.path = path
+        self.scale = scale
+        self.images = images # name -> gray, name.mask -> mask
+        self.digest = digest
+        self.sources = sources # source_stats of the PNG files it was compiled from
+
+    def gray(self, name):
+        return self.images[name]
+
+    def mask(self, name):
+        return self.images[f'{name}.mask']
+
+    # [W,H], as get_imgsize
+    def size(self, name):
+        return np.array(self.images[name].shape[::-1])
+
+    def __contains__(self, name):
+        return name in self.images
+
+    # decode and scale the PNG files
+    @classmethod
+    def from_images(cls, path, scale):
+        sources = source_stats(path) # before reading: a file changed meanwhile make the pack stale
+        images = {}
+        for fname in sorted(glob.glob(f'{path}/*.png')):
+            name = os.path.splitext(os.path.basename(fname))[0]
+            images[name] = read_pattern(path, name, scale)
+            if name in MASKED_PATTERNS:
+                images[f'{name}.mask'] = pattern_mask(images[name])
+        return cls(path, scale, images, source_digest(path), sources)
+
+    # map the compiled pack, None if there is none or it does not match the PNG files anymore.
+    # The PNG files are only stat, they are read and hashed when their stats changed since the pack.
+    # Not checked at all in a PyInstaller bundle: it is extracted again at each start (new mtimes), and
+    # its files are the ones the pack was built from
+    @classmethod
+    def from_pack(cls, path, scale):
+        indexFile, dataFile = f'{path}/{PACK_NAME}.json', f'{path}/{PACK_NAME}.npy'
+        if not (os.path.exists(indexFile) and os.path.exists(dataFile)):
+            return None
+        try:
+            with open(indexFile) as f:
+                index = json.load(f)
+            if index.get('version') != PACK_VERSION or index.get('scale') != scale:
+                return None
+            sources = index.get('sources') if getattr(sys, 'frozen', False) else source_stats(path)
+            touched = index.get('sources') != sources
+            if touched and index.get('digest') != source_digest(path):
+                logger.info(f'Pattern pack {dataFile} is older than the PNG files')
+                return None
+            data = np.load(dataFile, mmap_mode='r')
+            images = {}
+            for name, (offset, h, w) in index['images'].items():
+                images[name] = np.asarray(data[offset:offset+h*w]).reshape(h, w)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f'Cannot load the pattern pack {dataFile}: {e}')
+            return None
+        pack = cls(path, scale, images, index['digest'], sources)
+        if touched:
+            # same content, new stats: record them so the next start skip the digest again
+            try:
+                pack.save_index(index['images'])
+            except OSError as e:
+                logger.debug(f'Cannot update the pattern pack index {indexFile}: {e}')
+        return pack
+
+    def save_index(self, offsets, tmp=None):
+        name = tmp or f'{self.path}/{PACK_NAME}.tmp{os.getpid()}'
+        with open(f'{name}.json', 'w') as f:
+            json.dump({'version': PACK_VERSION, 'scale': self.scale, 'digest': self.digest, 'sources': self.sources,
+                       'images': offsets}, f)
+        if tmp is None:
+            os.replace(f'{name}.json', f'{self.path}/{PACK_NAME}.json')
+
+    def save(self):
+        offsets, offset = {}, 0
+        for name, img in self.images.items():
+            offsets[name] = [offset, *img.shape]
+            offset += img.size
+        data = np.concatenate([img.ravel() for img in self.images.values()])
+        # write aside, then rename: a monitor starting meanwhile never map a partial pack
+        tmp = f'{self.path}/{PACK_NAME}.tmp{os.getpid()}'
+        np.save(f'{tmp}.npy', data)
+        self.save_index(offsets, tmp)
+        os.replace(f'{tmp}.npy', f'{self.path}/{PACK_NAME}.npy')
+        os.replace(f'{tmp}.json', f'{self.path}/{PACK_NAME}.json')
+
+
+# (abspath, scale) -> PatternPack, loaded once per process
+packs: Dict[tuple, PatternPack] = {}
+packsLock = threading.Lock()
+
+# The pack of a pattern directory. Without a valid compiled pack, the PNG files are decoded and the pack
+# is compiled for the next start. Read-only pattern directory (i.e. PyInstaller bundle) just load the PNG
+def load_pack(path, scale=1) -> PatternPack:
+    key = (os.path.abspath(path), scale)
+    with packsLock:
+        pack = packs.get(key)
+        if pack is None:
+            start = timer()
+            pack = PatternPack.from_pack(path, scale)
+            if pack is None:
+                pack = PatternPack.from_images(path, scale)
+                try:
+                    pack.save()
+                    logger.info(f'Pattern pack compiled in {path}')
+                except OSError as e:
+                    logger.info(f'Cannot write the pattern pack in {path}: {e}')
+            logger.debug(f'Patterns {path} loaded in {(timer() - start)*1000:.1f}ms')
+            packs[key] = pack
+        return pack
+
+# compile again, i.e. after the PNG files were changed in the same process
+def compile_pack(path, scale=1) -> PatternPack:
+    pack = PatternPack.from_images(path, scale)
+    pack.save()
+    with packsLock:
+        packs[(os.path.abspath(path), scale)] = pack
+    return pack
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Compile pattern directories into pattern packs')
+    parser.add_argument('paths', nargs='+', help='pattern directories, i.e. patterns/Ziga')
+    parser.add_argument('-s', '--scale', type=float, default=1, help='PATTERN_SCALE of the monitor')
+    args = parser.parse_args()
+    for path in args.paths:
+        pack = compile_pack(path, args.scale)
+        print(f'{path}: {len(pack.images)} images, {sum(img.size for img in pack.images.values())} bytes')
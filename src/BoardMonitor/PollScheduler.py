@@ -0,0 +1,88 @@
+import logging, threading
+from collections import deque
+from timeit import default_timer as timer
+
+logger = logging.getLogger()
+
+POLL_MIN_INTERVAL = 0.1 # target period (s) right after a change and while the opponent is to move
+POLL_MAX_INTERVAL = 0.5 # longest period, reached after enough identical frames
+POLL_BACKOFF = 1.5 # the period is multiplied by this on each identical frame
+POLL_FAST_FRAMES = 5 # frames kept at the min period after a change, the board may still be animating
+POLL_STATS_WINDOW = 50 # frames of the effective rate and wait statistics
+
+# Pace the polling loop of BaseMonitor.
+# The period is a target interval from the start of one scan to the start of the next one, so the
+# scan time is taken out of the wait. It is the shortest right after the board changed or while
+# the opponent is to move (its move must be seen fast), and backs off exponentially while
+# the frames are identical, i.e. during our own long think
+class PollScheduler:
+    def __init__(self, minInterval=POLL_MIN_INTERVAL, maxInterval=POLL_MAX_INTERVAL, backoff=POLL_BACKOFF,
+                 fastFrames=POLL_FAST_FRAMES) -> None:
+        self.minInterval = minInterval
+        self.maxInterval = max(maxInterval, minInterval)
+        self.backoff = backoff
+        self.fastFrames = fastFrames
+        self.interval = minInterval
+        self.fastLeft = fastFrames
+        self.frameStart = None
+        self.lastScan = 0.0 # seconds of the last frame spent scanning
+        self.lastWait = 0.0 # seconds of the last frame spent waiting
+        self.frames = 0
+        self.stats = deque(maxlen=POLL_STATS_WINDOW) # (scan, wait) of the last frames
+        self.wakeup = threading.Event()
+
+    # the monitor params: 'pollMinInterval' (or the older 'delaySecond'), 'pollMaxInterval', 'pollBackoff'
+    @classmethod
+    def from_params(cls, params):
+        return cls(params.get('pollMinInterval', params.get('delaySecond', POLL_MIN_INTERVAL)),
+                   params.get('pollMaxInterval', POLL_MAX_INTERVAL),
+                   params.get('pollBackoff', POLL_BACKOFF),
+                   params.get('pollFastFrames', POLL_FAST_FRAMES))
+
+    def frame_start(self):
+        self.frameStart = timer()
+
+    # changed: the board is not the same as the previous frame
+    # urgent: poll fast anyway, i.e. the opponent is to move
+    # Return the seconds to wait before the next frame
+    def frame_done(self, changed, urgent=False):
+        self.lastScan = timer() - self.frameStart
+        if changed:
+            self.fastLeft = self.fastFrames
+        if changed or urgent or self.fastLeft > 0:
+            self.fastLeft = max(self.fastLeft - 1, 0)
+            self.interval = self.minInterval
+        else:
+            self.interval = min(self.interval * self.backoff, self.maxInterval)
+        return max(self.interval - self.lastScan, 0.0)
+
+    # wait until the next frame, or until wake() is called
+    def sleep(self, seconds):
+        start = timer()
+        if seconds > 0 and self.wakeup.wait(seconds):
+            self.wakeup.clear()
+        self.lastWait = timer() - start
+        self.frames += 1
+        self.stats.append((self.lastScan, self.lastWait))
+        if self.frames % POLL_STATS_WINDOW == 0:
+            logger.debug(f'Polling {self.effectiveHz:.1f}Hz, scan {self.avgScan*1000:.1f}ms, '
+                         f'wait {self.avgWait*1000:.1f}ms, period {self.interval*1000:.0f}ms')
+
+    # something happened (i.e. stop, a page event): cut the current wait short and poll fast again
+    def wake(self):
+        self.fastLeft = self.fastFrames
+        self.interval = self.minInterval
+        self.wakeup.set()
+
+    @property
+    def effectiveHz(self):
+        total = sum(scan + wait for scan, wait in self.stats)
+        return len(self.stats) / total if total > 0 else 0.0
+
+    @property
+    def avgScan(self):
+        return sum(scan for scan, _ in self.stats) / len(self.stats) if self.stats else 0.0
+
+    @property
+    def avgWait(self):
+        return sum(wait for _, wait in self.stats) / len(self.stats) if self.stats else 0.0
@@ -0,0 +1,294 @@
+import numpy as np
+import cv2, ctypes, ctypes.util, glob, os, logging, threading
+from abc import ABC, abstractmethod
+from timeit import default_timer as timer
+
+from typing import Dict, List, Type
+
+logger = logging.getLogger()
+
+FRAME_POOL_SIZE = 2
+
+# Region is the same as PIL bbox: (left, top, right, bottom), None for the whole screen
+
+# A fixed set of grayscale frame buffers, reused from frame to frame instead of allocating new ones.
+# All buffers have the size of the scan region, they are re-allocated only when it changes
+class FrameBufferPool:
+    def __init__(self, count=FRAME_POOL_SIZE) -> None:
+        self.count = count
+        self.shape = None
+        self.free: List[np.ndarray] = []
+        self.lock = threading.Lock()
+        self.misses = 0 # number of times the pool was empty and a buffer had to be allocated
+
+    def acquire(self, shape) -> np.ndarray:
+        shape = tuple(shape)
+        with self.lock:
+            if shape != self.shape:
+                self.shape = shape
+                self.free = [np.empty(shape, dtype=np.uint8) for _ in range(self.count)]
+            if self.free:
+                return self.free.pop()
+            self.misses += 1
+        logger.debug(f'Frame pool empty, allocate {shape}')
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, buf: np.ndarray):
+        with self.lock:
+            if buf.shape == self.shape and len(self.free) < self.count:
+                self.free.append(buf)
+
+def alloc_frame(pool: FrameBufferPool, shape):
+    return None if pool is None else pool.acquire(shape)
+
+class CaptureBackend(ABC):
+    name = ''
+
+    def __init__(self, params=None) -> None:
+        self.lastLatency = 0.0 # second
+        self.totalLatency = 0.0
+        self.frames = 0
+
+    # return the grayscale image of the region, written into a buffer from the pool if given
+    @abstractmethod
+    def do_grab(self, region, pool: FrameBufferPool = None) -> np.ndarray:
+        pass
+
+    def grab(self, region=None, pool: FrameBufferPool = None) -> np.ndarray:
+        start = timer()
+        img = self.do_grab(region, pool)
+        self.lastLatency = timer() - start
+        self.totalLatency += self.lastLatency
+        self.frames += 1
+        logger.debug(f'[{self.name}] capture {self.lastLatency*1000:.2f}ms')
+        return img
+
+    @property
+    def avgLatency(self):
+        return self.totalLatency / self.frames if self.frames else 0.0
+
+    def close(self):
+        pass
+
+
+# The original way: grab the whole screen, and crop the region from it
+class FullScreenCapture(CaptureBackend):
+    name = 'fullscreen'
+
+    def do_grab(self, region, pool=None):
+        from PIL import ImageGrab
+        img = np.asarray(ImageGrab.grab())
+        if region is not None:
+            img = img[ region[1]:region[3] , region[0]:region[2] ]
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=alloc_frame(pool, img.shape[:2]))
+
+
+# Only grab the last scan region, once the board is found
+class RegionCapture(CaptureBackend):
+    name = 'region'
+
+    def do_grab(self, region, pool=None):
+        from PIL import ImageGrab
+        img = np.asarray(ImageGrab.grab(bbox=region))
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=alloc_frame(pool, img.shape[:2]))
+
+
+#==============================================================
+# X11: XShmGetImage (MIT-SHM) into a shared memory segment, or XGetSubImage into our own
+# buffer when the extension is not there. The BGRA buffer is allocated once per region size
+
+ZPixmap = 2
+AllPlanes = ctypes.c_ulong(-1)
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+class XImage(ctypes.Structure):
+    # only the head of the struct, that's all we need
+    _fields_ = [('width', ctypes.c_int), ('height', ctypes.c_int), ('xoffset', ctypes.c_int),
+                ('format', ctypes.c_int), ('data', ctypes.c_void_p), ('byte_order', ctypes.c_int),
+                ('bitmap_unit', ctypes.c_int), ('bitmap_bit_order', ctypes.c_int), ('bitmap_pad', ctypes.c_int),
+                ('depth', ctypes.c_int), ('bytes_per_line', ctypes.c_int), ('bits_per_pixel', ctypes.c_int)]
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [('shmseg', ctypes.c_ulong), ('shmid', ctypes.c_int),
+                ('shmaddr', ctypes.c_void_p), ('readOnly', ctypes.c_int)]
+
+class X11Capture(CaptureBackend):
+    name = 'x11'
+
+    def __init__(self, params=None) -> None:
+        super().__init__(params)
+        params = params or {}
+        x11 = ctypes.util.find_library('X11')
+        if x11 is None:
+            raise RuntimeError('libX11 not found, X11 capture is not available')
+        self.xlib = ctypes.cdll.LoadLibrary(x11)
+        self.xlib.XOpenDisplay.restype = ctypes.c_void_p
+        self.xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self.xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        self.xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        self.xlib.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        self.xlib.XDefaultVisual.restype = ctypes.c_void_p
+        self.xlib.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self.xlib.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self.xlib.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self.xlib.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self.xlib.XCreateImage.restype = ctypes.POINTER(XImage)
+        self.xlib.XCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_int,
+                                           ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint, ctypes.c_int, ctypes.c_int]
+        self.xlib.XGetSubImage.restype = ctypes.POINTER(XImage)
+        self.xlib.XGetSubImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int, ctypes.c_int, ctypes.c_uint,
+                                           ctypes.c_uint, ctypes.c_ulong, ctypes.c_int, ctypes.POINTER(XImage),
+                                           ctypes.c_int, ctypes.c_int]
+        self.xlib.XFree.argtypes = [ctypes.c_void_p]
+        self.xlib.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self.xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+
+        self.display = self.xlib.XOpenDisplay(params.get('xdisplay', '').encode() or None)
+        if not self.display:
+            raise RuntimeError('Cannot open X display')
+        screen = self.xlib.XDefaultScreen(self.display)
+        self.root = self.xlib.XDefaultRootWindow(self.display)
+        self.visual = self.xlib.XDefaultVisual(self.display, screen)
+        self.depth = self.xlib.XDefaultDepth(self.display, screen)
+        self.screenSize = (self.xlib.XDisplayWidth(self.display, screen), self.xlib.XDisplayHeight(self.display, screen))
+
+        self.xext = None
+        xext = ctypes.util.find_library('Xext')
+        if xext is not None and params.get('xshm', True):
+            self.xext = ctypes.cdll.LoadLibrary(xext)
+            self.xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+            if not self.xext.XShmQueryExtension(self.display):
+                self.xext = None
+        if self.xext is not None:
+            self.xext.XShmCreateImage.restype = ctypes.POINTER(XImage)
+            self.xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                                                  ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo),
+                                                  ctypes.c_uint, ctypes.c_uint]
+            self.xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+            self.xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+            self.xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(XImage),
+                                               ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+            self.libc = ctypes.CDLL(None, use_errno=True)
+            self.libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+            self.libc.shmat.restype = ctypes.c_void_p
+            self.libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+            self.libc.shmdt.argtypes = [ctypes.c_void_p]
+            self.libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+        logger.info(f'X11 capture {self.screenSize} MIT-SHM={self.xext is not None}')
+
+        self.ximage = None
+        self.shminfo = None
+        self.bufSize = None
+        self.buffer = None # [H, W, 4] BGRA, shared with the XImage
+
+    def alloc(self, W, H):
+        self.release()
+        if self.xext is not None:
+            self.shminfo = XShmSegmentInfo()
+            self.ximage = self.xext.XShmCreateImage(self.display, self.visual, self.depth, ZPixmap, None,
+                                                    ctypes.byref(self.shminfo), W, H)
+            size = self.ximage.contents.bytes_per_line * H
+            self.shminfo.shmid = self.libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+            if self.shminfo.shmid < 0:
+                raise OSError(ctypes.get_errno(), 'shmget failed')
+            self.shminfo.shmaddr = self.libc.shmat(self.shminfo.shmid, None, 0)
+            if self.shminfo.shmaddr in (None, ctypes.c_void_p(-1).value):
+                raise OSError(ctypes.get_errno(), 'shmat failed')
+            self.shminfo.readOnly = 0
+            self.ximage.contents.data = self.shminfo.shmaddr
+            self.xext.XShmAttach(self.display, ctypes.byref(self.shminfo))
+            self.xlib.XSync(self.display, 0)
+            # the segment is freed when both sides detach
+            self.libc.shmctl(self.shminfo.shmid, IPC_RMID, None)
+            raw = (ctypes.c_uint8 * size).from_address(self.shminfo.shmaddr)
+        else:
+            raw = np.empty(W*H*4, dtype=np.uint8)
+            self.ximage = self.xlib.XCreateImage(self.display, self.visual, self.depth, ZPixmap, 0,
+                                                 raw.ctypes.data, W, H, 32, W*4)
+        stride = self.ximage.contents.bytes_per_line
+        self.buffer = np.ndarray((H, W, 4), dtype=np.uint8, buffer=raw, strides=(stride, 4, 1))
+        self.bufSize = (W, H)
+
+    def release(self):
+        if self.ximage is None:
+            return
+        if self.shminfo is not None:
+            self.xext.XShmDetach(self.display, ctypes.byref(self.shminfo))
+            self.libc.shmdt(self.shminfo.shmaddr)
+            self.shminfo = None
+        self.ximage.contents.data = None # the data is not owned by Xlib
+        self.xlib.XFree(self.ximage)
+        self.ximage = None
+        self.buffer = None
+        self.bufSize = None
+
+    def do_grab(self, region, pool=None):
+        x, y, right, bottom = (0, 0, *self.screenSize) if region is None else region
+        # out of screen request is a fatal X error, not an exception
+        x, y = max(int(x), 0), max(int(y), 0)
+        right, bottom = min(int(right), self.screenSize[0]), min(int(bottom), self.screenSize[1])
+        W, H = int(right - x), int(bottom - y)
+        if self.bufSize != (W, H):
+            self.alloc(W, H)
+        if self.shminfo is not None:
+            self.xext.XShmGetImage(self.display, self.root, self.ximage, x, y, AllPlanes)
+        else:
+            self.xlib.XGetSubImage(self.display, self.root, x, y, W, H, AllPlanes, ZPixmap,
+                                   self.ximage, 0, 0)
+        return cv2.cvtColor(self.buffer, cv2.COLOR_BGRA2GRAY, dst=alloc_frame(pool, (H, W)))
+
+    def close(self):
+        self.release()
+        if self.display:
+            self.xlib.XCloseDisplay(self.display)
+            self.display = None
+
+
+#==============================================================
+# Replay saved screenshots, for tests and benchmarks. replayPath is a file, a directory or a glob
+class ReplayCapture(CaptureBackend):
+    name = 'replay'
+
+    def __init__(self, params=None) -> None:
+        super().__init__(params)
+        params = params or {}
+        path = params['replayPath']
+        if os.path.isdir(path):
+            path = os.path.join(path, '*.png')
+        self.files = sorted(glob.glob(path))
+        if not self.files:
+            raise RuntimeError(f'No screenshot to replay in "{params["replayPath"]}"')
+        self.loop = params.get('replayLoop', True)
+        self.cache = {}
+        self.index = 0
+
+    def do_grab(self, region, pool=None):
+        if self.index >= len(self.files):
+            if not self.loop:
+                raise EOFError('Replay finished')
+            self.index = 0
+        fname = self.files[self.index]
+        self.index += 1
+        try:
+            img = self.cache[fname]
+        except KeyError:
+            img = self.cache[fname] = cv2.imread(fname, 0)
+        if region is not None:
+            img = img[ region[1]:region[3] , region[0]:region[2] ]
+        if pool is None:
+            return img.copy()
+        buf = pool.acquire(img.shape)
+        np.copyto(buf, img)
+        return buf
+
+
+CAPTURE_BACKENDS: Dict[str, Type[CaptureBackend]] = {
+    cls.name: cls for cls in [FullScreenCapture, RegionCapture, X11Capture, ReplayCapture]
+}
+
+def create_capture(name, params=None) -> CaptureBackend:
+    if name not in CAPTURE_BACKENDS:
+        raise ValueError(f'Unknown capture backend "{name}", available {list(CAPTURE_BACKENDS)}')
+    return CAPTURE_BACKENDS[name](params)
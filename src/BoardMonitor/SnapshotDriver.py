@@ -0,0 +1,133 @@
+import glob, os
+import xml.etree.ElementTree as ET
+from urllib.parse import quote
+
+from typing import List, Tuple
+
+from .XqchessMonitor import COMPACT_BOARD_JS, OBSERVER_INSTALL_JS, OBSERVER_DRAIN_JS, OBSERVER_WAIT_JS, \
+    serialize_nodes, tree_nodes
+
+SNAPSHOT_EXT = ('.html', '.htm', '.xml')
+
+class SnapshotElement:
+    def __init__(self, html) -> None:
+        self.html = html
+
+    def get_attribute(self, name):
+        if name != 'innerHTML':
+            raise ValueError(f'Snapshot element only has innerHTML, not {name}')
+        return self.html
+
+# Stand-in for the selenium WebDriver of XqchessMonitor, replaying saved board snapshots: the innerHTML
+# of .xq-board-wrap. Every call that read the board is one frame and move to the next snapshot.
+# The in-page scripts of XqchessMonitor are not run: their results are computed in Python, the compact
+# string by serialize_nodes and for the observer the nodes that differ from the previous frame. The
+# snapshots are parsed once up front, so the replay time is the monitor's own. BrowserSnapshotDriver
+# run the real scripts
+class SnapshotDriver:
+    def __init__(self, snapshots: List[Tuple[str, str]], loop=False) -> None:
+        self.snapshots = snapshots # [(name, html)]
+        self.nodes = [[list(n) for n in tree_nodes(ET.fromstring(html))] for _, html in snapshots]
+        self.compact = [serialize_nodes(nodes) for nodes in self.nodes]
+        self.loop = loop
+        self.index = 0
+        self.current = None # name of the snapshot of the last frame
+        self.observed = None # nodes the page observer last reported
+        self.calls = 0
+
+    # a file, a directory or a glob pattern
+    @classmethod
+    def from_path(cls, path, loop=False):
+        if os.path.isdir(path):
+            path = os.path.join(path, '*')
+        snapshots = []
+        for fname in sorted(glob.glob(path)):
+            if fname.lower().endswith(SNAPSHOT_EXT):
+                with open(fname, encoding='utf-8') as f:
+                    snapshots.append((os.path.basename(fname), f.read()))
+        if not snapshots:
+            raise RuntimeError(f'No snapshot to replay in "{path}"')
+        return cls(snapshots, loop)
+
+    def next_frame(self):
+        self.calls += 1
+        if self.index >= len(self.snapshots):
+            if not self.loop:
+                raise EOFError('Replay finished')
+            self.index = 0
+        i = self.index
+        self.index += 1
+        self.current = self.snapshots[i][0]
+        return i
+
+    def find_element(self, by, value):
+        return SnapshotElement(self.snapshots[self.next_frame()][1])
+
+    def execute_script(self, script, *args):
+        if script == COMPACT_BOARD_JS:
+            return self.compact[self.next_frame()]
+        if script == OBSERVER_INSTALL_JS:
+            self.observed = self.nodes[self.next_frame()]
+            return self.observed
+        if script == OBSERVER_DRAIN_JS:
+            return self.drain()
+        raise ValueError('Script not supported by the snapshot driver')
+
+    def execute_async_script(self, script, *args):
+        if script == OBSERVER_WAIT_JS:
+            return self.drain()
+        raise ValueError('Script not supported by the snapshot driver')
+
+    def drain(self):
+        if self.observed is None:
+            return None
+        nodes = self.nodes[self.next_frame()]
+        if len(nodes) != len(self.observed):
+            changes = {'full': True, 'nodes': nodes}
+        else:
+            changes = {'full': False, 'nodes': [n for n, old in zip(nodes, self.observed) if n != old]}
+        self.observed = nodes
+        return changes
+
+
+SNAPSHOT_PAGE = '<html><body><div class="xq-board-wrap"></div></body></html>'
+
+# Show a snapshot in the page board. The nodes are updated in place, only the changed classes and pieces
+# are written as when the site play a move, so the page observer see the same mutations. A snapshot
+# with other nodes replace the whole board
+SHOW_SNAPSHOT_JS = '''
+var wrap = document.querySelector('.xq-board-wrap');
+var next = document.createElement('div');
+next.innerHTML = arguments[0];
+var want = next.querySelectorAll('.xq-node'), have = wrap.querySelectorAll('.xq-node');
+if (want.length !== have.length) { wrap.innerHTML = arguments[0]; return; }
+want.forEach(function(n, i) {
+    if (have[i].getAttribute('class') !== n.getAttribute('class')) have[i].setAttribute('class', n.getAttribute('class'));
+    if (have[i].innerHTML !== n.innerHTML) have[i].innerHTML = n.innerHTML;
+});
+'''
+
+# Same replay in a real page: each board read first show the next snapshot in the browser of driver,
+# then the call and the in-page scripts of XqchessMonitor go to the browser unchanged
+class BrowserSnapshotDriver(SnapshotDriver):
+    def __init__(self, driver, snapshots: List[Tuple[str, str]], loop=False) -> None:
+        super().__init__(snapshots, loop)
+        self.driver = driver
+        self.driver.get('data:text/html;charset=utf-8,' + quote(SNAPSHOT_PAGE))
+
+    def show_next_frame(self):
+        self.driver.execute_script(SHOW_SNAPSHOT_JS, self.snapshots[self.next_frame()][1])
+
+    def find_element(self, by, value):
+        self.show_next_frame()
+        return self.driver.find_element(by, value)
+
+    def execute_script(self, script, *args):
+        if script in (COMPACT_BOARD_JS, OBSERVER_INSTALL_JS, OBSERVER_DRAIN_JS):
+            self.show_next_frame()
+        return self.driver.execute_script(script, *args)
+
+    def execute_async_script(self, script, *args):
+        if script == OBSERVER_WAIT_JS:
+            self.show_next_frame()
+        return self.driver.execute_async_script(script, *args)
@@ -1,4 +1,3 @@
-
 import xml.etree.ElementTree as ET
 from selenium.webdriver.common.by import By
 from selenium.webdriver.remote.webdriver import WebDriver
@@ -15,51 +14,200 @@ NameMap = {
     'pawn': 'P',
 }
 
+SCAN_MODE = 'scrape' # 'scrape': parse the whole board each frame, 'compact': the board serialized in the page,
+                       # 'observer': drain the changes of the in-page observer,
+                       # 'observer-wait': same but block until a change (or OBSERVER_WAIT)
+OBSERVER_WAIT = 1.0 # seconds 'observer-wait' block in the page when nothing change
+COMPACT_CODES = set('.' + ''.join(NameMap.values()) + ''.join(NameMap.values()).lower()) # '?' is a piece COMPACT_BOARD_JS does not know
+
+# Install a MutationObserver on the board. It remember the xq-node elements whose class (or their piece)
+# changed since the last drain, a node changed several times is only sent once.
+# Return the [class, piece class] of all the nodes, the base state the changes apply to
+OBSERVER_INSTALL_JS = '''
+var wrap = document.querySelector('.xq-board-wrap');
+if (!wrap) return null;
+if (window.xqBoardObserver) window.xqBoardObserver.observer.disconnect();
+var cls = function(e) { return e ? (e.getAttribute('class') || '') : ''; };
+var state = {target: wrap, changed: new Set(), full: false, waiter: null};
+state.nodes = function(nodes) { return Array.from(nodes, function(n) { return [cls(n), cls(n.firstElementChild)]; }); };
+state.all = function() { return wrap.querySelectorAll('.xq-node'); };
+state.take = function() {
+    var res = state.full ? {full: true, nodes: state.nodes(state.all())} : {full: false, nodes: state.nodes(state.changed)};
+    state.full = false;
+    state.changed.clear();
+    return res;
+};
+state.observer = new MutationObserver(function(records) {
+    records.forEach(function(r) {
+        var e = r.target.nodeType === 1 ? r.target : r.target.parentElement;
+        var node = e && e.closest('.xq-node');
+        if (node && wrap.contains(node)) state.changed.add(node);
+        else if (r.type === 'childList') state.full = true; // nodes added or removed: send them all
+    });
+    if (state.waiter && (state.full || state.changed.size)) state.waiter();
+});
+state.observer.observe(wrap, {subtree: true, childList: true, attributes: true, attributeFilter: ['class']});
+window.xqBoardObserver = state;
+return state.nodes(state.all());
+'''
+
+# The changes since the last drain {full, nodes}, null when the observer is gone (page reloaded, board replaced)
+OBSERVER_DRAIN_JS = '''
+var state = window.xqBoardObserver;
+if (!state || !document.contains(state.target)) return null;
+return state.take();
+'''
+
+# Same, but wait in the page for the next change, at most arguments[0] ms
+OBSERVER_WAIT_JS = '''
+var done = arguments[arguments.length - 1];
+var state = window.xqBoardObserver;
+if (!state || !document.contains(state.target)) return done(null);
+if (state.full || state.changed.size) return done(state.take());
+var timer = setTimeout(function() { state.waiter = null; done(state.take()); }, arguments[0]);
+state.waiter = function() { clearTimeout(timer); state.waiter = null; done(state.take()); };
+'''
+
+# Serialize the board in the page: [placement, from, to]
+#   placement: 90 chars, row by row from p00, piece symbol (black lowercase) or '.', '?' for an unknown piece
+#   from, to: 'RC' of the last-move nodes, empty and occupied one ('' if none)
+# About 100 bytes instead of the whole board markup. serialize_nodes is the same in Python
+COMPACT_BOARD_JS = '''
+var wrap = document.querySelector('.xq-board-wrap');
+if (!wrap) return null;
+var names = {chariot: 'R', cannon: 'C', horse: 'N', king: 'K', adviser: 'A', elephant: 'B', pawn: 'P'};
+var classes = function(e) { return e ? (e.getAttribute('class') || '').split(/\\s+/) : []; };
+var board = new Array(90).fill('.'), from = '', to = '';
+wrap.querySelectorAll('.xq-node').forEach(function(n) {
+    var attr = classes(n);
+    var pos = attr.find(function(c) { return c[0] === 'p'; });
+    if (!pos) return;
+    var last = attr.indexOf('last-move') >= 0;
+    if (attr.indexOf('occupied') >= 0) {
+        var piece = classes(n.firstElementChild), sym = '?';
+        for (var name in names) if (piece.indexOf(name) >= 0) { sym = names[name]; break; }
+        board[(+pos[1])*9 + (+pos[2])] = piece.indexOf('black') >= 0 ? sym.toLowerCase() : sym;
+        if (last) to = pos.slice(1, 3);
+    } else if (last) from = pos.slice(1, 3);
+});
+return [board.join(''), from, to];
+'''
+
+def get_position(attr):
+    for cn in attr:
+        if cn[0] == 'p':
+            return [int(cn[1]), int(cn[2])]
+    return [0,0]
+
+def get_piece(cls):
+    a = cls.split()
+    piece = ''
+    for name in NameMap:
+        if name in a:
+            piece = NameMap[name]
+            break
+    if 'black' in a:
+        return (Side.Black, piece.lower())
+    else:
+        return (Side.White, piece)
+
+# (class, piece class) of the xq-node elements of the parsed board markup
+def tree_nodes(tree):
+    return ((node.attrib['class'], node[0].attrib.get('class', '') if len(node) else '') for node in tree)
+
+# what COMPACT_BOARD_JS return, from the (class, piece class) of the nodes
+def serialize_nodes(nodes):
+    board, lastFrom, lastTo = ['.'] * (GRID_WIDTH*GRID_HEIGHT), '', ''
+    for cls, pieceCls in nodes:
+        attr = cls.split()
+        pos = next((cn for cn in attr if cn[0] == 'p'), None)
+        if pos is None:
+            continue
+        last = 'last-move' in attr
+        if 'occupied' in attr:
+            side, piece = get_piece(pieceCls)
+            board[int(pos[1])*GRID_WIDTH + int(pos[2])] = piece or '?'
+            if last:
+                lastTo = pos[1:3]
+        elif last:
+            lastFrom = pos[1:3]
+    return [''.join(board), lastFrom, lastTo]
+
 class XqchessMonitor(BaseMonitor):
     driver = None
+    scanMode = SCAN_MODE
+    nodes: Dict[str, tuple] = {} # observer modes: position class (pXY) -> (node class, piece class)
+    observing = False
+    lastResult: MonitorResult = None
 
     def do_init(self, params):
-        print(f'start here {params}')
+        logger.debug(f'XqchessMonitor params {params}')
         self.driver = params['wdriver']
+        self.scanMode = params.get('scanMode', SCAN_MODE)
+        self.observerWait = params.get('observerWait', OBSERVER_WAIT)
+        self.nodes = {}
+        self.observing = False
+        self.lastResult = None
+        self.scrapes = 0 # full board scrapes
+        self.drains = 0 # observer drains
+        self.installs = 0 # observer (re)installs, one per page load
 
     def do_board_scan(self):
         # return self.html_scrapping()
         try:
-            return self.html_scrapping()
+            if self.scanMode == 'scrape':
+                return self.html_scrapping()
+            if self.scanMode == 'compact':
+                return self.compact_scrapping()
+            return self.observer_scan()
         except Exception as e:
+            self.observing = False
             self.send_fatal('Board Not Found')
             return None
 
     def html_scrapping(self):
-        kingPos = {Side.Black: None, Side.White: None}
+        self.scrapes += 1
         tree = ET.fromstring(
             self.driver.find_element(By.CLASS_NAME, 'xq-board-wrap').get_attribute('innerHTML'))
+        return self.parse_nodes(tree_nodes(tree))
 
-        def get_position(attr):
-            for cn in attr:
-                if cn[0] == 'p':
-                    return [int(cn[1]), int(cn[2])]
-            return [0,0]
-        def get_piece(cls):
-            a = cls.split()
-            piece = ''
-            for name in NameMap:
-                if name in a:
-                    piece = NameMap[name]
-                    break
-            if 'black' in a:
-                return (Side.Black, piece.lower())
-            else:
-                return (Side.White, piece)
+    def compact_scrapping(self):
+        self.scrapes += 1
+        board = self.driver.execute_script(COMPACT_BOARD_JS)
+        if board is None:
+            raise RuntimeError('Board not found')
+        return self.parse_compact(*board)
 
+    # the result of COMPACT_BOARD_JS, same MonitorResult as parse_nodes
+    def parse_compact(self, placement, lastFrom, lastTo):
+        if len(placement) != GRID_WIDTH*GRID_HEIGHT or not COMPACT_CODES.issuperset(placement):
+            raise ValueError(f'Unknown piece in the compact board "{placement}"')
+        result = MonitorResult()
+        result.positions = [list(placement[row*GRID_WIDTH:(row+1)*GRID_WIDTH]) for row in range(GRID_HEIGHT)]
+        if lastTo:
+            row, col = int(lastTo[0]), int(lastTo[1])
+            result.lastMovePosition = [col, row]
+            result.moveSide = Side.Black if placement[row*GRID_WIDTH + col].islower() else Side.White
+        if lastFrom:
+            result.lastMoveFrom = [int(lastFrom[0]), int(lastFrom[1])]
+        black, white = placement.find('k'), placement.find('K')
+        if black < 0 or white < 0:
+            self.send_error(f'KING is not found in both sides')
+        else:
+            result.mySide = Side.White if white // GRID_WIDTH > black // GRID_WIDTH else Side.Black
+        return result
+
+    # nodes: (class, class of the piece inside) of the board xq-node elements
+    def parse_nodes(self, nodes):
+        kingPos = {Side.Black: None, Side.White: None}
         result = MonitorResult()
 
-        for node in tree:
-            attr = node.attrib['class'].split()
+        for cls, pieceCls in nodes:
+            attr = cls.split()
             if 'occupied' in attr:
                 # print(f'check here {attr}')
                 mypos = get_position(attr)
-                side, piece = get_piece(node[0].attrib['class'])
+                side, piece = get_piece(pieceCls)
 
                 if piece in ('K','k'):
                     kingPos[side] = mypos
@@ -68,7 +216,7 @@ class XqchessMonitor(BaseMonitor):
                     result.lastMovePosition = [mypos[1], mypos[0]]
                     result.moveSide = side
                 result.positions[mypos[0]][mypos[1]] = piece
-            
+
             elif 'last-move' in attr:
                 result.lastMoveFrom = get_position(attr)
 
@@ -77,3 +225,39 @@ class XqchessMonitor(BaseMonitor):
         else:
             result.mySide = Side.White if kingPos[Side.White][0] > kingPos[Side.Black][0] else Side.Black
         return result
+
+    # Push mode: the page observer collect the changed nodes, only these cross WebDriver and are parsed.
+    # When the observer is gone (page reload), it is installed again. Until the board is there to observe,
+    # the frames are full scrapes
+    def observer_scan(self):
+        if self.observing:
+            if self.scanMode == 'observer-wait':
+                changes = self.driver.execute_async_script(OBSERVER_WAIT_JS, int(self.observerWait * 1000))
+            else:
+                changes = self.driver.execute_script(OBSERVER_DRAIN_JS)
+            self.drains += 1
+            if changes is not None:
+                if changes['full']:
+                    self.nodes = {}
+                if not changes['nodes'] and self.lastResult is not None:
+                    return self.lastResult.copy()
+                return self.apply_nodes(changes['nodes'])
+            logger.info('Board observer lost, page reloaded')
+            self.observing = False
+
+        nodes = self.driver.execute_script(OBSERVER_INSTALL_JS)
+        if nodes is None:
+            self.lastResult = None
+            return self.html_scrapping()
+        self.installs += 1
+        self.observing = True
+        self.nodes = {}
+        return self.apply_nodes(nodes)
+
+    def apply_nodes(self, nodes):
+        for cls, pieceCls in nodes:
+            pos = next((cn for cn in cls.split() if cn[0] == 'p'), None)
+            if pos is not None:
+                self.nodes[pos] = (cls, pieceCls)
+        self.lastResult = self.parse_nodes(self.nodes.values())
+        return self.lastResult.copy()
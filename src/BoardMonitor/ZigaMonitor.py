@@ -1,17 +1,51 @@
 import numpy as np
-import cv2, threading, sys
+import cv2, json, os, threading, sys
+from concurrent.futures import ThreadPoolExecutor
 from PIL import ImageGrab
-from imutils.object_detection import non_max_suppression
+try:
+    from imutils.object_detection import non_max_suppression
+except ImportError: # only needed by the 'nms' peak backend
+    non_max_suppression = None
 from timeit import default_timer as timer
 
 from typing import Dict, List
 
-from BaseMonitor import *
+from .BaseMonitor import *
+from .ScreenCapture import CaptureBackend, FrameBufferPool, create_capture, FRAME_POOL_SIZE
+from .CellCache import CellCache, CELL_CACHE_SIZE, patch_hash
+from .PatternPack import PatternPack, load_pack, read_pattern, pattern_mask
 
 PATTERN_SCALE = 1 # reduce image size for faster processing
 BORDER_THRESH = 0.8 # if nor scaling, 0.8 is enough. must try to get this right
 PIECE_THRESH = 0.8
 LASTMOVE_THRESH = 0.7
+CELL_SEARCH_MARGIN = 8 # how far (pixel) a piece may be off its intersection in the stacked classifier
+OCCUPANCY_THRESH = 0.45 # cell with piece-outline score below this is empty and skip piece matching. None to disable
+PIXEL_DIFF_THRESH = 16 # incremental scan: pixel that changed more than this is counted as changed
+CELL_DIFF_THRESH = 20 # incremental scan: number of changed pixels for a cell to be re-classified
+MAX_CHANGED_CELLS = 4 # incremental scan: more changed cells than this (i.e. animation) force a full rescan
+FULL_SCAN_EVERY = 50 # incremental scan: force a full rescan after this many frames
+PYRAMID_SCALE = 4 # full screen border search is done on a 1/PYRAMID_SCALE image first. 1 to disable
+PYRAMID_THRESH = 0.3 # border candidate threshold on the downscaled image, candidates are confirmed at full size
+PYRAMID_CANDIDATES = 16 # max number of border candidates (local maxima) refined from the downscaled image
+PYRAMID_MARGIN = 0.2 # only the candidates that score this close to the best one on the downscaled image are refined
+PYRAMID_RADIUS = 3 # search radius (pixel) around the candidate on the first refine level, 2 on the next ones
+FULL_SEARCH_EVERY = 5.0 # seconds between two full size border searches, when the pyramid find no board
+SCAN_WORKERS = 1 # number of threads classifying the cells. matchTemplate and numpy release the GIL
+PEAK_BACKEND = 'minmax' # how find_pattern pick the matches from the correlation map, see PEAK_BACKENDS
+MAX_PEAKS = 32 # 'minmax' peak backend: stop after this many matches
+LOCATE_MODE = 'lattice' # 'lattice' also find the board at another zoom, 'template' only at the pattern size
+LOCATE_MIN_SCALE = 0.5 # range of the board zoom (screen size / pattern size) searched by the lattice
+LOCATE_MAX_SCALE = 2.0
+LOCATE_RETRY_EVERY = 5.0 # seconds between two lattice searches while the board is not found
+LATTICE_LINE_CONTRAST = 40 # grid line pixel: this much darker than its neighbors above and below
+LATTICE_LINE_DENSITY = 0.3 # part of a row that must be line pixels, pieces hide a good part of the lines
+LATTICE_MIN_LINES = 5 # equally spaced horizontal lines needed for a lattice candidate
+LATTICE_CANDIDATES = 3 # lattice candidates confirmed with the border pattern
+SCALE_REFINE_RANGE = 0.012 # the lattice scale is refined +/- this with the border pattern
+SCALE_REFINE_STEP = 0.002
+SCALED_REGION_PAD = 4 # pattern pixels around the board in the region capture when the board is zoomed
+GEOMETRY_FILE = 'geometry.json' # written by ZigaCalibrate in the pattern directory
 
 # PATTERN_PATH = './patterns'
 try:
@@ -21,13 +55,12 @@ except Exception:
     PATTERN_PATH = './patterns/Ziga'
 
 
-def load_gray(fileName):
-    img = cv2.imread(f'{PATTERN_PATH}/{fileName}.png', 0)
-    return cv2.resize(img, (0,0), fx=PATTERN_SCALE, fy=PATTERN_SCALE)
+def load_gray(fileName, path=None):
+    return read_pattern(path or PATTERN_PATH, fileName, PATTERN_SCALE)
 
-def get_imgsize(fileName):
+def get_imgsize(fileName, path=None):
     # ptn = cv2.imread(f'{PATTERN_PATH}/{fileName}.png', 0)
-    img = load_gray(fileName)
+    img = load_gray(fileName, path)
     return np.array(img.shape[::-1])
 
 def showimg(img):
@@ -35,11 +68,27 @@ def showimg(img):
     cv2.waitKey(0)
     cv2.destroyAllWindows()
 
-def load_img_mask(fileName):
+def load_img_mask(fileName, path=None):
     # gray = cv2.imread(f'{PATTERN_PATH}/{fileName}.png', 0)
-    gray = load_gray(fileName)
-    _, mask = cv2.threshold(gray,10,255,cv2.THRESH_BINARY)
-    return gray, mask
+    gray = load_gray(fileName, path)
+    return gray, pattern_mask(gray)
+
+# all the patterns of a directory, decoded once per process. See PatternPack
+def load_patterns(path=None) -> PatternPack:
+    return load_pack(path or PATTERN_PATH, PATTERN_SCALE)
+
+# the thresholds ZigaCalibrate measured with its patterns: {'piece', 'occupancy', 'border'}.
+# Empty for the hand-made patterns
+def load_thresholds(path=None):
+    fname = os.path.join(path or PATTERN_PATH, GEOMETRY_FILE)
+    if not os.path.exists(fname):
+        return {}
+    try:
+        with open(fname) as f:
+            return json.load(f).get('thresholds', {})
+    except (OSError, ValueError, AttributeError) as e:
+        logger.warning(f'Cannot read the thresholds of {fname}: {e}')
+        return {}
 
 def find_circles(gray,
                  param1=1, # 500
@@ -107,26 +156,149 @@ def find_pattern_verbose(fileName, thresh=0.8):
     cv2.destroyAllWindows()
 
 
-def find_pattern(board_gray, piece_gray, thresh=0.5, center=1, display=0, mask=None):
-    W, H = piece_gray.shape[::-1]
-    # Passing the image to matchTemplate method
-    match = cv2.matchTemplate(board_gray, piece_gray, cv2.TM_CCOEFF_NORMED, mask=mask)
-    
-    # reduce the matching overlap
+# Peak extractors: correlation map -> [X,Y] of the upper-left corner of each match
+# The original: every point above thresh is a box, and overlapping boxes are merged by imutils
+def peaks_nms(match, thresh, W, H):
     (y_points, x_points) = np.where(match >= thresh)
     boxes = list()
     for (x, y) in zip(x_points, y_points):
         boxes.append((x, y, x + W, y + H))
     boxes = non_max_suppression(np.array(boxes))
+    return np.array( [ (x[0], x[1]) for x in boxes ] )
+
+def clean_match(match):
+    if np.isfinite(match).all():
+        return match
+    return np.nan_to_num(match, nan=-1, posinf=-1, neginf=-1) # masked match give inf on flat area
+
+# A point is a match if it is above thresh and the max of the half template size around it
+# Sorted by score, the best first
+def peaks_dilate(match, thresh, W, H):
+    match = clean_match(match)
+    if match.max() < thresh: # most of the cell scans
+        return np.empty((0, 2), dtype=int)
+    kernel = np.ones((H//2*2+1, W//2*2+1), dtype=np.uint8)
+    local = (match >= thresh) & (match >= cv2.dilate(match, kernel))
+    ys, xs = np.nonzero(local)
+    order = np.argsort(-match[ys, xs], kind='stable')
+    return np.stack([xs[order], ys[order]], axis=1)
+
+# Take the best point and blank the half template size around it, until nothing is above thresh
+def peaks_minmax(match, thresh, W, H):
+    match = clean_match(match).copy()
+    peaks = []
+    for _ in range(MAX_PEAKS):
+        _, score, _, (x,y) = cv2.minMaxLoc(match)
+        if score < thresh:
+            break
+        peaks.append((x,y))
+        match[max(y-H//2,0):y+H//2+1, max(x-W//2,0):x+W//2+1] = -1
+    return np.array(peaks, dtype=int).reshape(-1, 2)
+
+PEAK_BACKENDS = {'nms': peaks_nms, 'dilate': peaks_dilate, 'minmax': peaks_minmax}
+
+# The horizontal grid lines of a board at any zoom. A grid line is a thin dark line (black-hat with
+# a vertical kernel) that fill enough of the row, and is as long as several cells
+# Return the lines boxes [x, y, w, h, area] and their y
+def find_lines(gray, gridSize, minScale=LOCATE_MIN_SCALE, maxScale=LOCATE_MAX_SCALE):
+    thick = int(np.ceil(4*maxScale)) | 1 # taller than the thickest line
+    blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, np.ones((thick, 1), dtype=np.uint8))
+    _, line = cv2.threshold(blackhat, LATTICE_LINE_CONTRAST, 1, cv2.THRESH_BINARY)
+    window = max(int(2*gridSize[0]*minScale), 3)
+    dense = (cv2.blur(line.astype(np.float32), (window, 1)) >= LATTICE_LINE_DENSITY).astype(np.uint8)
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(dense)
+    long = stats[1:, cv2.CC_STAT_WIDTH] >= 6*gridSize[0]*minScale # a grid line is 8 cells
+    return stats[1:][long], centroids[1:][long, 1]
+
+# Spacing of the grid lines on the play area pattern, and how much (in cells) the river is taller than
+# the other rows. On Ziga the rows are 57 pixels and the river 63: the mean row (play_area height / 9)
+# is 1% off, enough to miss the board at some zooms
+def pattern_lattice(playGray, gridSize):
+    _, ys = find_lines(playGray, gridSize, 1, 1)
+    gaps = np.diff(np.sort(ys))
+    gaps = gaps[(gaps >= 0.8*gridSize[1]) & (gaps <= 1.2*gridSize[1])]
+    if len(gaps) == 0:
+        return gridSize[1], 0.0
+    spacing = np.median(gaps)
+    return spacing, max(gridSize[1]*(GRID_HEIGHT-1) / spacing - (GRID_HEIGHT-1), 0.0)
+
+# Bring a zoomed capture back to the pattern size, sampled so the capture point origin fall on a pixel:
+# the border lines are 1-2 pixels, their match score go from 0.66 to 0.96 with the sampling phase at 1.5.
+# Return the image and the capture [X,Y] of its pixel 0, its pixel p is at shift + p*scale
+def rescale(gray, scale, origin=None):
+    shift = np.zeros(2) if origin is None else origin - np.floor(origin / scale) * scale
+    if scale > 1: # the warp does not average, blur the pixels that fall between the samples
+        gray = cv2.GaussianBlur(gray, (0,0), 0.5*np.sqrt(scale*scale - 1))
+    H, W = gray.shape
+    size = ((np.array([W, H]) - 1 - shift) // scale + 1).astype(int)
+    warp = np.float32([[scale, 0, shift[0]], [0, scale, shift[1]]])
+    interpolation = cv2.INTER_CUBIC if scale < 1 else cv2.INTER_LINEAR
+    return cv2.warpAffine(gray, warp, tuple(map(int, size)), flags=interpolation | cv2.WARP_INVERSE_MAP), shift
+
+# Find the horizontal grid lines of a board at any zoom
+# gridSize: [W,H] of a cell at pattern size. river: the river is this much (in cells) taller than the other rows
+# Return the candidates (lineSpacing, y of the first line, lines [x0,y0,x1,y1] and their row from the first one),
+# the most lines first
+def find_lattice(gray, gridSize, minScale=LOCATE_MIN_SCALE, maxScale=LOCATE_MAX_SCALE, river=0.0):
+    boxes, ys = find_lines(gray, gridSize, minScale, maxScale)
+    if len(ys) < LATTICE_MIN_LINES:
+        return []
+
+    lattice = []
+    for spacing, origin, index in fit_lattice(ys, gridSize[1]*minScale, gridSize[1]*maxScale, GRID_HEIGHT, gap=river):
+        order = np.argsort(index[index >= 0])
+        lines = boxes[index >= 0][order]
+        lines = np.stack([lines[:,0], lines[:,1], lines[:,0]+lines[:,2], lines[:,1]+lines[:,3]], axis=1)
+        lattice.append((spacing, origin, lines, index[index >= 0][order]))
+    return lattice
+
+# positions: of lines that should be equally spaced, at most `count` of them
+# gap: the middle space (the river) is this much (in spacing) larger than the others
+# Every pair of lines give a spacing, keep the ones that put most lines on the lattice
+# Return the candidates (spacing, origin, index of each line on the lattice or -1), most lines first
+# The origin is the position of index 0, the first line found
+def fit_lattice(positions, minSpacing, maxSpacing, count, minLines=LATTICE_MIN_LINES, gap=0.0):
+    candidates = {}
+    model = np.arange(count) + gap*(np.arange(count) >= count//2) # position of each row, in spacing
+    gaps = positions[None, :] - positions[:, None]
+    for i, j in zip(*np.nonzero((gaps >= minSpacing) & (gaps <= maxSpacing))):
+        spacing = gaps[i, j]
+        k = (positions - positions[i]) / spacing
+        tolerance = max(1.5, 0.02*spacing) / spacing
+        # the row of line i that put most lines on the lattice, each line is on its nearest row
+        best = None
+        for row in range(count):
+            dist = np.abs(k[:, None] - (model - model[row])[None, :])
+            rows = dist.argmin(axis=1)
+            onGrid = dist[np.arange(len(k)), rows] <= tolerance
+            if best is None or np.count_nonzero(onGrid) > np.count_nonzero(best[1]):
+                best = rows, onGrid
+        rows, onGrid = best
+        found = np.count_nonzero(onGrid)
+        if found < minLines:
+            continue
+        spacing, origin = np.polyfit(model[rows[onGrid]], positions[onGrid], 1) # least square over all the lines
+        first = rows[onGrid].min()
+        origin += spacing*model[first]
+        key = (int(round(origin)), int(round(spacing)))
+        if key not in candidates or found > candidates[key][0]:
+            candidates[key] = (found, spacing, origin, np.where(onGrid, rows - first, -1).astype(int))
+    return [c[1:] for c in sorted(candidates.values(), key=lambda c: -c[0])]
+
+def find_pattern(board_gray, piece_gray, thresh=0.5, center=1, display=0, mask=None, peaks=None):
+    W, H = piece_gray.shape[::-1]
+    # Passing the image to matchTemplate method
+    match = cv2.matchTemplate(board_gray, piece_gray, cv2.TM_CCOEFF_NORMED, mask=mask)
+    
+    # reduce the matching overlap
+    coords = PEAK_BACKENDS[peaks or PEAK_BACKEND](match, thresh, W, H)
     if display==1:
-        for (x1, y1, x2, y2) in boxes:
+        for (x1, y1) in coords:
             # draw the bounding box on the image
-            cv2.rectangle(board_gray, (x1, y1), (x2, y2),
+            cv2.rectangle(board_gray, (int(x1), int(y1)), (int(x1) + W, int(y1) + H),
                         (0, 0, 0), 2)
         showimg(board_gray)
 
-    coords = np.array( [ (x[0], x[1]) for x in boxes ] )
-
     if center==1 and len(coords) > 0:
         coords = np.add(coords, np.divide((W,H), 2))
 
@@ -163,55 +335,411 @@ def create_mask(img_rgb):
 
 
 class PiecePattern:
-    def __init__(self, side: Side, name: str) -> None:
+    def __init__(self, side: Side, name: str, path=None, pack: PatternPack=None) -> None:
         self.side = side
         self.name = name
         self.fullName = f'{side.name}{name}'
         self.symbol = PIECE_SYMBOL[name]
         if side==Side.Black:
             self.symbol = self.symbol.lower()
-        self.gray = load_gray(self.fullName)
+        self.gray = (pack or load_patterns(path)).gray(self.fullName)
+
+# Classify all cells in one go: every cell patch is stacked into one (rows, cols, H, W) array.
+# First the generic piece (mean of all templates, which is mostly the shared circular outline) is
+# matched once over the mosaic of all patches to locate the piece inside each cell. Then the
+# aligned windows are scored against all templates with a single normalized cross-correlation
+# matrix product. This is 1 matchTemplate call per frame instead of up to 1260
+# The outline score is also the occupancy check: cells below occupancyThresh are empty and not
+# scored against the piece templates at all
+class PieceClassifier:
+    def __init__(self, pieces: List[PiecePattern], thresh=PIECE_THRESH, margin=CELL_SEARCH_MARGIN, refine=1,
+                 occupancyThresh=OCCUPANCY_THRESH) -> None:
+        self.pieces = pieces
+        self.thresh = thresh
+        self.occupancyThresh = occupancyThresh
+        self.margin = margin
+        self.refine = refine # after alignment, also try this many pixel around the located center
+        self.symbols = np.array([p.symbol for p in pieces] + ['.'])
+
+        grays = np.stack([p.gray for p in pieces]).astype(np.float32) # all piece images must be the same size
+        self.templateSize = np.array(grays.shape[:0:-1]) # [W,H]
+        self.outline = np.round(grays.mean(axis=0)).astype(np.uint8)
+        tmpl = grays.reshape(len(pieces), -1)
+        tmpl -= tmpl.mean(axis=1, keepdims=True)
+        tmpl /= np.linalg.norm(tmpl, axis=1, keepdims=True)
+        self.templates = np.ascontiguousarray(tmpl.T) # [pixels, pieces]
+        self.patternHash = patch_hash(grays)
+
+    # results of this classifier are only valid for the same patterns and settings
+    @property
+    def signature(self):
+        return (self.patternHash, tuple(self.symbols), self.thresh, self.occupancyThresh, self.margin, self.refine)
+
+    @property
+    def patchSize(self):
+        return self.templateSize + 2*self.margin
+
+    # roi: [..., 4] -> [x0,y0,x1,y1] of each patch, all of patchSize. Return [..., H, W]
+    # all patches are gathered at once from the sliding window view of the board
+    def stack_patches(self, board_gray, roi):
+        W, H = self.patchSize
+        windows = np.lib.stride_tricks.sliding_window_view(board_gray, (H, W))
+        return windows[roi[..., 1], roi[..., 0]]
+
+    # return the piece location inside each patch, and how much it look like a piece
+    def locate(self, patches):
+        rows, cols, H, W = patches.shape
+        tW, tH = self.templateSize
+        mosaic = np.ascontiguousarray(patches.transpose(0,2,1,3)).reshape(rows*H, cols*W)
+        match = np.full((rows*H, cols*W), -1, dtype=np.float32)
+        match[:rows*H-tH+1, :cols*W-tW+1] = cv2.matchTemplate(mosaic, self.outline, cv2.TM_CCOEFF_NORMED)
+        # only the windows that are fully inside its own patch are valid
+        match = match.reshape(rows, H, cols, W)[:, :H-tH+1, :, :W-tW+1].transpose(0,2,1,3)
+        match = match.reshape(rows, cols, -1)
+        best = match.argmax(axis=2)
+        outline = np.take_along_axis(match, best[..., None], axis=2)[..., 0]
+        dy, dx = np.divmod(best, W-tW+1)
+        lo, hi = self.refine, 2*self.margin - self.refine
+        return np.clip(dy, lo, hi), np.clip(dx, lo, hi), outline
+
+    def occupancy(self, outline):
+        if self.occupancyThresh is None:
+            return np.ones(outline.shape, dtype=bool)
+        return outline >= self.occupancyThresh
+
+    # patches: [cell, H, W], dy/dx: piece location of each cell. return the score [cell, piece]
+    def score(self, patches, dy, dx):
+        tW, tH = self.templateSize
+        steps = np.arange(-self.refine, self.refine+1)
+        oy, ox = np.broadcast_arrays(dy[:, None, None] + steps[:, None], dx[:, None, None] + steps[None, :])
+        oy, ox = oy.reshape(len(patches), -1), ox.reshape(len(patches), -1)
+        windows = np.lib.stride_tricks.sliding_window_view(patches, (tH, tW), axis=(1,2))
+        windows = windows[np.arange(len(patches))[:, None], oy, ox]
+        windows = windows.reshape(-1, tW*tH).astype(np.float32)
+        windows -= windows.mean(axis=1, keepdims=True)
+        norm = np.maximum(np.linalg.norm(windows, axis=1, keepdims=True), 1e-6)
+        ncc = (windows @ self.templates) / norm
+        return ncc.reshape(len(patches), -1, len(self.pieces)).max(axis=1)
+
+    # return the [row][col] symbol grid, the confidence and the occupancy of each cell
+    def classify(self, patches):
+        dy, dx, outline = self.locate(patches)
+        occupied = self.occupancy(outline)
+        scores = np.zeros(occupied.shape + (len(self.pieces),), dtype=np.float32)
+        if occupied.any():
+            scores[occupied] = self.score(patches[occupied], dy[occupied], dx[occupied])
+        best = scores.argmax(axis=2)
+        confidence = np.take_along_axis(scores, best[..., None], axis=2)[..., 0]
+        best[confidence < self.thresh] = len(self.pieces)
+        return self.symbols[best], confidence, occupied
+
+
+# One level of the border search pyramid: the pattern and mask downscaled by `scale`
+# The board is at any offset from the downscaled pixel grid: the pattern is the mean of its downscaled
+# images at every offset, and the mask only keeps the pixels fully inside the border at all of them.
+# The border bars are thin, a mixed pixel of the bar and the screen around kill the score
+class PyramidLevel:
+    def __init__(self, gray, mask, scale) -> None:
+        self.scale = scale
+        if scale > 1:
+            H, W = gray.shape
+            shifted = [np.pad(gray, ((dy, 0), (dx, 0)), mode='edge')[:H, :W] for dy in range(scale) for dx in range(scale)]
+            gray = np.round(np.mean([self.shrink(img) for img in shifted], axis=0)).astype(np.uint8)
+            inside = cv2.erode(mask, np.ones((2*scale-1, 2*scale-1), np.uint8), borderType=cv2.BORDER_CONSTANT, borderValue=0)
+            mask = np.zeros(gray.shape, dtype=np.uint8)
+            inside = inside[::scale, ::scale][:gray.shape[0], :gray.shape[1]]
+            mask[:inside.shape[0], :inside.shape[1]] = inside
+        self.gray, self.mask = gray, mask
+        self.ys, self.xs = np.nonzero(mask)
+        tmpl = gray[self.ys, self.xs].astype(np.float32)
+        tmpl -= tmpl.mean()
+        self.tmpl = tmpl / np.linalg.norm(tmpl)
+
+    def shrink(self, img):
+        if self.scale == 1:
+            return img
+        return cv2.resize(img, (0,0), fx=1/self.scale, fy=1/self.scale, interpolation=cv2.INTER_AREA)
+
+    # masked TM_CCOEFF_NORMED, but only at the given [X,Y] positions
+    def score_at(self, img, positions):
+        img = np.ascontiguousarray(img)
+        W = img.shape[1]
+        win = np.take(img, (positions[:,1]*W + positions[:,0])[:,None] + (self.ys*W + self.xs)).astype(np.float32)
+        win -= win.mean(axis=1, keepdims=True)
+        return (win @ self.tmpl) / np.maximum(np.linalg.norm(win, axis=1), 1e-6)
+
+    # search around pos (full size [X,Y]), return the best full size position and its score
+    def refine(self, img, pos, radius):
+        s = self.scale
+        H, W = self.gray.shape
+        start = np.maximum(pos - radius*s, 0)
+        win = self.shrink(img[start[1]:pos[1]+(H+radius)*s, start[0]:pos[0]+(W+radius)*s])
+        center = (pos - start) // s
+        dy, dx = np.mgrid[-radius:radius+1, -radius:radius+1]
+        cand = np.stack([center[0] + dx.ravel(), center[1] + dy.ravel()], axis=1)
+        cand = cand[(cand >= 0).all(axis=1) & (cand[:,0] + W <= win.shape[1]) & (cand[:,1] + H <= win.shape[0])]
+        if len(cand) == 0:
+            return None, -1
+        scores = self.score_at(win, cand)
+        best = scores.argmax()
+        return start + cand[best]*s, scores[best]
+
 
 class ZigaMonitor(BaseMonitor):
     piecePatterns: Dict[str, PiecePattern] = {}
     lastScanRegion = None
+    boardScale = 1.0 # on screen board size / pattern size, found by the lattice search
+    boardOrigin = None # screen [X,Y] of the border upleft, last time it was found
+    scanMode = 'batch' # 'batch' use PieceClassifier, 'loop' is the original cell-by-cell scan
+    incremental = True # only re-classify the cells that changed since last frame
+    capture: CaptureBackend = None
+    executor: ThreadPoolExecutor = None
+    patterns: PatternPack = None
 
     # Abstract override
     def do_init(self, params=None):
-        self.playSize = get_imgsize('play_area')             # The captured image of playing field only. This is used to calculate the grid size
-        self.pieceSize = get_imgsize('BlackKing')            # Any image that have the size of piece to search
-        self.playStart = get_imgsize('corrner2playfield')    # To get the offset from where Border is detected, to the actual playing field
+        params = params or {}
+        self.scanMode = params.get('scanMode', self.scanMode)
+        self.incremental = params.get('incremental', self.incremental)
+        self.cellDiffThresh = params.get('cellDiffThresh', CELL_DIFF_THRESH)
+        self.maxChangedCells = params.get('maxChangedCells', MAX_CHANGED_CELLS)
+        self.fullScanEvery = params.get('fullScanEvery', FULL_SCAN_EVERY)
+        if self.capture is not None:
+            self.capture.close()
+        self.capture = create_capture(params.get('capture', 'region'), params) # see ScreenCapture.CAPTURE_BACKENDS
+        self.framePool = FrameBufferPool(params.get('framePoolSize', FRAME_POOL_SIZE))
+        self.frameBuf = None # the pool buffer of the frame being processed
+        self.patternPath = params.get('patternPath', PATTERN_PATH) # i.e. made by ZigaCalibrate
+        pack = self.patterns = load_patterns(self.patternPath)
+        # calibrated patterns come with their thresholds, the params still win
+        thresholds = load_thresholds(self.patternPath)
+        pieceThresh = params.get('pieceThresh', thresholds.get('piece', PIECE_THRESH))
+        occupancyThresh = params.get('occupancyThresh', thresholds.get('occupancy', OCCUPANCY_THRESH))
+        self.borderThresh = params.get('borderThresh', thresholds.get('border', BORDER_THRESH))
+        self.playSize = pack.size('play_area')             # The captured image of playing field only. This is used to calculate the grid size
+        self.pieceSize = pack.size('BlackKing')            # Any image that have the size of piece to search
+        self.playStart = pack.size('corrner2playfield')    # To get the offset from where Border is detected, to the actual playing field
         self.gridSize = np.divide(self.playSize, (GRID_WIDTH-1, GRID_HEIGHT-1))
         
-        self.borderPatternGray, self.borderPatternMask = load_img_mask('border')  # The border pattern. Make sure that the tool can recognize this given any active possition
+        self.borderPatternGray, self.borderPatternMask = pack.gray('border'), pack.mask('border')  # The border pattern. Make sure that the tool can recognize this given any active possition
                                                                         # NOTE: when the lastmove is in the conner, the lastmove indicator may "peek" into border pattern
                                                                         #       make sure to mask it properly
-        self.borderSize = get_imgsize('border')
-        self.lastMovePatternGray, self.lastMovePatternMsk = load_img_mask('lastMove')
+        self.borderSize = pack.size('border')
+        self.pyramidScale = params.get('pyramidScale', PYRAMID_SCALE)
+        self.locateMode = params.get('locateMode', LOCATE_MODE)
+        self.boardScale = params.get('boardScale', 1.0)
+        self.lastLocate = -np.inf # time of the last lattice search
+        # the board rows are not all the same height, the lattice search need the real spacing
+        self.latticeSpacing, self.latticeRiver = pattern_lattice(pack.gray('play_area'), self.gridSize)
+        self.pyramidMisses = 0 # full screen frames the pyramid found nothing and the full border search ran
+        self.lastFullSearch = -np.inf
+        # from the coarsest to full size, each level is half the scale of the previous one
+        self.borderPyramid: List[PyramidLevel] = []
+        scale = self.pyramidScale
+        while scale >= 1:
+            self.borderPyramid.append(PyramidLevel(self.borderPatternGray, self.borderPatternMask, scale))
+            scale //= 2
+        self.lastMovePatternGray, self.lastMovePatternMsk = pack.gray('lastMove'), pack.mask('lastMove')
 
         for side in [Side.Black, Side.White]:
             for name in PIECE_NAME:
-                p = PiecePattern(side,name)
+                p = PiecePattern(side,name,pack=pack)
                 self.piecePatterns[p.fullName] = p
         
-        # maybe this help speedup pattern matching
-        self.patternOffset = [[np.multiply(self.gridSize, (i,j)) + self.playStart - np.divide(self.gridSize,2)
-                               for i in range(GRID_WIDTH)] for j in range(GRID_HEIGHT)] # [Y,X]
+        self.classifier = PieceClassifier(list(self.piecePatterns.values()), thresh=pieceThresh, occupancyThresh=occupancyThresh)
+        self.patchSize = self.classifier.patchSize
+        self.geometry = None
+        self.set_geometry(self.playStart, self.gridSize)
+        self.cellConfidence = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.float32)
+        self.templateCallsSaved = 0 # by the occupancy check, in the last frame
+        self.emptyCells = 0 # cells of the last frame classified as empty by the occupancy check
+        self.prevBoard = None   # cropped board and result of the last scan, for incremental scan
+        self.prevResult: MonitorResult = None
+        self.framesSinceFullScan = 0
+        self.cellsRescanned = 0
+        cacheSize = params.get('cellCacheSize', CELL_CACHE_SIZE)
+        self.cellCache = CellCache(cacheSize) if cacheSize else None
+        self.scanWorkers = params.get('scanWorkers', SCAN_WORKERS)
+        self.peakBackend = params.get('peakBackend', PEAK_BACKEND) # see PEAK_BACKENDS
+        if self.peakBackend not in PEAK_BACKENDS:
+            raise ValueError(f'Unknown peak backend {self.peakBackend}, use one of {list(PEAK_BACKENDS)}')
+        if self.peakBackend == 'nms' and non_max_suppression is None:
+            raise ValueError('The nms peak backend need imutils')
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.executor = ThreadPoolExecutor(self.scanWorkers, thread_name_prefix='ZigaScan') if self.scanWorkers > 1 else None
 
     def do_board_scan(self):
         # start = timer()
-        img = screen_cap(self.lastScanRegion)
+        self.frameBuf = self.capture.grab(self.lastScanRegion, self.framePool)
+        # the buffer is reused for next frames, nobody should write or keep it
+        img = self.frameBuf.view()
+        img.flags.writeable = False
         return self.scan_image(img)
         # end = timer()
         # logger.info(end-start)
 
 
+    # Build the per-cell ROI tables for the board geometry: [cell] -> [x0,y0,x1,y1] int32, cells in row major order
+    #   cellRoi: the grid cell around each intersection, for the cell-by-cell scan
+    #   patchRoi: the classifier patch around each intersection
+    #   loopRoi: both of them, a cell result of the loop scan depend on the patch (occupancy) and the cell (templates)
+    # Nothing is recomputed per frame, the tables are only rebuilt when the geometry changes
+    def set_geometry(self, playStart, gridSize):
+        geometry = (tuple(self.borderSize), tuple(playStart), tuple(gridSize), PATTERN_SCALE)
+        if geometry == self.geometry:
+            return False
+        self.geometry = geometry
+        self.playStart, self.gridSize = np.asarray(playStart), np.asarray(gridSize)
+        col, row = np.meshgrid(np.arange(GRID_WIDTH), np.arange(GRID_HEIGHT))
+        centers = np.stack([col.ravel(), row.ravel()], axis=1) * self.gridSize + self.playStart # [X,Y]
+        cellStart = centers - self.gridSize/2
+        self.cellRoi = np.hstack([cellStart.astype(int), (cellStart + self.gridSize).astype(int)]).astype(np.int32)
+        patchStart = (centers - self.patchSize/2).astype(int)
+        self.patchRoi = np.hstack([patchStart, patchStart + self.patchSize]).astype(np.int32)
+        self.loopRoi = np.hstack([np.minimum(self.cellRoi[:, :2], self.patchRoi[:, :2]),
+                                  np.maximum(self.cellRoi[:, 2:], self.patchRoi[:, 2:])])
+        logger.debug(f'Board geometry: playStart={self.playStart} gridSize={self.gridSize}')
+        return True
+
+    # the classifier patch of every cell, [row, col, H, W]
+    def stack_patches(self, board):
+        return self.classifier.stack_patches(board, self.patchRoi.reshape(GRID_HEIGHT, GRID_WIDTH, 4))
+
+    def do_frame_done(self):
+        if self.frameBuf is not None:
+            self.framePool.release(self.frameBuf)
+            self.frameBuf = None
+
     # Specified task
 
+    def find_border(self, board_gray):
+        return find_pattern(board_gray, self.borderPatternGray, mask=self.borderPatternMask, thresh=self.borderThresh, center=0,
+                            peaks=self.peakBackend)
+
+    # Coarse-to-fine: search the border on the downscaled screen, then refine each candidate
+    # level by level only in a small window around it
+    def find_border_pyramid(self, board_gray):
+        found = []
+        for pos, score in sorted(self.border_candidates(board_gray), key=lambda c: -c[1]):
+            # a candidate a few pixels off the best one is the same board, as the overlap merge of find_pattern
+            if score >= self.borderThresh and all(np.abs(pos - p).max() > self.borderSize.min()//2 for p in found):
+                found.append(pos)
+        return np.array(sorted(map(tuple, found)))
+
+    # return the [(pos, score)] of the refined border candidates
+    def border_candidates(self, board_gray):
+        coarse = self.borderPyramid[0]
+        if board_gray.shape[0] < coarse.gray.shape[0]*coarse.scale or board_gray.shape[1] < coarse.gray.shape[1]*coarse.scale:
+            return []
+        match = cv2.matchTemplate(coarse.shrink(board_gray), coarse.gray, cv2.TM_CCOEFF_NORMED, mask=coarse.mask)
+        match = np.nan_to_num(match, nan=-1, posinf=-1, neginf=-1) # flat area give inf with mask
+        # the local maxima, best first. The border grid lines give side peaks a cell away from the true one,
+        # sometimes higher at this scale, so each is refined rather than only the best of an area.
+        # Only a small window around each is searched on the next levels
+        peaks = (match >= PYRAMID_THRESH) & (match == cv2.dilate(match, np.ones((3,3), np.uint8)))
+        ys, xs = np.nonzero(peaks)
+        order = np.argsort(-match[ys, xs])[:PYRAMID_CANDIDATES]
+        if len(order):
+            order = order[match[ys[order], xs[order]] >= match[ys[order[0]], xs[order[0]]] - PYRAMID_MARGIN]
+        found, seen = [], set()
+        for x, y in zip(xs[order], ys[order]):
+            pos = np.array((x,y)) * coarse.scale
+            for i, level in enumerate(self.borderPyramid[1:]):
+                pos, score = level.refine(board_gray, pos, PYRAMID_RADIUS if i==0 else 2)
+                # drop it when it fade away, or it joined a candidate already refined from there
+                if pos is None or (level.scale > 1 and (score < PYRAMID_THRESH or (i, *pos) in seen)):
+                    pos = None
+                    break
+                seen.add((i, *pos))
+            if pos is not None:
+                found.append((pos, score))
+        return found
+
+    # The board zoom is unknown: get the scale from the spacing of the grid lines, then refine it
+    # and confirm with the border pattern in the area where the lattice say the board is
+    # Return the screen [X,Y] of the border and update boardScale, None if the board is not found
+    def locate_board_scale(self, screen):
+        start = timer()
+        playH = self.gridSize[1] * (GRID_HEIGHT-1)
+        for spacing, _, lines, index in find_lattice(screen, self.gridSize, river=self.latticeRiver)[:LATTICE_CANDIDATES]:
+            scale = spacing / self.latticeSpacing
+            # the rows of the lines found are not known, the board may start some rows above the first one.
+            # A line cut by the pieces is several segments of the same row
+            rowsMissing = GRID_HEIGHT-1 - index.max()
+            top = lines[0,1] - (self.playStart[1] + rowsMissing*self.gridSize[1]) * scale
+            bottom = lines[-1,3] + (self.borderSize[1] - self.playStart[1] - playH + rowsMissing*self.gridSize[1]) * scale
+            left = lines[:,0].min() - (self.playStart[0] + self.gridSize[0]) * scale
+            right = lines[:,2].max() + (self.borderSize[0] - self.playStart[0] + self.gridSize[0]) * scale
+            x0, y0 = max(int(left), 0), max(int(top), 0)
+            area = screen[y0:max(int(bottom), y0), x0:max(int(right), x0)]
+            best, bestScore = None, -1
+            scales = scale * (1 + np.arange(-SCALE_REFINE_RANGE, SCALE_REFINE_RANGE + 1e-9, SCALE_REFINE_STEP))
+            if np.abs(scales - 1).min() <= SCALE_REFINE_STEP:
+                scales = np.append(scales, 1.0) # no resize at all if it is the pattern size
+            for s in scales:
+                img = area if s == 1 else cv2.resize(area, (0,0), fx=1/s, fy=1/s, interpolation=cv2.INTER_AREA)
+                for pos, score in self.border_candidates(img):
+                    if score > bestScore:
+                        best, bestScore = (s, np.array((x0, y0)) + pos*s), score
+            logger.debug(f'Lattice spacing {spacing:.2f}, {len(lines)} lines: border score {bestScore:.3f}')
+            if bestScore >= self.borderThresh:
+                self.boardScale = best[0]
+                logger.info(f'Board found at scale {self.boardScale:.3f}, {best[1]} in {(timer()-start)*1000:.0f}ms')
+                return best[1]
+        logger.debug(f'Lattice search failed in {(timer()-start)*1000:.0f}ms')
+        return None
+
+    # the board geometry on the screen: [X,Y] of the first intersection, and the cell [W,H]
+    @property
+    def screenPlayStart(self):
+        return None if self.boardOrigin is None else self.boardOrigin + self.playStart*self.boardScale
+
+    @property
+    def screenGridSize(self):
+        return self.gridSize*self.boardScale
+
+    def find_board(self, board_gray):
+        if self.pyramidScale > 1 and board_gray.size > 2*np.prod(self.borderSize): # not worth it on a region capture
+            found = self.find_border_pyramid(board_gray)
+            if len(found):
+                return found
+            # no board or the coarse level missed it, the full search tell. It takes seconds on a big
+            # screen, so not on every frame while the board is away
+            now = timer()
+            if now - self.lastFullSearch < FULL_SEARCH_EVERY:
+                return found
+            self.lastFullSearch = now
+            self.pyramidMisses += 1
+        return self.find_border(board_gray)
+
+    # the board is brought back to the pattern size when it is zoomed, so the rest of the scan does not change
     def crop_image(self, board_gray):
         # board_gray = cv2.cvtColor(board_color, cv2.COLOR_BGR2GRAY)
         # upleft_ptn = cv2.imread(f'{PATTERN_PATH}/upleft.png', 0)
-        borderPos = find_pattern(board_gray, self.borderPatternGray, mask=self.borderPatternMask, thresh=BORDER_THRESH, center=0)
+        screen = board_gray
+        regionStart = np.zeros(2) if self.lastScanRegion is None else np.array(self.lastScanRegion[:2])
+        shift = np.zeros(2)
+        if self.boardScale != 1:
+            # the board is likely where it was, sample it at the same phase
+            origin = None if self.boardOrigin is None else self.boardOrigin - regionStart
+            board_gray, shift = rescale(screen, self.boardScale, origin)
+        borderPos = self.find_board(board_gray)
+        if len(borderPos) != 1 and self.lastScanRegion is None and self.locateMode == 'lattice':
+            # maybe the zoom changed, search the board at any scale: right after it was lost, then once in a while.
+            # It takes up to a few hundred ms, not on every frame while the board is away
+            now = timer()
+            if now - self.lastLocate >= LOCATE_RETRY_EVERY or self.boardOrigin is not None:
+                self.lastLocate = now
+                self.boardOrigin = None
+                origin = self.locate_board_scale(screen)
+                if origin is not None:
+                    board_gray, shift = (screen, np.zeros(2)) if self.boardScale == 1 else rescale(screen, self.boardScale, origin)
+                    # confirm it only around where the lattice search found it
+                    start = np.maximum(np.round((origin - shift) / self.boardScale).astype(int) - SCALED_REGION_PAD, 0)
+                    end = start + self.borderSize + 2*SCALED_REGION_PAD
+                    borderPos = self.find_board(board_gray[start[1]:end[1], start[0]:end[0]])
+                    borderPos = borderPos + start if len(borderPos) else borderPos
         if len(borderPos) != 1:
             self.lastScanRegion = None
             return None
@@ -221,9 +749,20 @@ class ZigaMonitor(BaseMonitor):
         boardEnd =  upleftPos + self.borderSize #+ self.upleftSize + self.playSize + self.pieceSize
 
         board_crop = board_gray[ boardStart[1]:boardEnd[1] , boardStart[0]:boardEnd[0] ]
+        if board_crop.shape[::-1] != tuple(self.borderSize): # cut by the screen edge
+            self.lastScanRegion = None
+            return None
+        self.boardOrigin = regionStart + shift + upleftPos*self.boardScale
+        # zoomed board: the border is not at an exact pixel of the region, keep a margin around it
+        pad = 0 if self.boardScale == 1 else SCALED_REGION_PAD
         if self.lastScanRegion is None:
-            self.lastScanRegion = (upleftPos[0], upleftPos[1], boardEnd[0], boardEnd[1])
-        elif upleftPos[0] != 0 or upleftPos[1] != 0: # Not all zero
+            if pad == 0:
+                self.lastScanRegion = (upleftPos[0], upleftPos[1], boardEnd[0], boardEnd[1])
+            else:
+                start = np.maximum(np.round(shift + (upleftPos - pad)*self.boardScale), 0).astype(int)
+                end = np.round(shift + (boardEnd + pad)*self.boardScale).astype(int)
+                self.lastScanRegion = (start[0], start[1], end[0], end[1])
+        elif np.abs(upleftPos - pad).max() > pad: # Not all zero
             self.lastScanRegion = None
 
         return board_crop
@@ -236,52 +775,210 @@ class ZigaMonitor(BaseMonitor):
     #     return np.round((coord - self.playStart) / self.gridSize).astype(int)
 
     def scan_piece(self, board_gray, piece_gray, display=0):
-        coord = find_pattern(board_gray, piece_gray, thresh=PIECE_THRESH, center=1, display=display)
+        coord = find_pattern(board_gray, piece_gray, thresh=PIECE_THRESH, center=1, display=display, peaks=self.peakBackend)
         if len(coord)==0:
             return coord
         return np.round((coord - self.playStart) / self.gridSize).astype(int)
 
     def scan_lastmove(self, board_gray, display=0):
         coord = find_pattern(board_gray, self.lastMovePatternGray, thresh=LASTMOVE_THRESH,
-                            mask=self.lastMovePatternMsk, center=1, display=display)
+                            mask=self.lastMovePatternMsk, center=1, display=display, peaks=self.peakBackend)
         if len(coord)==0:
             # self.send_msg('** Error: Last move position not found')
             return None
         coord = coord[0]
         return np.round((coord - self.playStart) / self.gridSize).astype(int)
 
+    # rows: the rows to scan, None for all. warnings: list to collect the warnings instead of logging them
+    def scan_cells_loop(self, board, occupied=None, rows=None, warnings=None):
+        positions = [['.' for i in range(GRID_WIDTH)] for j in range(GRID_HEIGHT)]
+        for row in (range(GRID_HEIGHT) if rows is None else rows):
+            for col in range(GRID_WIDTH):
+                if occupied is not None and not occupied[row][col]:
+                    continue
+                x0, y0, x1, y1 = self.cellRoi[row*GRID_WIDTH + col]
+                boardLoc = board[y0:y1, x0:x1]
+                for _, piece in self.piecePatterns.items():
+                    res = find_pattern(boardLoc, piece.gray, thresh=PIECE_THRESH, peaks=self.peakBackend)
+                    if len(res) > 0:
+                        # found here
+                        curp = positions[row][col]
+                        if (curp != '.'):
+                            msg = f'Duplicated piece found at {row}:{col} {curp} -> {piece.symbol}'
+                            if warnings is None:
+                                logger.warning(msg)
+                            else:
+                                warnings.append(msg)
+                        positions[row][col] = piece.symbol
+                        break
+        return positions
+
+    def scan_cells_batch(self, board, cells=None, patches=None):
+        if patches is None:
+            patches = self.stack_patches(board)
+        if self.executor is not None:
+            return self.scan_cells_batch_parallel(patches, cells)
+        if cells is None:
+            symbols, self.cellConfidence, occupied = self.classifier.classify(patches)
+            self.report_occupancy(occupied)
+            return symbols.tolist()
+        symbols = np.full(cells.shape, '.')
+        sym, conf, occupied = self.classifier.classify(patches[cells][None])
+        symbols[cells], self.cellConfidence[cells] = sym[0], conf[0]
+        self.report_occupancy(occupied)
+        return symbols.tolist()
+
+    # the selected cells are split in one chunk per worker, each chunk is classified as one stack
+    def scan_cells_batch_parallel(self, patches, cells=None):
+        if cells is None:
+            cells = np.ones(patches.shape[:2], dtype=bool)
+        selected = patches[cells]
+        chunks = np.array_split(np.arange(len(selected)), min(self.scanWorkers, max(len(selected), 1)))
+        results = list(self.executor.map(lambda idx: self.classifier.classify(selected[idx][None]), chunks))
+        symbols = np.full(cells.shape, '.')
+        symbols[cells] = np.concatenate([sym[0] for sym, _, _ in results])
+        self.cellConfidence[cells] = np.concatenate([conf[0] for _, conf, _ in results])
+        self.report_occupancy(np.concatenate([occ[0] for _, _, occ in results]))
+        return symbols.tolist()
+
+    # each worker scan a block of rows, the warnings are logged in row order once all are done
+    def scan_cells_loop_parallel(self, board, occupied=None):
+        blocks = np.array_split(np.arange(GRID_HEIGHT), self.scanWorkers)
+        def scan(rows):
+            warnings = []
+            return self.scan_cells_loop(board, occupied, rows, warnings), warnings
+        positions = [['.' for i in range(GRID_WIDTH)] for j in range(GRID_HEIGHT)]
+        for rows, (part, warnings) in zip(blocks, self.executor.map(scan, blocks)):
+            for row in rows:
+                positions[row] = part[row]
+            for msg in warnings:
+                logger.warning(msg)
+        return positions
+
+    # everything a cached cell result depend on beside its pixels
+    @property
+    def cacheSignature(self):
+        loop = (PIECE_THRESH, self.peakBackend) if self.scanMode == 'loop' else None
+        return (self.patternPath, PATTERN_SCALE, self.geometry, self.scanMode, loop, self.classifier.signature)
+
+    # cells: mask of the cells to scan, None for all. The other cells are left empty
+    # The cache key is the hash of all the pixels the cell result depend on in the scan mode
+    def scan_cells(self, board, cells=None):
+        if self.cellCache is None:
+            return self.classify_cells(board, cells)
+        self.cellCache.validate(self.cacheSignature)
+        patches = self.stack_patches(board)
+        keyRoi = self.loopRoi if self.scanMode == 'loop' else self.patchRoi
+        todo = np.ones((GRID_HEIGHT, GRID_WIDTH), dtype=bool) if cells is None else cells.copy()
+        keys = {}
+        cached = {}
+        for row, col in zip(*np.nonzero(todo)):
+            x0, y0, x1, y1 = keyRoi[row*GRID_WIDTH + col]
+            keys[row,col] = self.cellCache.key(board[y0:y1, x0:x1])
+            entry = self.cellCache.get(keys[row,col])
+            if entry is not None:
+                cached[row,col] = entry
+                todo[row,col] = False
+
+        if todo.any():
+            positions = self.classify_cells(board, todo, patches)
+            for row, col in zip(*np.nonzero(todo)):
+                self.cellCache.put(keys[row,col], positions[row][col], self.cellConfidence[row,col])
+        else:
+            positions = [['.' for i in range(GRID_WIDTH)] for j in range(GRID_HEIGHT)]
+        for (row, col), (symbol, confidence) in cached.items():
+            positions[row][col] = symbol
+            self.cellConfidence[row,col] = confidence
+        logger.debug(f'Cell cache: {len(cached)} hits, {len(keys) - len(cached)} misses, {len(self.cellCache)} entries')
+        return positions
+
+    def classify_cells(self, board, cells=None, patches=None):
+        if self.scanMode == 'loop':
+            occupied = cells
+            if self.classifier.occupancyThresh is not None:
+                if patches is None:
+                    patches = self.stack_patches(board)
+                if cells is None:
+                    occupied = self.classifier.occupancy(self.classifier.locate(patches)[2])
+                    self.report_occupancy(occupied)
+                else:
+                    occupied = cells.copy()
+                    occupied[cells] = self.classifier.occupancy(self.classifier.locate(patches[cells][None])[2])[0]
+                    self.report_occupancy(occupied[cells])
+            if self.executor is not None:
+                return self.scan_cells_loop_parallel(board, occupied)
+            return self.scan_cells_loop(board, occupied)
+        return self.scan_cells_batch(board, cells, patches)
+
+    # occupied: the occupancy of the cells just classified, a frame may classify its cells in several parts
+    def report_occupancy(self, occupied):
+        self.emptyCells += occupied.size - np.count_nonzero(occupied)
+
+    # return the mask of cells that changed since the last scan, or None if a full scan is needed
+    def changed_cells(self, board):
+        if (not self.incremental or self.prevBoard is None or self.prevBoard.shape != board.shape
+                or self.framesSinceFullScan >= self.fullScanEvery):
+            return None
+        _, diff = cv2.threshold(cv2.absdiff(board, self.prevBoard), PIXEL_DIFF_THRESH, 1, cv2.THRESH_BINARY)
+        changed = self.stack_patches(diff).sum(axis=(2,3)) > self.cellDiffThresh
+        if np.count_nonzero(changed) > self.maxChangedCells:
+            # too many changes (animation, board redraw...), dont trust the cache
+            return None
+        return changed
+
     # a little bit faster, but still slow thouigh...
     def scan_image(self, board_gray):
+        self.emptyCells = self.templateCallsSaved = 0
         board = self.crop_image(board_gray)
         if board is None:
             # self.send_msg("** Error : No Board found.")
             self.send_fatal('Board Not Found')
+            self.prevBoard = None
             return None
-        
+
+        cells = self.changed_cells(board)
+        if cells is None:
+            self.framesSinceFullScan = 0
+            self.cellsRescanned = GRID_WIDTH * GRID_HEIGHT
+        else:
+            self.framesSinceFullScan += 1
+            self.cellsRescanned = np.count_nonzero(cells)
+            if self.cellsRescanned == 0:
+                # the last move marker is inside the cells too, so nothing changed
+                return self.prevResult.copy()
+
         result = MonitorResult()
 
         result.lastMovePosition = self.scan_lastmove(board)
-        kingPos = {Side.Black: None, Side.White: None}
+        result.positions = self.scan_cells(board, cells)
+        # only the cells classified in this frame, not the cache hits nor the unchanged cells
+        self.templateCallsSaved = self.emptyCells * len(self.piecePatterns)
+        logger.debug(f'Occupancy: {self.emptyCells} empty cells, {self.templateCallsSaved} template calls saved')
+        if cells is not None:
+            for row, col in zip(*np.nonzero(~cells)):
+                result.positions[row][col] = self.prevResult.positions[row][col]
+        logger.debug(f'Rescanned {self.cellsRescanned} cells')
+
+        result = self.fill_result(result)
+        if self.prevBoard is None or self.prevBoard.shape != board.shape:
+            self.prevBoard = board.copy()
+        else:
+            np.copyto(self.prevBoard, board)
+        self.prevResult = result.copy()
+        return result
 
+    def fill_result(self, result: MonitorResult):
+        kingPos = {Side.Black: None, Side.White: None}
         for row in range(GRID_HEIGHT):
             for col in range(GRID_WIDTH):
-                ptnOffs = self.patternOffset[row][col]
-                s = ptnOffs.astype(int)
-                e = (ptnOffs + self.gridSize).astype(int)
-                boardLoc = board[ s[1]:e[1], s[0]:e[0] ]
-                for _, piece in self.piecePatterns.items():
-                    res = find_pattern(boardLoc, piece.gray, thresh=PIECE_THRESH)
-                    if len(res) > 0:
-                        # found here
-                        if np.array_equal(result.lastMovePosition, (col,row)):
-                            result.moveSide = piece.side
-                        curp = result.positions[row][col]
-                        if (curp != '.'):
-                            logger.warning(f'Duplicated piece found at {row}:{col} {curp} -> {piece.symbol}')
-                        result.positions[row][col] = piece.symbol
-                        if piece.name == 'King':
-                            kingPos[piece.side] = (col,row)
-                        break
+                sym = result.positions[row][col]
+                if sym == '.':
+                    continue
+                side = Side.White if sym.isupper() else Side.Black
+                if np.array_equal(result.lastMovePosition, (col,row)):
+                    result.moveSide = side
+                if sym in ('K','k'):
+                    kingPos[side] = (col,row)
 
         if kingPos[Side.Black] is None or kingPos[Side.White] is None:
             self.send_error(f'KING is not found in both sides')
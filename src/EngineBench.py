@@ -0,0 +1,244 @@
+import argparse, asyncio, logging, queue, time
+from timeit import default_timer as timer
+
+from EngineUCI import Engine, EngineEventListener, DEFAULT_ENGPATH
+from EnginePool import EnginePool
+from AsyncEngine import AsyncEngine
+from EngineGame import START_FEN, fen_board, fen_side, board_fen, apply_move, opposite
+
+logging.getLogger().setLevel(logging.WARNING)
+
+# Benchmark the UCI engine adapter with a real engine:
+#   python EngineBench.py -e engine_exe/fairy-stockfish_x86-64-bmi2.exe continuity -t 1000
+#   python EngineBench.py ponder -t 1000 -w 1500
+#   python EngineBench.py pool -p 1 4 -t 500
+#   python EngineBench.py async -t 300 -k 4
+#   python EngineBench.py latency -t 300
+#   python EngineBench.py -e ../tests/fake_uci.py latency -t 300 (the stand-in engine of the tests)
+# The positions are a game played from the start, by default GAME_LINE. Only the positions of one
+# side are searched, as the helper does on my turn
+
+GAME_LINE = 'h3e3 h10g8 h1g3 i10h10 i1h1 b10c8 b1c3 c7c6 g4g5 b8b4 a1b1 a10b10 c4c5 g7g6 h1h7 c10e8'
+
+# the fens after each move of the line, the first is the start
+def game_positions(moves, start=START_FEN):
+    board, side = fen_board(start), start.split()[1]
+    fens = [start]
+    for mv in moves:
+        board, side = apply_move(board, mv), opposite(side)
+        fens.append(board_fen(board, side))
+    return fens
+
+class ResultCollector(EngineEventListener):
+    def __init__(self) -> None:
+        self.results = queue.Queue()
+
+    def on_move_calculated(self, fen, info):
+        self.results.put((fen, info))
+
+    def on_engine_fatal(self, msg):
+        self.results.put((None, msg))
+
+    # the info of the bestmove of fen, the results of other positions are skipped
+    def wait_move(self, fen, timeout):
+        while True:
+            got, info = self.results.get(timeout=timeout)
+            if got is None:
+                raise RuntimeError(f'Engine fatal: {info}')
+            if got == fen:
+                return info
+
+# search the fens one after the other, return [(fen, depth, nodes, seconds)]
+def search_all(args, fens, **engineArgs):
+    engine = Engine(args.engine, **engineArgs)
+    collector = ResultCollector()
+    engine.add_event_listener(collector)
+    engine.uci_movetime = args.movetime
+    engine.start()
+    records = []
+    try:
+        for fen in fens:
+            start = timer()
+            engine.start_next_move(fen)
+            info = collector.wait_move(fen, args.movetime / 1000 + 10)
+            depth = info.info.get('depth', 0) if info else 0
+            nodes = info.info.get('nodes', 0) if info else 0
+            records.append((fen, depth, nodes, timer() - start))
+    finally:
+        engine.quit()
+    return records, engine
+
+# Same positions, every one searched from a cleared hash table (ucinewgame + position fen) vs as
+# the moves of one game (position fen <start> moves ..., the hash table of the last search is reused)
+def bench_continuity(args):
+    fens = game_positions(args.moves.split())[args.side::2]
+    print(f'{len(fens)} positions, {args.movetime}ms each, engine {args.engine}')
+    runs = {}
+    for name, continuity in (('newgame', False), ('continuity', True)):
+        runs[name], engine = search_all(args, fens, continuity=continuity)
+        if continuity:
+            game = engine.game
+            print(f'continuity: {game.newGames} new game, {game.followed} followed, {game.rerooted} re-rooted')
+    print(f'{"#":>3} {"newgame depth":>13} {"continuity depth":>16} {"newgame knodes":>14} {"continuity knodes":>17}')
+    for i, (old, new) in enumerate(zip(runs['newgame'], runs['continuity'])):
+        print(f'{i:3} {old[1]:13} {new[1]:16} {old[2]/1000:14.0f} {new[2]/1000:17.0f}')
+    print(f'{"mode":12} {"avg depth":>9} {"depth/s":>8} {"knodes/s":>9}')
+    for name, records in runs.items():
+        depth = sum(r[1] for r in records) / len(records)
+        seconds = sum(r[3] for r in records)
+        print(f'{name:12} {depth:9.2f} {depth / (args.movetime / 1000):8.2f} {sum(r[2] for r in records) / seconds / 1000:9.0f}')
+
+# Self play where the opponent always answer the ponder move after thinking --wait ms: the time from
+# start_next_move to the bestmove, with and without pondering during the opponent turn
+def bench_ponder(args):
+    print(f'{args.count} moves, {args.movetime}ms each, opponent {args.wait}ms, engine {args.engine}')
+    print(f'{"mode":10} {"avg ms":>8} {"max ms":>8} {"hits":>5} {"misses":>6}')
+    for name, ponder in (('no ponder', False), ('ponder', True)):
+        engine = Engine(args.engine, ponder=ponder)
+        collector = ResultCollector()
+        engine.add_event_listener(collector)
+        engine.uci_movetime = args.movetime
+        engine.start()
+        fen, latency = START_FEN, []
+        try:
+            for _ in range(args.count):
+                start = timer()
+                engine.start_next_move(fen)
+                info = collector.wait_move(fen, args.movetime / 1000 + 10)
+                latency.append(timer() - start)
+                if info is None or len(info.pv) < 2 or info.pv[1] is None:
+                    print(f'** {name}: no ponder move for "{fen}", game stopped')
+                    break
+                time.sleep(args.wait / 1000)
+                fen = board_fen(apply_move(apply_move(fen_board(fen), info.pv[0]), info.pv[1]), fen_side(fen))
+        finally:
+            engine.quit()
+        print(f'{name:10} {sum(latency)/len(latency)*1000:8.0f} {max(latency)*1000:8.0f} {engine.ponderHits:5} {engine.ponderMisses:6}')
+
+# All the positions of the game line analysed by pools of each size, one engine thread per process
+def bench_pool(args):
+    fens = game_positions(args.moves.split())
+    print(f'{len(fens)} positions, {args.movetime}ms each, engine {args.engine}')
+    print(f'{"processes":>9} {"seconds":>8} {"positions/s":>11} {"speedup":>8}  per process')
+    base = None
+    for size in args.pools:
+        pool = EnginePool(size, args.engine, threads=args.threads, hash=args.hash)
+        pool.start()
+        try:
+            start = timer()
+            requests = pool.analyse_all(fens, args.movetime)
+            infos = [r.result(timeout=len(fens) * args.movetime / 1000 + 20) for r in requests]
+            elapsed = timer() - start
+        finally:
+            pool.quit()
+        missing = sum(info is None for info in infos)
+        base = base or elapsed
+        print(f'{size:9} {elapsed:8.2f} {len(fens)/elapsed:11.2f} {base/elapsed:7.1f}x  '
+              f'{[w.searched for w in pool.workers]}{f"  {missing} without info" if missing else ""}')
+
+async def async_search_all(engines, fens, movetime):
+    async def run(engine, part):
+        await engine.start()
+        try:
+            records = []
+            for fen in part:
+                start = timer()
+                info = await engine.analyse(fen, movetime)
+                records.append((fen, info.info.get('depth', 0) if info else 0, 0, timer() - start))
+            return records
+        finally:
+            await engine.quit()
+    parts = await asyncio.gather(*(run(e, fens[i::len(engines)]) for i, e in enumerate(engines)))
+    return [r for part in parts for r in part]
+
+# The game line positions one after the other on the threaded Engine and on AsyncEngine: the time
+# over the movetime of each search. Then the same positions shared by --engines AsyncEngine on one loop
+def bench_async(args):
+    fens = game_positions(args.moves.split())
+    print(f'{len(fens)} positions, {args.movetime}ms each, engine {args.engine}')
+    print(f'{"client":22} {"seconds":>8} {"overhead ms/search":>18}')
+    def report(name, records, elapsed):
+        overhead = sum(r[3] for r in records) / len(records) * 1000 - args.movetime
+        print(f'{name:22} {elapsed:8.2f} {overhead:18.1f}')
+    start = timer()
+    records, _ = search_all(args, fens, continuity=False, ponder=False)
+    report('Engine (threads)', records, timer() - start)
+    start = timer()
+    records = asyncio.run(async_search_all([AsyncEngine(args.engine, continuity=False)], fens, args.movetime))
+    report('AsyncEngine', records, timer() - start)
+    if args.engines > 1:
+        start = timer()
+        records = asyncio.run(async_search_all([AsyncEngine(args.engine, continuity=False) for _ in range(args.engines)],
+                                               fens, args.movetime))
+        report(f'{args.engines} AsyncEngine, 1 loop', records, timer() - start)
+
+# Time from start_next_move to the first info line of that position, as Engine measure it.
+#   idle: the engine has finished the last search
+#   busy: the last search is still running, it has to be stopped first
+#   quick: the new position come --quick ms after the last one (the opponent move at once)
+def bench_latency(args):
+    fens = game_positions(args.moves.split())
+    print(f'{len(fens)} positions per scenario, {args.movetime}ms each, engine {args.engine}')
+    print(f'{"scenario":10} {"avg ms":>8} {"max ms":>8}')
+    engine = Engine(args.engine, continuity=False, ponder=False)
+    engine.add_event_listener(ResultCollector())
+    engine.uci_movetime = args.movetime
+    engine.start()
+    try:
+        for name, before in (('idle', None), ('busy', args.movetime / 2), ('quick', args.quick)):
+            latency = []
+            for i, fen in enumerate(fens):
+                if before is not None:
+                    engine.start_next_move(fens[i - 1])
+                    time.sleep(before / 1000)
+                # the position search start after the bestmove of the last one, so its first info is
+                # the last one recorded, after a late first info of the last search
+                engine.firstInfoLatency.clear()
+                engine.start_next_move(fen)
+                time.sleep(args.movetime / 1000 + 0.1)
+                if engine.firstInfoLatency:
+                    latency.append(engine.firstInfoLatency[-1])
+            print(f'{name:10} {sum(latency)/len(latency)*1000:8.1f} {max(latency)*1000:8.1f}')
+    finally:
+        engine.quit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='UCI engine adapter benchmarks')
+    parser.add_argument('-e', '--engine', default=DEFAULT_ENGPATH, help='engine executable')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p = sub.add_parser('continuity', help='reached depth with ucinewgame on every position vs the game continuity')
+    p.add_argument('-t', '--movetime', type=int, default=1000, help='ms per position')
+    p.add_argument('-m', '--moves', default=GAME_LINE, help='the game, UCI moves from the start position')
+    p.add_argument('-s', '--side', type=int, choices=[0, 1], default=0, help='searched side, 0: red, 1: black')
+    p.set_defaults(func=bench_continuity)
+
+    p = sub.add_parser('ponder', help='bestmove latency with and without pondering on the expected reply')
+    p.add_argument('-t', '--movetime', type=int, default=1000, help='ms per position')
+    p.add_argument('-w', '--wait', type=int, default=1500, help='ms the opponent think')
+    p.add_argument('-n', '--count', type=int, default=8, help='moves played')
+    p.set_defaults(func=bench_ponder)
+
+    p = sub.add_parser('pool', help='throughput of the engine pool for each number of processes')
+    p.add_argument('-p', '--pools', type=int, nargs='+', default=[1, 2, 4], help='pool sizes')
+    p.add_argument('-t', '--movetime', type=int, default=500, help='ms per position')
+    p.add_argument('-m', '--moves', default=GAME_LINE, help='the game, UCI moves from the start position')
+    p.add_argument('--threads', type=int, default=1, help='Threads of each process')
+    p.add_argument('--hash', type=int, default=64, help='Hash MB of each process')
+    p.set_defaults(func=bench_pool)
+
+    p = sub.add_parser('async', help='search overhead of the threaded Engine vs AsyncEngine')
+    p.add_argument('-t', '--movetime', type=int, default=300, help='ms per position')
+    p.add_argument('-m', '--moves', default=GAME_LINE, help='the game, UCI moves from the start position')
+    p.add_argument('-k', '--engines', type=int, default=4, help='AsyncEngine processes on one event loop')
+    p.set_defaults(func=bench_async)
+
+    p = sub.add_parser('latency', help='start_next_move to the first info of the position')
+    p.add_argument('-t', '--movetime', type=int, default=300, help='ms per position')
+    p.add_argument('-q', '--quick', type=int, default=30, help='ms between the two positions of the quick scenario')
+    p.add_argument('-m', '--moves', default=GAME_LINE, help='the game, UCI moves from the start position')
+    p.set_defaults(func=bench_latency)
+
+    args = parser.parse_args()
+    args.func(args)
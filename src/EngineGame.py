@@ -0,0 +1,201 @@
+from typing import List
+import logging
+
+logger = logging.getLogger()
+
+BOARD_WIDTH = 9
+BOARD_HEIGHT = 10
+START_FEN = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w - - 0 1'
+MAX_CHANGED_SQUARES = 4 # more than this between two searched positions is not 1 or 2 plies
+
+# the fen placement as 90 chars, rank 10 first, '.' for empty
+def fen_board(fen) -> List[str]:
+    board = []
+    for c in fen.split()[0]:
+        if c.isdigit():
+            board.extend('.' * int(c))
+        elif c != '/':
+            board.append(c)
+    if len(board) != BOARD_WIDTH*BOARD_HEIGHT:
+        raise ValueError(f'Bad fen placement "{fen}"')
+    return board
+
+def board_fen(board, side='w'):
+    rows = []
+    for row in range(BOARD_HEIGHT):
+        s, empty = '', 0
+        for p in board[row*BOARD_WIDTH:(row+1)*BOARD_WIDTH]:
+            if p == '.':
+                empty += 1
+                continue
+            s += f'{empty or ""}{p}'
+            empty = 0
+        rows.append(s + f'{empty or ""}')
+    return f'{"/".join(rows)} {side} - - 0 1'
+
+def fen_side(fen):
+    parts = fen.split()
+    return parts[1] if len(parts) > 1 else 'w'
+
+def square_name(index):
+    return f'{chr(ord("a") + index % BOARD_WIDTH)}{BOARD_HEIGHT - index // BOARD_WIDTH}'
+
+def square_index(name):
+    return (BOARD_HEIGHT - int(name[1:])) * BOARD_WIDTH + ord(name[0]) - ord('a')
+
+def move_name(src, dst):
+    return square_name(src) + square_name(dst)
+
+# board after the UCI move, no legality check
+def apply_move(board, move):
+    i = 2 if move[2].isalpha() else 3
+    src, dst = square_index(move[:i]), square_index(move[i:])
+    board = board[:]
+    board[dst], board[src] = board[src], '.'
+    return board
+
+def is_own(piece, side):
+    return piece != '.' and piece.isupper() == (side == 'w')
+
+def opposite(side):
+    return 'b' if side == 'w' else 'w'
+
+def piece_count(board):
+    count = {}
+    for p in board:
+        if p != '.':
+            count[p] = count.get(p, 0) + 1
+    return count
+
+# pieces between two squares of the same row or column
+def pieces_between(board, src, dst):
+    (r0, c0), (r1, c1) = divmod(src, BOARD_WIDTH), divmod(dst, BOARD_WIDTH)
+    dr, dc = (r1 > r0) - (r1 < r0), (c1 > c0) - (c1 < c0)
+    r, c, n = r0 + dr, c0 + dc, 0
+    while (r, c) != (r1, c1):
+        n += board[r*BOARD_WIDTH + c] != '.'
+        r, c = r + dr, c + dc
+    return n
+
+# The piece movement rules of a ply: how each piece move, blocked legs and eyes, the palace and the river.
+# Whether the mover king is left in check is not checked
+def is_valid_move(board, src, dst):
+    piece, target = board[src], board[dst]
+    red = piece.isupper()
+    (r0, c0), (r1, c1) = divmod(src, BOARD_WIDTH), divmod(dst, BOARD_WIDTH)
+    dr, dc = r1 - r0, c1 - c0
+    forward = -1 if red else 1 # red is at the bottom, rank 1 is the last row
+    def in_palace(r, c):
+        return 3 <= c <= 5 and (7 <= r <= 9 if red else 0 <= r <= 2)
+    def own_half(r):
+        return r >= 5 if red else r <= 4
+    match piece.upper():
+        case 'R':
+            return (dr == 0 or dc == 0) and pieces_between(board, src, dst) == 0
+        case 'C':
+            return (dr == 0 or dc == 0) and pieces_between(board, src, dst) == (0 if target == '.' else 1)
+        case 'N':
+            if sorted((abs(dr), abs(dc))) != [1, 2]:
+                return False
+            leg = (r0 + dr//2, c0) if abs(dr) == 2 else (r0, c0 + dc//2)
+            return board[leg[0]*BOARD_WIDTH + leg[1]] == '.'
+        case 'B':
+            return (abs(dr) == 2 and abs(dc) == 2 and own_half(r1)
+                    and board[(r0 + dr//2)*BOARD_WIDTH + c0 + dc//2] == '.')
+        case 'A':
+            return abs(dr) == 1 and abs(dc) == 1 and in_palace(r1, c1)
+        case 'K':
+            if target.upper() == 'K' and dc == 0: # the kings facing each other
+                return pieces_between(board, src, dst) == 0
+            return abs(dr) + abs(dc) == 1 and in_palace(r1, c1)
+        case 'P':
+            return (dr == forward and dc == 0) or (dr == 0 and abs(dc) == 1 and not own_half(r0))
+    return False
+
+# all the moves of side from old that can be part of reaching new: the piece leave a changed square,
+# land on a changed square or on a piece that can be taken back, as the piece moves
+def candidate_moves(board, side, changed):
+    for src in changed:
+        if not is_own(board[src], side):
+            continue
+        for dst in range(len(board)):
+            if (dst != src and not is_own(board[dst], side) and (dst in changed or board[dst] != '.')
+                    and is_valid_move(board, src, dst)):
+                yield src, dst
+
+# The plies from the position old to new, as UCI moves, None if there is not exactly one way.
+# The plies must follow the piece movements: the engine stop reading 'position ... moves' at the
+# first illegal one and would search a stale position. A takeback, or a wrong board from the monitor,
+# has no valid plies and the game history restart at the new position
+def infer_moves(old, oldSide, new, newSide):
+    changed = [i for i in range(len(old)) if old[i] != new[i]]
+    if not changed:
+        return [] if oldSide == newSide else None
+    if len(changed) > MAX_CHANGED_SQUARES:
+        return None
+    found = []
+    if oldSide != newSide:
+        for src, dst in candidate_moves(old, oldSide, changed):
+            if dst in changed and apply_move(old, move_name(src, dst)) == new:
+                found.append([move_name(src, dst)])
+    else:
+        for src, dst in candidate_moves(old, oldSide, changed):
+            first = move_name(src, dst)
+            board = apply_move(old, first)
+            after = [i for i in range(len(board)) if board[i] != new[i]]
+            for src2, dst2 in candidate_moves(board, opposite(oldSide), after):
+                if dst2 in after and apply_move(board, move_name(src2, dst2)) == new:
+                    found.append([first, move_name(src2, dst2)])
+    return found[0] if len(found) == 1 else None
+
+# Follow the game the engine is searching, from the positions it is asked for.
+# The moves between two positions are recovered from the board difference, so the engine get
+# 'position fen <start> moves ...' of the same game and keep its hash table. A new game is a board
+# with more of some piece than the last one, or the start position again
+class GameTracker:
+    def __init__(self) -> None:
+        self.reset()
+        self.newGames = 0 # positions sent with ucinewgame
+        self.followed = 0 # positions sent as moves of the current game
+        self.rerooted = 0 # same game, but the moves could not be found: sent as a new start fen
+
+    def reset(self):
+        self.startFen = None
+        self.moves: List[str] = []
+        self.board = None
+        self.side = None
+
+    # the state to go back to when the positions sent after it are dropped (a ponder miss)
+    def checkpoint(self):
+        return (self.startFen, self.moves[:], self.board, self.side)
+
+    def restore(self, state):
+        self.startFen, self.moves, self.board, self.side = state[0], state[1][:], state[2], state[3]
+
+    # return (newgame, start fen, moves) to send for the position fen
+    def update(self, fen):
+        board, side = fen_board(fen), fen_side(fen)
+        newgame = self.is_new_game(board)
+        if newgame:
+            self.startFen, self.moves = fen, []
+            self.newGames += 1
+        else:
+            moves = infer_moves(self.board, self.side, board, side)
+            if moves is None:
+                logger.info(f'Moves to "{fen}" not found, game history restart there')
+                self.startFen, self.moves = fen, []
+                self.rerooted += 1
+            else:
+                self.moves += moves
+                self.followed += 1
+        self.board, self.side = board, side
+        return newgame, self.startFen, self.moves[:]
+
+    def is_new_game(self, board):
+        if self.board is None or board == fen_board(START_FEN):
+            return True
+        last = piece_count(self.board)
+        return any(n > last.get(p, 0) for p, n in piece_count(board).items())
+
+def position_cmd(fen, moves=None):
+    return f'position fen {fen}' + (f' moves {" ".join(moves)}' if moves else '') + '\n'
@@ -0,0 +1,197 @@
+from concurrent.futures import Future
+from collections import deque
+from timeit import default_timer as timer
+from typing import List
+import logging, os, threading, time
+
+from EngineUCI import Engine, EngineEventListener, Move, DEFAULT_ENGPATH
+
+logger = logging.getLogger()
+
+POOL_THREADS = 1 # 'Threads' option of each engine process
+POOL_HASH = 64 # 'Hash' option of each engine process, MB
+POOL_MOVETIME = 1000 # ms per position when the request does not say
+POOL_DEADLINE_MARGIN = 5 # seconds after the movetime before a search without bestmove is a failed worker
+POOL_MAX_ATTEMPTS = 3 # searches of a request on failed workers before its future get the error
+POOL_WATCH_INTERVAL = 0.5 # seconds between two checks of the workers processes and deadlines
+
+class AnalysisRequest:
+    def __init__(self, fen, movetime) -> None:
+        self.fen = fen
+        self.movetime = movetime
+        self.future: Future = Future() # resolved with the Move of the bestmove (None if the engine had no info)
+        self.worker = None
+        self.attempts = 0 # searches started, the last one is running
+        self.deadline = None # time the bestmove is expected by
+
+    def result(self, timeout=None) -> Move:
+        return self.future.result(timeout)
+
+# One engine process of the pool, searching one request at a time
+class PoolWorker(EngineEventListener):
+    def __init__(self, pool, index) -> None:
+        self.pool = pool
+        self.index = index
+        self.request: AnalysisRequest = None
+        self.engine = Engine(pool.enginePath, options=pool.options, continuity=False, ponder=False)
+        self.engine.add_event_listener(self)
+        self.engine.start()
+        self.searched = 0
+        self.failed = False # replaced by a new worker
+
+    def search(self, request: AnalysisRequest):
+        self.request = request
+        request.worker = self
+        request.attempts += 1
+        request.deadline = timer() + request.movetime / 1000 + POOL_DEADLINE_MARGIN
+        self.engine.uci_movetime = request.movetime # the worker is idle, its command thread does not read it now
+        self.engine.start_next_move(request.fen)
+
+    def on_move_calculated(self, fen, info):
+        self.pool.search_done(self, fen, info)
+
+    def on_engine_fatal(self, msg):
+        self.pool.worker_failed(self, msg)
+
+    def quit(self):
+        self.engine.quit()
+
+    # the process is gone or the search is late, None when the worker is fine
+    def failure(self):
+        if self.engine.process.poll() is not None:
+            return f'process exited with {self.engine.process.returncode}'
+        request = self.request
+        if request is not None and timer() > request.deadline:
+            return f'no bestmove {request.movetime}ms + {POOL_DEADLINE_MARGIN}s after "{request.fen}"'
+        return None
+
+# N engine processes analysing positions in parallel. analyse() queue a position and return its request,
+# an idle worker take the oldest queued one. Each worker has at most one position, so a bestmove belong
+# to the request of the worker that sent it.
+# The listeners get on_move_calculated(fen, info) as from a single Engine, in the order the searches end.
+# A watch thread replace the workers whose process exited or whose search is past its deadline, the
+# request is searched again by another worker, POOL_MAX_ATTEMPTS times at most
+class EnginePool:
+    def __init__(self, size=None, enginePath=DEFAULT_ENGPATH, threads=POOL_THREADS, hash=POOL_HASH, options=None):
+        self.size = size or max(1, (os.cpu_count() or 1) // threads)
+        self.enginePath = enginePath
+        self.options = {**(options or {}), 'Threads': threads, 'Hash': hash}
+        self.movetime = POOL_MOVETIME
+        self.eventListeners: List[EngineEventListener] = []
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.workers: List[PoolWorker] = []
+        self.idle: List[PoolWorker] = []
+        self.stopping = False
+
+    def add_event_listener(self, listener: EngineEventListener):
+        self.eventListeners.append(listener)
+
+    def start(self):
+        self.stopping = False
+        self.workers = [PoolWorker(self, i) for i in range(self.size)]
+        self.idle = self.workers[:]
+        threading.Thread(target=self.watch, daemon=True).start()
+        logger.info(f'Engine pool started, {self.size} processes {self.options}')
+
+    # the queued requests are cancelled, the searched ones get an error, as the ones queued again after
+    # a failed worker: their future is running and cannot be cancelled
+    def quit(self):
+        self.stopping = True
+        with self.lock:
+            pending, self.pending = list(self.pending), deque()
+            searched = [w.request for w in self.workers if w.request is not None]
+            for worker in self.workers:
+                worker.request = None
+        for request in pending:
+            if request.future.running():
+                request.future.set_exception(RuntimeError(f'Engine pool stopped while searching "{request.fen}"'))
+            else:
+                request.future.cancel()
+        for request in searched:
+            request.future.set_exception(RuntimeError(f'Engine pool stopped while searching "{request.fen}"'))
+        for worker in self.workers:
+            worker.quit()
+
+    def analyse(self, fen, movetime=None) -> AnalysisRequest:
+        request = AnalysisRequest(fen, movetime or self.movetime)
+        with self.lock:
+            self.pending.append(request)
+        self.dispatch()
+        return request
+
+    def analyse_all(self, fens, movetime=None) -> List[AnalysisRequest]:
+        return [self.analyse(fen, movetime) for fen in fens]
+
+    def dispatch(self):
+        while True:
+            with self.lock:
+                if not self.pending or not self.idle or self.stopping:
+                    return
+                worker, request = self.idle.pop(0), self.pending.popleft()
+            if request.future.running() or request.future.set_running_or_notify_cancel(): # running: queued again after a failure
+                worker.search(request)
+            else:
+                with self.lock:
+                    self.idle.append(worker)
+
+    def search_done(self, worker: PoolWorker, fen, info):
+        with self.lock:
+            request = worker.request
+            if request is None or request.fen != fen:
+                logger.warning(f'Pool worker {worker.index}: bestmove of "{fen}" without its request')
+                return
+            worker.request = None
+            worker.searched += 1
+            self.idle.append(worker)
+        request.future.set_result(info)
+        for l in self.eventListeners:
+            l.on_move_calculated(fen, info)
+        self.dispatch()
+
+    # The request of the failed process is queued again, or fail after POOL_MAX_ATTEMPTS searches.
+    # A new process replace it. Called from the worker output thread and from the watch thread, the
+    # second call for the same worker does nothing
+    def worker_failed(self, worker: PoolWorker, msg):
+        with self.lock:
+            if self.stopping or worker.failed:
+                return
+            worker.failed = True
+            request, worker.request = worker.request, None
+            if worker in self.idle:
+                self.idle.remove(worker)
+        logger.error(f'Pool worker {worker.index} fatal: {msg}. Restarting')
+        worker.quit()
+        worker.engine.process.kill() # a hung process does not read the 'quit'
+        if request is not None and request.attempts >= POOL_MAX_ATTEMPTS:
+            logger.error(f'Pool request "{request.fen}" failed {request.attempts} times, given up')
+            request.future.set_exception(RuntimeError(f'Engine failed {request.attempts} times on "{request.fen}": {msg}'))
+            request = None
+        replacement = PoolWorker(self, worker.index)
+        with self.lock:
+            stopped = self.stopping
+            if not stopped:
+                self.workers[self.workers.index(worker)] = replacement
+                self.idle.append(replacement)
+                if request is not None:
+                    self.pending.appendleft(request)
+        if stopped: # quit while the replacement started
+            replacement.quit()
+            if request is not None:
+                request.future.set_exception(RuntimeError(f'Engine pool stopped while searching "{request.fen}"'))
+            return
+        for l in self.eventListeners:
+            l.on_engine_fatal(f'Pool worker {worker.index}: {msg}')
+        self.dispatch()
+
+    def watch(self):
+        while not self.stopping:
+            time.sleep(POOL_WATCH_INTERVAL)
+            for worker in self.workers[:]:
+                msg = worker.failure()
+                if msg is not None:
+                    self.worker_failed(worker, msg)
+
+    @property
+    def busy(self):
+        return self.size - len(self.idle)
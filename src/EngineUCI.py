@@ -1,20 +1,28 @@
 from queue import Queue, Empty
+from collections import deque
 from collections.abc import Iterable
 from abc import ABC, abstractmethod
 from enum import Enum
 from typing import List
-import time, sys, logging, os
+import sys, logging, os
 import subprocess
 import threading
+from timeit import default_timer as timer
 
 from pprint import PrettyPrinter
 
 from gvars import flog
+from EngineGame import GameTracker, position_cmd, fen_board, fen_side, board_fen, apply_move
 
 logger = logging.getLogger()
 
 DEFAULT_OPT = {'UCI_Variant':'xiangqi', 'UCI_Elo': 2850}
 ENGINE_EXE_NAME = 'fairy-stockfish_x86-64-bmi2.exe'
+ENGINE_PONDER = True # after our bestmove, search the expected reply while the opponent think ('go ponder')
+GAME_CONTINUITY = True # send the positions as moves of the current game, ucinewgame only on a new game (keep the hash table)
+SEARCH_STOP_TIMEOUT = 20 # seconds the engine has to answer a 'stop' with its bestmove, or a search after its movetime
+WATCHDOG_PERIOD = 1.0 # seconds between two checks of the running search deadline
+ENGINE_STATS_WINDOW = 50 # searches of the latency statistics
 # DEFAULT_ENGPATH = 'engine_exe/fairy-stockfish_x86-64-bmi2.exe'
 
 DEBUG_INFO= dict(id=0)
@@ -182,26 +190,60 @@ class EngineCmdType(Enum):
     SetFen = 1
     SetMovetime = 2
     SetMultipv = 3
+    Ponder = 4
 class EngineCmd:
     def __init__(self, action: EngineCmdType, params=None) -> None:
         self.action = action
         self.params = params
+        self.created = timer()
     def __str__(self) -> str:
         return f'{self.action} params={self.params}'
 
+class SearchState(Enum):
+    Idle = 0 # no search, the next one can start
+    Searching = 1 # 'go' sent, its bestmove not read yet
+    Stopping = 2 # 'stop' sent, its bestmove not read yet
+
+# One 'go' sent to the engine. The engine run one search at a time and answer each with one bestmove,
+# so the next bestmove read belong to the search in Engine.search
+class EngineSearch:
+    def __init__(self, id, fen, ponder=False, requested=None) -> None:
+        self.id = id
+        self.fen = fen
+        self.ponder = ponder # 'go ponder', until the ponderhit
+        self.requested = requested # time of the start_next_move, for the first info latency
+        self.infos: List[Move] = []
+        self.gotInfo = False
+        self.deadline = None # its bestmove is late after this time, None while pondering (no time limit)
+        self.hung = False # reported to the listeners as hung
+
 class Engine():
 
-    def __init__(self, enginePath=DEFAULT_ENGPATH, options=None):
+    def __init__(self, enginePath=DEFAULT_ENGPATH, options=None, continuity=GAME_CONTINUITY, ponder=ENGINE_PONDER):
         self.debid = get_debid()
         self.enginePath = enginePath
         self.options = DEFAULT_OPT if options is None else {**DEFAULT_OPT, **options}
+        if ponder:
+            self.options = {**self.options, 'Ponder': 'true'}
         self.uci_movetime = 2000
         self.uci_multipv = 1
         self.eventListeners: List[EngineEventListener] = []
+        self.continuity = continuity
+        self.game = GameTracker()
+        self.ponder = ponder
+        self.lastFen = None # last position asked
+        self.ponderGame = None # game state before the ponder position
+        self.ponderHits = 0
+        self.ponderMisses = 0
 
         self.commandQueue = Queue()
-        self.activefen = Queue(1)
-        self.timeoutqueue = Queue()
+        # search state machine: the command thread start and stop the searches, the output handler
+        # end them on their bestmove
+        self.stateCond = threading.Condition()
+        self.state = SearchState.Idle
+        self.search: EngineSearch = None
+        self.searchId = 0
+        self.firstInfoLatency = deque(maxlen=ENGINE_STATS_WINDOW) # seconds from start_next_move to the first info
 
         try:
             self.process = subprocess.Popen([self.enginePath], **subprocess_args())
@@ -276,7 +318,7 @@ class Engine():
         self.stopping = False
         self.start_output_handler()
         self.start_cmd_handler()
-        self.start_timeout_check()
+        self.start_watchdog()
 
     def quit(self):
         self.stopping = True
@@ -289,25 +331,28 @@ class Engine():
         for l in self.eventListeners:
             l.on_engine_fatal(msg)
 
-    def start_timeout_check(self):
-        def check():
-            while True:
-                x = self.timeoutqueue.get()
-                # logger.info(f'Timeout check start {self.debid} {x}')
-                try:
-                    x2 = self.timeoutqueue.get(timeout=20)
-                    if x2 != x:
-                         logger.fatal(f'Timeout mismtach "{x}" "{x2}"')
-                         exit()
-                    # else:
-                    #     logger.info(f'Timeout check done {self.debid} {x}')
-                except Empty:
-                    # logger.error(f'Timeout for "{x}"')
-                    # raise Exception(f'** Error: Timeout for "{x}"')
-                    self.send_event_fatal(f'Timeout for "{x}"')
-                    break
-                    # break
-        threading.Thread(target=check, daemon=True).start()
+    # a search without bestmove after its deadline: the engine hung, tell the listeners once
+    def report_hung(self, msg):
+        with self.stateCond:
+            search = self.search
+            if search is None or search.hung:
+                return
+            search.hung = True
+        logger.error(msg)
+        self.send_event_fatal(msg)
+
+    # the engine may hang in a search that nobody stop (no new position coming), wait_idle only
+    # see it on the next position
+    def start_watchdog(self):
+        def watch():
+            while not self.stopping:
+                with self.stateCond:
+                    self.stateCond.wait(WATCHDOG_PERIOD)
+                    search, state = self.search, self.state
+                if search is not None and search.deadline is not None and timer() > search.deadline:
+                    self.report_hung(f'No bestmove for "{search.fen}", {state.name.lower()} for too long')
+
+        threading.Thread(target=watch, daemon=True).start()
 
     def send_cmd(self, action: EngineCmdType, params=None):
         self.commandQueue.put(EngineCmd(action, params))
@@ -318,7 +363,10 @@ class Engine():
 
             if cmd.action == EngineCmdType.Quit:
                 logger.info('Adapter execute finished')
-                self.write_nolock('stop\n', 'quit\n')
+                try:
+                    self.write_nolock('stop\n', 'quit\n')
+                except OSError: # the process already exited
+                    pass
                 return
             
             precmd = None
@@ -344,10 +392,12 @@ class Engine():
                 try:
                     match cmd.action:
                         case EngineCmdType.SetFen:
-                            self.set_fen(cmd.params)
+                            self.set_fen(cmd.params, cmd.created)
                         case EngineCmdType.SetMovetime:
                             self.uci_movetime = int(cmd.params)*1000
                             logger.info(f'[Engine] set movetime = {self.uci_movetime}')
+                        case EngineCmdType.Ponder:
+                            self.start_ponder(*cmd.params)
                         case EngineCmdType.SetMultipv:
                             self.uci_multipv = cmd.params
                             self.write_nolock(f'setoption name MultiPV value {self.uci_multipv}\n')
@@ -359,28 +409,83 @@ class Engine():
 
         threading.Thread(target=fen_execute, daemon=True).start()
 
-    def set_fen(self, fen):
+    def set_fen(self, fen, requested=None):
         # dont need the lock, we only handle the UCI in one thread
-        self.write_nolock('stop\n')
-        # this will be blocked until the last active fen got the bestmove
+        self.lastFen = fen
+        with self.stateCond:
+            search = self.search
+            if search is not None and search.ponder and fen == search.fen:
+                # the ponder search go on as the normal search of fen, its bestmove come after the movetime
+                # counted from the 'go ponder', so at once when the opponent took longer than that
+                logger.info(f'Ponder hit {self.debid} search {search.id} "{fen}"')
+                search.ponder = False
+                search.deadline = timer() + self.uci_movetime/1000 + SEARCH_STOP_TIMEOUT
+                self.ponderHits += 1
+                self.write_nolock('ponderhit\n')
+                return
+        if search is not None and search.ponder:
+            logger.info(f'Ponder miss {self.debid} "{fen}"')
+            self.ponderMisses += 1
+            self.game.restore(self.ponderGame) # the ponder bestmove is dropped by the output handler
         logger.info(f'Start process move {self.debid} "{fen}"')
-        self.timeoutqueue.put(fen) # start timeout
-        self.activefen.put(fen)
-        self.timeoutqueue.put(fen) # stop timeout
+        if not self.wait_idle():
+            self.report_hung(f'Timeout for "{fen}"')
+            return
         logger.info(f'Get move for {self.debid} {self.uci_movetime} "{fen}" ...')
-        self.write_nolock('ucinewgame\n',
-                          f'position fen {fen}\n',
-                          f'go movetime {self.uci_movetime}\n')
-        time.sleep(0.1) # we need to make sure the UCI receive the 'go' command, not sure what is the best way...
+        self.begin_search(fen, f'go movetime {self.uci_movetime}\n', requested=requested)
+
+    # stop the running search, the next one can start once the engine answered with its bestmove
+    def wait_idle(self):
+        with self.stateCond:
+            if self.state == SearchState.Searching:
+                self.state = SearchState.Stopping
+                deadline = timer() + SEARCH_STOP_TIMEOUT
+                self.search.deadline = deadline if self.search.deadline is None else min(self.search.deadline, deadline)
+                self.write_nolock('stop\n')
+            return self.stateCond.wait_for(lambda: self.state == SearchState.Idle, SEARCH_STOP_TIMEOUT)
+
+    # stateCond is reentrant, start_ponder call it with the condition held
+    def begin_search(self, fen, go, ponder=False, requested=None):
+        cmds = self.position_cmds(fen)
+        with self.stateCond:
+            self.searchId += 1
+            self.search = EngineSearch(self.searchId, fen, ponder, requested)
+            if not ponder:
+                self.search.deadline = timer() + self.uci_movetime/1000 + SEARCH_STOP_TIMEOUT
+            self.state = SearchState.Searching
+        self.write_nolock(*cmds, go)
+
+    # Search the position after our bestmove and the expected reply while the opponent think.
+    # Queued by the output handler on bestmove, dropped when a newer position was asked since.
+    # The idle check and the start of the search are one step of the state machine
+    def start_ponder(self, fen, bestmove, ponder):
+        try:
+            ponderFen = board_fen(apply_move(apply_move(fen_board(fen), bestmove), ponder), fen_side(fen))
+        except Exception as e:
+            logger.warning(f'Cannot ponder {bestmove} {ponder} from "{fen}": {e}')
+            return
+        with self.stateCond:
+            if fen != self.lastFen or self.state != SearchState.Idle:
+                return
+            logger.info(f'Ponder {self.debid} {bestmove} {ponder} "{ponderFen}"')
+            self.ponderGame = self.game.checkpoint()
+            self.begin_search(ponderFen, f'go ponder movetime {self.uci_movetime}\n', ponder=True)
+
+    def position_cmds(self, fen):
+        if not self.continuity:
+            return ['ucinewgame\n', position_cmd(fen)]
+        newgame, start, moves = self.game.update(fen)
+        return (['ucinewgame\n'] if newgame else []) + [position_cmd(start, moves)]
 
     def start_output_handler(self):
         def read_output():
-            infos = []
             try:
                 # for line in self.read():
                 # repeatcnt = 0
                 while not self.stopping:
                     line = self.process.stdout.readline()
+                    if line == '': # end of the pipe, the process exited
+                        break
                     flog('uci_outlog',line)
                     # if line=='':
                     #     repeatcnt += 1
@@ -395,20 +500,33 @@ class Engine():
                     if len(items) == 0:
                         continue
                     if items[0] == 'info':
+                        search = self.search
+                        if search is None:
+                            continue
+                        if not search.gotInfo:
+                            search.gotInfo = True
+                            if search.requested is not None:
+                                self.firstInfoLatency.append(timer() - search.requested)
                         info = Move.parse(items)
                         if info:
-                            infos.append(info)
+                            search.infos.append(info)
                     elif items[0] == 'bestmove':
                         bestmove, ponder = items[1], None if len(items)<4 else items[3]
-                        try:
-                            fen = self.activefen.get_nowait()
-                            logger.info(f'Found bestmove for "{fen}" {bestmove} {ponder}')
-                            info = parse_movelist(infos, (bestmove, ponder)) 
-                            self.send_move_calculated_event(fen, info)
-                            infos = []
-                        except Empty:
+                        with self.stateCond:
+                            search, self.search = self.search, None
+                            self.state = SearchState.Idle
+                            self.stateCond.notify_all()
+                        if search is None:
                             logger.warning(f'Receiving bestmove log where not expected {bestmove} {ponder}')
-                        
+                        elif search.ponder:
+                            logger.info(f'Ponder search {search.id} stopped "{search.fen}" {bestmove}')
+                        else:
+                            logger.info(f'Found bestmove for search {search.id} "{search.fen}" {bestmove} {ponder}')
+                            info = parse_movelist(search.infos, (bestmove, ponder))
+                            self.send_move_calculated_event(search.fen, info)
+                            if self.ponder and ponder is not None:
+                                self.send_cmd(EngineCmdType.Ponder, (search.fen, bestmove, ponder))
+
             except RuntimeError:
                 pass
 
@@ -436,5 +554,9 @@ class Engine():
     def set_multipv(self, val):
         self.send_cmd(EngineCmdType.SetMultipv, val)
 
+    @property
+    def avgFirstInfo(self):
+        return sum(self.firstInfoLatency) / len(self.firstInfoLatency) if self.firstInfoLatency else 0.0
+
     def pp(self, x):
         self.pprinter(x)
@@ -164,6 +164,8 @@ class HelperEngine(EngineEventListener, BoardMonitorListener, ABC):
         self.lastFenFull = ''
         self.mySideMoveNext = True
         self.lastMonitor = MonitorResult()
+        if self.monitor:
+            self.monitor.request_update() # the board did not change, the monitor would not send it again
         self.add_log('Forced my side move next')
 
     # def send_guicmd(self, action: GUIActionCmd, params):
@@ -0,0 +1,79 @@
+import argparse, glob, json, logging
+import xml.etree.ElementTree as ET
+from timeit import default_timer as timer
+from urllib.parse import quote
+
+from BoardMonitor.XqchessMonitor import XqchessMonitor, serialize_nodes, tree_nodes
+
+logging.basicConfig(level=logging.WARNING, format='%(module)-20s: %(message)s')
+
+# Benchmark the XqchessMonitor scraping on saved board snapshots.
+# A snapshot is the innerHTML of the .xq-board-wrap element, as html_scrapping get it:
+#   driver.find_element(By.CLASS_NAME, 'xq-board-wrap').get_attribute('innerHTML')
+#   python XqchessBench.py serialize snapshots/*.html
+#   python XqchessBench.py serialize snapshots/*.html --live   # through a headless Chrome
+
+def load_snapshots(paths):
+    shots = []
+    for pattern in paths:
+        for fname in sorted(glob.glob(pattern)):
+            with open(fname, encoding='utf-8') as f:
+                shots.append((fname, f.read()))
+    return shots
+
+def timeit(func, repeat):
+    start = timer()
+    for _ in range(repeat):
+        res = func()
+    return (timer() - start) / repeat * 1000, res
+
+def monitor(driver=None, scanMode='scrape'):
+    mon = XqchessMonitor()
+    mon.do_init({'wdriver': driver, 'scanMode': scanMode})
+    return mon
+
+def result_fields(res):
+    return (res.fenfull, list(res.lastMovePosition), list(res.lastMoveFrom), res.mySide.name)
+
+# ET.fromstring of the whole markup vs the compact serializer.
+# Offline, only the Python side is timed: the compact string comes from serialize_nodes, the Python twin
+# of COMPACT_BOARD_JS. With --live, each snapshot is loaded in Chrome and the full scrape is timed,
+# WebDriver round trip included
+def bench_serialize(args):
+    driver = None
+    if args.live:
+        from selenium import webdriver
+        options = webdriver.ChromeOptions()
+        options.add_argument('--headless=new')
+        driver = webdriver.Chrome(options=options)
+    scrape, compact = monitor(driver, 'scrape'), monitor(driver, 'compact')
+    print(f'{"snapshot":40} {"html B":>8} {"compact B":>9} {"ET ms":>8} {"compact ms":>10} {"speedup":>8}  match')
+    try:
+        for fname, html in load_snapshots(args.snapshots):
+            board = serialize_nodes(tree_nodes(ET.fromstring(html)))
+            if driver is not None:
+                driver.get('data:text/html,' + quote(f'<div class="xq-board-wrap">{html}</div>'))
+                told, rold = timeit(scrape.html_scrapping, args.repeat)
+                tnew, rnew = timeit(compact.compact_scrapping, args.repeat)
+            else:
+                told, rold = timeit(lambda: scrape.parse_nodes(tree_nodes(ET.fromstring(html))), args.repeat)
+                tnew, rnew = timeit(lambda: compact.parse_compact(*board), args.repeat)
+            match = 'OK' if result_fields(rold) == result_fields(rnew) else f'MISMATCH {result_fields(rold)} {result_fields(rnew)}'
+            print(f'{fname:40} {len(html.encode()):8} {len(json.dumps(board)):9} {told:8.3f} {tnew:10.3f} {told/tnew:7.1f}x  {match}')
+    finally:
+        if driver is not None:
+            driver.quit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='XqchessMonitor benchmarks')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p = sub.add_parser('serialize', help='whole board markup + ET.fromstring vs the compact in-page serializer')
+    p.add_argument('snapshots', nargs='+', help='board snapshot files (glob allowed)')
+    p.add_argument('-n', '--repeat', type=int, default=200)
+    p.add_argument('--live', action='store_true', help='load the snapshots in a headless Chrome, time the WebDriver calls')
+    p.set_defaults(func=bench_serialize)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,130 @@
+import argparse, json, logging, os, sys
+from timeit import default_timer as timer
+
+from BoardMonitor.BaseMonitor import BoardMonitorListener, MonitorMsgSeverity
+from BoardMonitor.XqchessMonitor import XqchessMonitor
+from BoardMonitor.SnapshotDriver import SnapshotDriver, BrowserSnapshotDriver
+
+logging.basicConfig(level=logging.WARNING, format='%(module)-20s: %(message)s')
+
+SCAN_MODES = ['scrape', 'compact', 'observer']
+BROWSERS = ['chrome', 'firefox']
+CHECKED_FIELDS = ('fenfull', 'lastMove', 'lastMoveFrom', 'mySide')
+
+# Replay saved xqchess board snapshots through XqchessMonitor at full speed, without a browser:
+#   python XqchessReplay.py snapshots/ --update            # record snapshots/expected.json
+#   python XqchessReplay.py snapshots/ -m scrape compact   # check each mode against it, report the throughput
+#   python XqchessReplay.py snapshots/ --browser chrome     # same, the in-page scripts run in a headless Chrome
+# A snapshot is the innerHTML of .xq-board-wrap, saved with
+#   driver.find_element(By.CLASS_NAME, 'xq-board-wrap').get_attribute('innerHTML')
+# The snapshots are replayed in name order, the observer mode see the changes from one to the next
+
+class MessageCollector(BoardMonitorListener):
+    def __init__(self) -> None:
+        self.msgs = []
+
+    def on_monitor_msg(self, level: MonitorMsgSeverity, msg: str):
+        self.msgs.append(f'{level.name}: {msg}')
+
+    def on_board_updated(self, mon):
+        pass
+
+def result_record(res):
+    if res is None:
+        return None
+    return {
+        'fen': res.fen,
+        'fenfull': res.fenfull,
+        'lastMove': list(res.lastMovePosition),
+        'lastMoveFrom': list(res.lastMoveFrom),
+        'mySide': res.mySide.name,
+    }
+
+def open_browser(name):
+    from selenium import webdriver
+    if name == 'firefox':
+        options = webdriver.FirefoxOptions()
+        options.add_argument('-headless')
+        return webdriver.Firefox(options=options)
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless=new')
+    return webdriver.Chrome(options=options)
+
+# one pass over the snapshots, return ({name: record}, seconds, messages)
+# browser: a selenium WebDriver to run the in-page scripts in, None to compute their results in Python
+def replay(snapshots, mode, browser=None):
+    driver = SnapshotDriver(snapshots) if browser is None else BrowserSnapshotDriver(browser, snapshots)
+    mon = XqchessMonitor()
+    collector = MessageCollector()
+    mon.add_event_listener(collector)
+    mon.do_init({'wdriver': driver, 'scanMode': mode})
+    records = {}
+    start = timer()
+    for _ in snapshots:
+        res = mon.do_board_scan()
+        records[driver.current] = result_record(res)
+    return records, timer() - start, collector.msgs
+
+def check(records, expected):
+    errors = []
+    for name, want in expected.items():
+        got = records.get(name)
+        if got is None:
+            errors.append(f'{name}: no result')
+            continue
+        for field in CHECKED_FIELDS:
+            if got[field] != want.get(field):
+                errors.append(f'{name}: {field} {got[field]} expected {want.get(field)}')
+    return errors
+
+def run(args):
+    browser = open_browser(args.browser) if args.browser else None
+    try:
+        return run_replays(args, browser)
+    finally:
+        if browser is not None:
+            browser.quit()
+
+def run_replays(args, browser):
+    snapshots = SnapshotDriver.from_path(args.snapshots).snapshots
+    expectedFile = args.expected or os.path.join(args.snapshots if os.path.isdir(args.snapshots) else '.', 'expected.json')
+    if args.update:
+        records, _, msgs = replay(snapshots, args.modes[0], browser)
+        with open(expectedFile, 'w') as f:
+            json.dump(records, f, indent=1)
+        print(f'{len(records)} results of the {args.modes[0]} mode written to {expectedFile}')
+        for msg in msgs:
+            print(f'  {msg}')
+        return 0
+    with open(expectedFile) as f:
+        expected = json.load(f)
+    failed = 0
+    print(f'{len(snapshots)} snapshots, checked against {expectedFile}')
+    print(f'{"mode":10} {"frames/s":>10} {"ms/frame":>9}  result')
+    for mode in args.modes:
+        best = None
+        for _ in range(args.repeat):
+            records, elapsed, msgs = replay(snapshots, mode, browser)
+            best = elapsed if best is None else min(best, elapsed)
+        errors = check(records, expected)
+        failed += bool(errors)
+        print(f'{mode:10} {len(snapshots)/best:10.0f} {best/len(snapshots)*1000:9.3f}  {"OK" if not errors else f"{len(errors)} errors"}')
+        for e in errors[:args.max_errors]:
+            print(f'  {e}')
+        if args.verbose:
+            for msg in msgs:
+                print(f'  {msg}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay saved xqchess board snapshots through XqchessMonitor')
+    parser.add_argument('snapshots', help='directory, file or glob pattern of board snapshots')
+    parser.add_argument('-e', '--expected', help='expected results, default expected.json in the snapshot directory')
+    parser.add_argument('-m', '--modes', nargs='+', choices=SCAN_MODES, default=SCAN_MODES)
+    parser.add_argument('-n', '--repeat', type=int, default=20, help='passes per mode, the fastest is reported')
+    parser.add_argument('-b', '--browser', choices=BROWSERS, help='run the in-page scripts in this headless browser')
+    parser.add_argument('--update', action='store_true', help='write the expected results from the first mode')
+    parser.add_argument('--max-errors', type=int, default=10)
+    parser.add_argument('-v', '--verbose', action='store_true', help='print the monitor messages')
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,162 @@
+import argparse, glob, json, logging, os, tarfile
+import cv2
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer as timer
+
+from BoardMonitor.BaseMonitor import BoardMonitorListener, MonitorMsgSeverity
+from BoardMonitor.ZigaMonitor import ZigaMonitor
+
+logging.basicConfig(level=logging.WARNING, format='%(module)-20s: %(message)s')
+logger = logging.getLogger()
+
+IMAGE_EXT = ('.png', '.jpg', '.jpeg', '.bmp')
+PENDING_PER_WORKER = 4 # images queued per worker, bound the memory used by tar members in flight
+
+# Recognize a corpus of saved screenshots with ZigaMonitor.scan_image, one JSON line per image:
+#   python ZigaBatch.py shots/ -o shots.jsonl
+#   python ZigaBatch.py shots.tar.gz -o shots.jsonl -j 8
+# The output is also the checkpoint: running the same command again skip the images already in it
+
+class MessageCollector(BoardMonitorListener):
+    def __init__(self) -> None:
+        self.msgs = []
+
+    def on_monitor_msg(self, level: MonitorMsgSeverity, msg: str):
+        self.msgs.append(f'{level.name}: {msg}')
+
+    def on_board_updated(self, mon):
+        pass
+
+# one monitor per worker process, the patterns are loaded once by init_worker
+monitor: ZigaMonitor = None
+collector: MessageCollector = None
+
+def init_worker(params):
+    global monitor, collector
+    monitor = ZigaMonitor()
+    monitor.do_init({'incremental': False, **params}) # screenshots are unrelated to each other
+    collector = MessageCollector()
+    monitor.add_event_listener(collector)
+
+# data: file path, or the encoded image of a tar member
+def recognize(name, data):
+    start = timer()
+    rec = {'image': name}
+    try:
+        if isinstance(data, bytes):
+            img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        else:
+            img = cv2.imread(data, cv2.IMREAD_GRAYSCALE)
+        loaded = timer()
+        if img is None:
+            rec['error'] = 'cannot decode image'
+        else:
+            collector.msgs.clear()
+            monitor.lastScanRegion = None
+            monitor.lastLocate = -np.inf # each screenshot may have its own zoom
+            res = monitor.scan_image(img)
+            if res is None:
+                rec['error'] = 'board not found'
+            else:
+                rec['fen'] = res.fen
+                rec['fenfull'] = res.fenfull
+                rec['sideToMove'] = res.moveSide.opponent.fen
+                rec['mySide'] = res.mySide.fen
+                rec['lastMove'] = None if res.lastMovePosition is None else [int(v) for v in res.lastMovePosition]
+            if collector.msgs:
+                rec['messages'] = collector.msgs[:]
+        rec['loadMs'] = round((loaded - start) * 1000, 2)
+        rec['scanMs'] = round((timer() - loaded) * 1000, 2)
+    except Exception as e:
+        rec['error'] = f'{type(e).__name__}: {e}'
+    return rec
+
+# yield (name, data) of each image of a directory, tar or glob pattern, in a stable order
+def iter_images(source):
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for fname in sorted(files):
+                if fname.lower().endswith(IMAGE_EXT):
+                    path = os.path.join(root, fname)
+                    yield os.path.relpath(path, source), path
+    elif os.path.isfile(source) and tarfile.is_tarfile(source):
+        with tarfile.open(source, 'r|*') as tar: # streaming, members are read in archive order
+            for member in tar:
+                if member.isfile() and member.name.lower().endswith(IMAGE_EXT):
+                    yield member.name, tar.extractfile(member).read()
+    else:
+        for path in sorted(glob.glob(source)):
+            if path.lower().endswith(IMAGE_EXT):
+                yield path, path
+
+# read the images already done from a previous output, and drop a partly written last line
+def load_checkpoint(outPath):
+    done = set()
+    if not os.path.exists(outPath):
+        return done
+    good = 0
+    with open(outPath, 'rb') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['image'])
+            except (ValueError, KeyError):
+                break
+            good += len(line)
+    if good != os.path.getsize(outPath):
+        logger.warning(f'Drop the incomplete tail of {outPath}')
+        with open(outPath, 'rb+') as f:
+            f.truncate(good)
+    return done
+
+def run(args):
+    done = set() if args.restart else load_checkpoint(args.output)
+    if done:
+        print(f'Resume: {len(done)} images already in {args.output}')
+    params = {'scanMode': args.mode, 'cellCacheSize': args.cache}
+    workers = args.jobs or os.cpu_count()
+    count, failed, scanMs = 0, 0, 0.0
+    start = timer()
+    with open(args.output, 'w' if args.restart else 'a') as out, \
+         ProcessPoolExecutor(workers, initializer=init_worker, initargs=(params,)) as pool:
+        pending = deque()
+        def write_oldest():
+            nonlocal count, failed, scanMs
+            rec = pending.popleft().result()
+            out.write(json.dumps(rec) + '\n')
+            out.flush() # a line is only in the checkpoint once it is fully written
+            count += 1
+            failed += 'error' in rec
+            scanMs += rec.get('scanMs', 0)
+            if args.progress and count % args.progress == 0:
+                print(f'{count} images, {count / (timer() - start):.1f} img/s')
+        try:
+            for name, data in iter_images(args.source):
+                if name in done:
+                    continue
+                pending.append(pool.submit(recognize, name, data))
+                if len(pending) >= workers * PENDING_PER_WORKER:
+                    write_oldest()
+            while pending:
+                write_oldest()
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            print('Interrupted, run again to resume')
+            raise
+    elapsed = timer() - start
+    print(f'{count} images in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} img/s, '
+          f'{scanMs / max(count, 1):.1f}ms scan per image), {failed} failed, {workers} workers')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recognize the boards of saved Ziga screenshots')
+    parser.add_argument('source', help='directory, tar file or glob pattern of screenshots')
+    parser.add_argument('-o', '--output', required=True, help='JSONL output, also used as checkpoint')
+    parser.add_argument('-j', '--jobs', type=int, help='number of worker processes, default the number of cores')
+    parser.add_argument('-m', '--mode', choices=['batch', 'loop'], default='batch')
+    parser.add_argument('--cache', type=int, default=1024, help='cell cache size of each worker, 0 to disable')
+    parser.add_argument('--restart', action='store_true', help='ignore the existing output and start over')
+    parser.add_argument('--progress', type=int, default=0, help='print the progress every N images')
+    run(parser.parse_args())
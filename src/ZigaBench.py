@@ -0,0 +1,336 @@
+import argparse, glob, logging, os, time
+import cv2
+import numpy as np
+from timeit import default_timer as timer
+
+from BoardMonitor.ZigaMonitor import ZigaMonitor, PEAK_BACKENDS, PATTERN_PATH, PATTERN_SCALE, find_pattern
+from BoardMonitor.PatternPack import PatternPack, compile_pack, packs
+from BoardMonitor.BaseMonitor import BoardMonitorListener
+from BoardMonitor.ScreenCapture import CAPTURE_BACKENDS, FrameBufferPool, create_capture
+
+logging.basicConfig(level=logging.WARNING, format='%(module)-20s: %(message)s')
+
+# Benchmark the ZigaMonitor pipeline on saved screenshots.
+# Run from src/ so the pattern path resolve:
+#   python ZigaBench.py classify shots/*.png
+
+def load_shots(paths):
+    shots = []
+    for pattern in paths:
+        for fname in sorted(glob.glob(pattern)):
+            img = cv2.imread(fname, 0)
+            if img is None:
+                print(f'** Skip {fname}: cannot read')
+                continue
+            shots.append((fname, img))
+    return shots
+
+def timeit(func, repeat):
+    start = timer()
+    for _ in range(repeat):
+        res = func()
+    return (timer() - start) / repeat * 1000, res
+
+def bench_classify(args):
+    mon = ZigaMonitor()
+    mon.do_init()
+    print(f'{"screenshot":40} {"loop ms":>9} {"batch ms":>9} {"speedup":>8}  match')
+    for fname, img in load_shots(args.shots):
+        mon.lastScanRegion = None
+        board = mon.crop_image(img)
+        if board is None:
+            print(f'{fname:40} board not found')
+            continue
+        tloop, ploop = timeit(lambda: mon.scan_cells_loop(board), args.repeat)
+        tbatch, pbatch = timeit(lambda: mon.scan_cells_batch(board), args.repeat)
+        diff = [(r,c) for r in range(len(ploop)) for c in range(len(ploop[r])) if ploop[r][c] != pbatch[r][c]]
+        print(f'{fname:40} {tloop:9.2f} {tbatch:9.2f} {tloop/tbatch:7.1f}x  {"OK" if not diff else diff}')
+        if args.verbose:
+            print(np.array2string(mon.cellConfidence, precision=2, max_line_width=200))
+
+def bench_occupancy(args):
+    mon = ZigaMonitor()
+    # no cell cache: the scans repeat on the same board, they would be cache hits
+    mon.do_init(dict(scanMode=args.mode, occupancyThresh=None, cellCacheSize=0, incremental=False))
+    print(f'{"screenshot":40} {"thresh":>6} {"ms":>8} {"empty":>6} {"saved":>6}  match')
+    for fname, img in load_shots(args.shots):
+        mon.lastScanRegion = None
+        board = mon.crop_image(img) # then the scans only find the border at the board size
+        if board is None:
+            print(f'{fname:40} board not found')
+            continue
+        mon.classifier.occupancyThresh = None
+        tref, ref = timeit(lambda: mon.scan_image(board), args.repeat)
+        print(f'{fname:40} {"off":>6} {tref:8.2f} {0:6} {0:6}  -')
+        for thresh in args.thresh:
+            mon.classifier.occupancyThresh = thresh
+            t, res = timeit(lambda: mon.scan_image(board), args.repeat)
+            saved = mon.templateCallsSaved
+            diff = [(r,c) for r in range(len(ref.positions)) for c in range(len(ref.positions[r]))
+                    if ref.positions[r][c] != res.positions[r][c]]
+            print(f'{"":40} {thresh:6.2f} {t:8.2f} {mon.emptyCells:6} {saved:6}  {"OK" if not diff else diff}')
+
+# paste the board of a screenshot into a noisy screen of each size, and time the border search
+def bench_locate(args):
+    mon = ZigaMonitor()
+    mon.do_init(dict(pyramidScale=args.scale))
+    rng = np.random.default_rng(0)
+    print(f'{"screenshot":40} {"screen":>10} {"full ms":>9} {"pyramid ms":>10} {"speedup":>8} {"pyramid":>8} {"fallback":>8} {"find_board":>10}')
+    for fname, img in load_shots(args.shots):
+        mon.lastScanRegion = None
+        board = mon.crop_image(img)
+        if board is None:
+            print(f'{fname:40} board not found')
+            continue
+        H, W = board.shape
+        for size in args.sizes:
+            sw, sh = map(int, size.split('x'))
+            tfull = tpyr = tboard = 0
+            pyrOK = boardOK = fallback = 0
+            # the board at --offsets random places: the pyramid alone, and find_board that fall back on a miss
+            for _ in range(args.offsets):
+                screen = rng.integers(0, 256, (sh, sw), dtype=np.uint8)
+                x, y = rng.integers(0, sw-W), rng.integers(0, sh-H)
+                screen[y:y+H, x:x+W] = board
+                t, pfull = timeit(lambda: mon.find_border(screen), args.repeat)
+                tfull += t
+                t, ppyr = timeit(lambda: mon.find_border_pyramid(screen), args.repeat)
+                tpyr += t
+                misses = mon.pyramidMisses
+                mon.lastFullSearch = -np.inf # time the fallback on every miss, the monitor only run it once in a while
+                t, pboard = timeit(lambda: mon.find_board(screen), args.repeat)
+                tboard += t
+                fallback += mon.pyramidMisses > misses
+                pyrOK += len(ppyr) == 1 and np.array_equal(ppyr[0], (x,y))
+                boardOK += len(pboard) == 1 and np.array_equal(pboard[0], (x,y)) and np.array_equal(pboard, pfull)
+            n = args.offsets
+            print(f'{fname:40} {size:>10} {tfull/n:9.2f} {tboard/n:10.2f} {tfull/tboard:7.1f}x '
+                  f'{pyrOK:4}/{n:<3} {fallback:4}/{n:<3} {boardOK:6}/{n:<3}')
+
+# scan the screenshots as a frame sequence, full scan on every frame, with and without the cell cache
+def bench_cache(args):
+    shots = load_shots(args.shots)
+    print(f'{"cache size":>10} {"ms/frame":>9} {"hits":>6} {"misses":>6} {"hit rate":>8}')
+    ref = None
+    for size in [0] + args.sizes:
+        mon = ZigaMonitor()
+        mon.do_init(dict(incremental=False, cellCacheSize=size))
+        fens = []
+        start = timer()
+        for _ in range(args.repeat):
+            for fname, img in shots:
+                res = mon.scan_image(img)
+                fens.append(None if res is None else res.fen)
+        t = (timer() - start) / max(len(fens), 1) * 1000
+        ref = ref or fens
+        cache = mon.cellCache
+        if cache is None:
+            print(f'{"off":>10} {t:9.2f} {"-":>6} {"-":>6} {"-":>8}')
+        else:
+            print(f'{size:10} {t:9.2f} {cache.hits:6} {cache.misses:6} {cache.hitRate:8.1%}  {"OK" if fens == ref else "MISMATCH"}')
+
+# cell classification latency for 1 up to the number of cores worker threads
+def bench_workers(args):
+    shots = load_shots(args.shots)
+    maxWorkers = args.max or os.cpu_count()
+    print(f'{"mode":6} {"workers":>7} {"ms/frame":>9} {"speedup":>8}  match')
+    for mode in args.modes:
+        ref, tref = None, None
+        for workers in range(1, maxWorkers+1):
+            mon = ZigaMonitor()
+            mon.do_init(dict(scanMode=mode, incremental=False, cellCacheSize=0, scanWorkers=workers))
+            total, res = 0, []
+            for fname, img in shots:
+                mon.lastScanRegion = None
+                board = mon.crop_image(img)
+                if board is None:
+                    continue
+                t, pos = timeit(lambda: mon.scan_cells(board), args.repeat)
+                total += t
+                res.append(pos)
+            t = total / max(len(res), 1)
+            ref, tref = ref or res, tref or t
+            print(f'{mode:6} {workers:7} {t:9.2f} {tref/t:7.2f}x  {"OK" if res == ref else "MISMATCH"}')
+
+# find a piece on a textured screen at a low threshold, where there are many hits
+def bench_peaks(args):
+    mon = ZigaMonitor()
+    mon.do_init()
+    rng = np.random.default_rng(0)
+    piece = mon.piecePatterns['BlackKing'].gray
+    print(f'{"screenshot":40} {"thresh":>6} ' + ' '.join(f'{name+" ms":>10} {"found":>5}' for name in args.backends))
+    for fname, img in load_shots(args.shots):
+        # blurred noise give a lot of weak correlation peaks
+        texture = cv2.GaussianBlur(rng.integers(0, 256, img.shape, dtype=np.uint8), (31,31), 0)
+        texture = cv2.normalize(texture, None, 0, 255, cv2.NORM_MINMAX)
+        screen = cv2.addWeighted(img, 0.5, texture, 0.5, 0)
+        for thresh in args.thresh:
+            cols = []
+            for name in args.backends:
+                t, coords = timeit(lambda: find_pattern(screen, piece, thresh=thresh, peaks=name), args.repeat)
+                cols.append(f'{t:10.2f} {len(coords):5}')
+            print(f'{fname:40} {thresh:6.2f} ' + ' '.join(cols))
+
+# zoom the whole screenshot, as the browser zoom does, and find the board starting from the pattern size
+def bench_zoom(args):
+    print(f'{"screenshot":40} {"zoom":>5} {"mode":>8} {"ms":>8} {"scale":>6}  fen')
+    for fname, img in load_shots(args.shots):
+        ref = None
+        for zoom in args.zooms:
+            screen = cv2.resize(img, (0,0), fx=zoom, fy=zoom, interpolation=cv2.INTER_AREA if zoom < 1 else cv2.INTER_LINEAR)
+            for mode in args.modes:
+                mon = ZigaMonitor()
+                mon.do_init(dict(locateMode=mode, incremental=False))
+                start = timer()
+                res = mon.scan_image(screen)
+                t = (timer() - start) * 1000
+                fen = None if res is None else res.fen
+                if zoom == 1 and ref is None:
+                    ref = fen
+                match = '' if ref is None or fen is None else ' OK' if fen == ref else ' MISMATCH'
+                print(f'{fname:40} {zoom:5.2f} {mode:>8} {t:8.1f} {mon.boardScale:6.3f}  {fen or "board not found"}{match}')
+
+def bench_capture(args):
+    region = None if args.region is None else tuple(args.region)
+    print(f'{"backend":12} {"avg ms":>8} {"max ms":>8}  region={region}')
+    for name in args.backends:
+        try:
+            cap = create_capture(name, dict(replayPath=args.replay))
+            pool = FrameBufferPool() if args.pool else None
+            worst = 0
+            for _ in range(args.repeat):
+                img = cap.grab(region, pool)
+                if pool is not None:
+                    pool.release(img)
+                worst = max(worst, cap.lastLatency)
+            cap.close()
+        except Exception as e:
+            print(f'{name:12} not available: {e}')
+            continue
+        print(f'{name:12} {cap.avgLatency*1000:8.2f} {worst*1000:8.2f}')
+
+# pattern loading of do_init: decoding the PNG files vs mapping the compiled pack
+def bench_init(args):
+    path = args.patterns
+    compile_pack(path, PATTERN_SCALE)
+    tpng, _ = timeit(lambda: PatternPack.from_images(path, PATTERN_SCALE), args.repeat)
+    tpack, _ = timeit(lambda: PatternPack.from_pack(path, PATTERN_SCALE), args.repeat)
+    def init(cold):
+        if cold:
+            packs.clear()
+        mon = ZigaMonitor()
+        mon.do_init(dict(patternPath=path))
+        return mon
+    tcold, _ = timeit(lambda: init(True), args.repeat)
+    twarm, _ = timeit(lambda: init(False), args.repeat)
+    print(f'{path}: load PNG {tpng:.2f}ms, map pack {tpack:.2f}ms ({tpng/tpack:.1f}x)')
+    print(f'do_init: first monitor {tcold:.2f}ms, next monitors {twarm:.2f}ms')
+
+class SlowListener(BoardMonitorListener):
+    def __init__(self, delay) -> None:
+        self.delay = delay
+
+    def on_monitor_msg(self, level, msg):
+        pass
+
+    def on_board_updated(self, mon):
+        time.sleep(self.delay)
+
+# run the polling loop on replayed screenshots and sample its rate once per second. Identical screenshots
+# make the period back off, a changing sequence keep it at the fastest
+# --listener: add a listener that takes this long on each board, delivered on the polling thread or its own (--async)
+def bench_poll(args):
+    mon = ZigaMonitor()
+    if args.listener:
+        mon.add_event_listener(SlowListener(args.listener / 1000))
+    mon.start(dict(capture='replay', replayPath=args.replay, delaySecond=args.min, pollMaxInterval=args.max,
+                   asyncListeners=args.async_))
+    print(f'{"s":>3} {"Hz":>6} {"scan ms":>8} {"wait ms":>8} {"period ms":>10}')
+    try:
+        for sec in range(1, args.seconds + 1):
+            time.sleep(1)
+            sch = mon.scheduler
+            print(f'{sec:3} {sch.effectiveHz:6.1f} {sch.avgScan*1000:8.1f} {sch.avgWait*1000:8.1f} {sch.interval*1000:10.0f}')
+    finally:
+        channels = mon.channels[:]
+        mon.stop()
+    print(f'{mon.scheduler.frames} frames, {mon.emittedFrames} boards sent')
+    for c in channels:
+        print(c.stats())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ZigaMonitor benchmarks')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p = sub.add_parser('classify', help='cell-by-cell loop vs stacked PieceClassifier')
+    p.add_argument('shots', nargs='+', help='screenshot files (glob allowed)')
+    p.add_argument('-n', '--repeat', type=int, default=10)
+    p.add_argument('-v', '--verbose', action='store_true', help='print the per-cell confidence')
+    p.set_defaults(func=bench_classify)
+
+    p = sub.add_parser('occupancy', help='scan time and template calls saved by the occupancy check')
+    p.add_argument('shots', nargs='+', help='screenshot files (glob allowed)')
+    p.add_argument('-n', '--repeat', type=int, default=10)
+    p.add_argument('-t', '--thresh', type=float, nargs='+', default=[0.3, 0.45, 0.6])
+    p.add_argument('-m', '--mode', choices=['batch', 'loop'], default='batch')
+    p.set_defaults(func=bench_occupancy)
+
+    p = sub.add_parser('locate', help='full size vs coarse-to-fine border search at several screen sizes')
+    p.add_argument('shots', nargs='+', help='screenshot files (glob allowed)')
+    p.add_argument('-n', '--repeat', type=int, default=3)
+    p.add_argument('-s', '--sizes', nargs='+', default=['1920x1080', '2560x1440', '3840x2160', '7680x2160'])
+    p.add_argument('-p', '--scale', type=int, default=4, help='downscale of the coarsest pyramid level')
+    p.add_argument('-o', '--offsets', type=int, default=16, help='random board places per screen size')
+    p.set_defaults(func=bench_locate)
+
+    p = sub.add_parser('cache', help='full scans of a frame sequence with and without the cell cache')
+    p.add_argument('shots', nargs='+', help='screenshot files in frame order (glob allowed)')
+    p.add_argument('-n', '--repeat', type=int, default=3)
+    p.add_argument('-s', '--sizes', type=int, nargs='+', default=[32, 256, 1024])
+    p.set_defaults(func=bench_cache)
+
+    p = sub.add_parser('workers', help='cell classification latency as the number of scan threads grows')
+    p.add_argument('shots', nargs='+', help='screenshot files (glob allowed)')
+    p.add_argument('-n', '--repeat', type=int, default=5)
+    p.add_argument('-m', '--modes', nargs='+', choices=['batch', 'loop'], default=['batch', 'loop'])
+    p.add_argument('--max', type=int, help='max number of workers, default the number of cores')
+    p.set_defaults(func=bench_workers)
+
+    p = sub.add_parser('peaks', help='find_pattern time of each peak backend on a textured screen')
+    p.add_argument('shots', nargs='+', help='screenshot files (glob allowed)')
+    p.add_argument('-n', '--repeat', type=int, default=3)
+    p.add_argument('-t', '--thresh', type=float, nargs='+', default=[0.2, 0.5, 0.8])
+    p.add_argument('-b', '--backends', nargs='+', choices=list(PEAK_BACKENDS), default=list(PEAK_BACKENDS))
+    p.set_defaults(func=bench_peaks)
+
+    p = sub.add_parser('zoom', help='board localization of zoomed screenshots, lattice vs template')
+    p.add_argument('shots', nargs='+', help='screenshot files (glob allowed)')
+    p.add_argument('-z', '--zooms', type=float, nargs='+', default=[1, 0.67, 0.8, 0.9, 1.1, 1.25, 1.5])
+    p.add_argument('-m', '--modes', nargs='+', choices=['lattice', 'template'], default=['lattice', 'template'])
+    p.set_defaults(func=bench_zoom)
+
+    p = sub.add_parser('capture', help='per frame latency of the screen capture backends')
+    p.add_argument('backends', nargs='*', default=list(CAPTURE_BACKENDS))
+    p.add_argument('-n', '--repeat', type=int, default=20)
+    p.add_argument('-r', '--region', type=int, nargs=4, metavar=('LEFT', 'TOP', 'RIGHT', 'BOTTOM'))
+    p.add_argument('--replay', default='.', help='screenshots for the replay backend')
+    p.add_argument('--pool', action='store_true', help='grab into reused frame buffers')
+    p.set_defaults(func=bench_capture)
+
+    p = sub.add_parser('init', help='pattern loading time, PNG files vs compiled pattern pack')
+    p.add_argument('patterns', nargs='?', default=PATTERN_PATH, help='pattern directory')
+    p.add_argument('-n', '--repeat', type=int, default=20)
+    p.set_defaults(func=bench_init)
+
+    p = sub.add_parser('poll', help='adaptive polling rate of the monitor loop on replayed screenshots')
+    p.add_argument('replay', help='screenshots replayed in a loop (file, directory or glob)')
+    p.add_argument('-s', '--seconds', type=int, default=10)
+    p.add_argument('--min', type=float, default=0.1, help='fastest polling period')
+    p.add_argument('--max', type=float, default=0.5, help='slowest polling period')
+    p.add_argument('-l', '--listener', type=float, default=0, help='add a listener that takes this many ms per board')
+    p.add_argument('--async', dest='async_', action='store_true', help='call the listener on its own thread')
+    p.set_defaults(func=bench_poll)
+
+    args = parser.parse_args()
+    args.func(args)
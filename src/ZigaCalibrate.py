@@ -0,0 +1,297 @@
+import argparse, json, logging, os
+import cv2
+import numpy as np
+
+from BoardMonitor.BaseMonitor import GRID_WIDTH, GRID_HEIGHT, PIECE_NAME, PIECE_SYMBOL, Side
+from BoardMonitor.PatternPack import MASK_LEVEL
+from BoardMonitor.ZigaMonitor import ZigaMonitor, PATTERN_PATH, LATTICE_CANDIDATES, LATTICE_LINE_CONTRAST, \
+    BORDER_THRESH, PIECE_THRESH, OCCUPANCY_THRESH, GEOMETRY_FILE, find_lattice, fit_lattice, get_imgsize, load_gray
+
+logging.basicConfig(level=logging.WARNING, format='%(module)-20s: %(message)s')
+logger = logging.getLogger()
+
+# Make a new pattern directory for ZigaMonitor from screenshots of a known position,
+# when the site theme changed and the patterns/Ziga files do not match anymore:
+#   python ZigaCalibrate.py start1.png start2.png --lastmove move.png 4 7 -o patterns/ZigaNew
+# then run the monitor with params {'patternPath': 'patterns/ZigaNew'}
+# All screenshots must be at the same zoom. The last-move marker is cut from a screenshot taken
+# right after a move to an empty intersection (col row as seen on the screen, from top-left)
+
+START_POSITION = ['rnbakabnr', '.........', '.c.....c.', 'p.p.p.p.p', '.........',
+                  '.........', 'P.P.P.P.P', '.C.....C.', '.........', 'RNBAKABNR'] # White at the bottom
+
+BORDER_MARGIN = 0.6 # margin of the border pattern around the play area, in cells (as the hand-cropped one)
+LASTMOVE_CELLS = 1.0 # size of the last-move pattern, in cells
+VLINE_DENSITY = 0.3 # part of the board height that must be line pixels for a vertical grid line
+MARKER_DIFF = 25 # last-move marker pixel: this much different from the same cell without marker
+GEOMETRY_TOLERANCE = 0.01 # all screenshots must have the same cell size, within this
+
+
+# Board grid of a screenshot: the horizontal lines come from the lattice search, the vertical ones
+# from the column profile of thin vertical lines. The rows and columns the lines found belong to
+# are decided by matching the piece layout
+# Return ([X,Y] of the first intersection, [W,H] of a cell) in screen pixels, or None
+def find_grid(gray, layout, approxGrid):
+    occupied = np.array([[c != '.' for c in row] for row in layout])
+    for sy, y0, lines, rowIndex in find_lattice(gray, approxGrid)[:LATTICE_CANDIDATES]:
+        xs = vertical_lines(gray, lines, sy, y0, rowIndex.max())
+        fit = fit_lattice(xs, 0.7*sy, 1.4*sy, GRID_WIDTH) if len(xs) else []
+        if not fit:
+            continue
+        sx, x0, colIndex = fit[0]
+        grid = np.array((sx, sy))
+        # which row and column the first line found is
+        best, bestScore = None, -1
+        for row0 in range(GRID_HEIGHT - rowIndex.max()):
+            for col0 in range(GRID_WIDTH - colIndex.max()):
+                start = np.array((x0, y0)) - grid*(col0, row0)
+                score = layout_score(gray, start, grid, occupied)
+                if score > bestScore:
+                    best, bestScore = start, score
+        logger.info(f'Grid {grid.round(2)} at {best.round(1) if best is not None else None}, layout score {bestScore:.2f}')
+        if best is not None and bestScore > 0.5:
+            return best, grid
+    return None
+
+# x of the vertical grid lines, in the band of rows around the horizontal lines found
+def vertical_lines(gray, lines, sy, y0, lastRow):
+    top = int(max(y0 - (GRID_HEIGHT-1 - lastRow)*sy, 0))
+    bottom = int(min(y0 + (GRID_HEIGHT-1)*sy, gray.shape[0]))
+    left = int(max(np.median(lines[:,0]) - 2*sy, 0))
+    right = int(min(np.median(lines[:,2]) + 2*sy, gray.shape[1]))
+    band = gray[top:bottom, left:right]
+    thick = max(int(sy/8), 3) | 1
+    blackhat = cv2.morphologyEx(band, cv2.MORPH_BLACKHAT, np.ones((1, thick), dtype=np.uint8))
+    profile = (blackhat > LATTICE_LINE_CONTRAST).mean(axis=0).astype(np.float32)
+    window = max(int(sy/4), 1)
+    peaks = np.nonzero((profile >= VLINE_DENSITY) & (profile >= cv2.dilate(profile, np.ones((1, 2*window+1))).ravel()))[0]
+    xs = []
+    for x in peaks:
+        if xs and x - xs[-1][0] <= window: # plateau
+            continue
+        lo, hi = max(x-2, 0), x+3
+        xs.append((x, (profile[lo:hi] * np.arange(lo, lo+len(profile[lo:hi]))).sum() / profile[lo:hi].sum()))
+    return np.array([left + x for _, x in xs])
+
+# correlation between the local contrast at each intersection and the occupied cells of the layout
+def layout_score(gray, start, grid, occupied):
+    centers = start + np.stack(np.meshgrid(np.arange(GRID_WIDTH), np.arange(GRID_HEIGHT)), axis=-1) * grid
+    r = int(min(grid) / 4)
+    if (centers - r < 0).any() or (centers[..., 0] + r >= gray.shape[1]).any() or (centers[..., 1] + r >= gray.shape[0]).any():
+        return -1
+    contrast = np.zeros(occupied.shape)
+    for (row, col) in np.ndindex(occupied.shape):
+        x, y = centers[row, col].round().astype(int)
+        contrast[row, col] = gray[y-r:y+r+1, x-r:x+r+1].std()
+    return np.corrcoef(contrast.ravel(), occupied.ravel())[0, 1]
+
+# radius of the piece rim: strongest ring of the gradient around the occupied intersections
+def piece_radius(boards, playStart, grid, occupied):
+    maxRadius = int(0.6*min(grid))
+    profile = np.zeros(maxRadius)
+    for board in boards:
+        gx = cv2.Sobel(board, cv2.CV_32F, 1, 0)
+        gy = cv2.Sobel(board, cv2.CV_32F, 0, 1)
+        magnitude = cv2.magnitude(gx, gy)
+        for row, col in zip(*np.nonzero(occupied)):
+            center = tuple(float(v) for v in playStart + grid*(col, row))
+            polar = cv2.warpPolar(magnitude, (maxRadius, 360), center, maxRadius, cv2.WARP_POLAR_LINEAR)
+            profile += polar.mean(axis=0)
+    lo = int(0.25*min(grid))
+    # outermost ring that is nearly as strong as the strongest one
+    strong = np.nonzero(profile[lo:] >= 0.7*profile[lo:].max())[0]
+    return lo + strong.max()
+
+def crop_center(img, center, size):
+    x, y = np.round(np.asarray(center) - np.asarray(size)/2).astype(int)
+    crop = img[y:y+size[1], x:x+size[0]]
+    return crop if crop.shape[::-1] == tuple(size) else None
+
+# keep the masked pixels above MASK_LEVEL, set the others to 0: load_img_mask get the mask back
+def masked_pattern(gray, mask):
+    return np.where(mask, np.maximum(gray, MASK_LEVEL+1), 0).astype(np.uint8)
+
+def disk(size, radius):
+    yy, xx = np.mgrid[:size[1], :size[0]]
+    return np.hypot(xx - (size[0]-1)/2, yy - (size[1]-1)/2) <= radius
+
+
+def calibrate(args):
+    layout = START_POSITION if args.side == 'white' else [row.swapcase() for row in START_POSITION]
+    occupied = np.array([[c != '.' for c in row] for row in layout])
+    approxGrid = get_imgsize('play_area', args.base) / (GRID_WIDTH-1, GRID_HEIGHT-1)
+
+    # geometry of each screenshot
+    shots = []
+    for fname in args.shots:
+        gray = cv2.imread(fname, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise SystemExit(f'Cannot read {fname}')
+        grid = find_grid(gray, layout, approxGrid)
+        if grid is None:
+            raise SystemExit(f'{fname}: board grid not found')
+        if shots and np.abs(grid[1] / shots[0][2] - 1).max() > GEOMETRY_TOLERANCE:
+            raise SystemExit(f'{fname}: cell size {grid[1]} is not the one of {shots[0][0]} {shots[0][2]}, same zoom is needed')
+        shots.append((fname, gray, grid[1], grid[0]))
+        print(f'{fname}: first intersection {grid[0].round(1)}, cell {grid[1].round(2)}')
+
+    # pattern geometry, in the same form as the hand-made files: only their size matter
+    grid = np.mean([s[2] for s in shots], axis=0)
+    corner = np.round(BORDER_MARGIN*grid).astype(int)
+    playSize = np.round(grid*(GRID_WIDTH-1, GRID_HEIGHT-1)).astype(int)
+    borderSize = playSize + 2*corner
+    patternGrid = playSize / (GRID_WIDTH-1, GRID_HEIGHT-1) # what the monitor will compute
+    boards = []
+    for fname, gray, _, playStart in shots:
+        origin = np.round(playStart - corner).astype(int)
+        board = gray[origin[1]:origin[1]+borderSize[1], origin[0]:origin[0]+borderSize[0]]
+        if board.shape[::-1] != tuple(borderSize):
+            raise SystemExit(f'{fname}: the board is cut by the screenshot edge')
+        boards.append(board)
+    board = np.median(np.stack(boards), axis=0).astype(np.uint8)
+
+    radius = piece_radius(boards, corner, patternGrid, occupied)
+    pieceSize = np.array((2*radius + 2, 2*radius + 2))
+    print(f'Cell {patternGrid.round(2)}, piece {pieceSize}, border {borderSize}, play area starts at {corner}')
+
+    os.makedirs(args.output, exist_ok=True)
+    def write(name, img):
+        cv2.imwrite(os.path.join(args.output, f'{name}.png'), img)
+
+    # pieces: median of all the instances of each piece
+    instances = {}
+    for row, col in zip(*np.nonzero(occupied)):
+        for b in boards:
+            crop = crop_center(b, corner + patternGrid*(col, row), pieceSize)
+            if crop is not None:
+                instances.setdefault(layout[row][col], []).append(crop)
+    for side in [Side.Black, Side.White]:
+        for name in PIECE_NAME:
+            symbol = PIECE_SYMBOL[name] if side == Side.White else PIECE_SYMBOL[name].lower()
+            write(f'{side.name}{name}', np.median(np.stack(instances[symbol]), axis=0).astype(np.uint8))
+
+    # border: everything but where a piece or the last-move marker can be
+    free = np.ones(board.shape, dtype=bool)
+    yy, xx = np.mgrid[:board.shape[0], :board.shape[1]]
+    for row, col in np.ndindex(GRID_HEIGHT, GRID_WIDTH):
+        cx, cy = corner + patternGrid*(col, row)
+        free &= np.hypot(xx - cx, yy - cy) > radius + 2
+    write('border', masked_pattern(board, free))
+    write('borderFull', board)
+    write('corrner2playfield', board[:corner[1], :corner[0]])
+    write('play_area', board[corner[1]:corner[1]+playSize[1], corner[0]:corner[0]+playSize[0]])
+
+    # last-move marker: what changed around the piece, compared to the same cell without marker
+    markerSize = np.full(2, 2*int(np.ceil(LASTMOVE_CELLS*grid.max()/2)) + 2)
+    lastMove = {}
+    if args.lastmove:
+        fname, col, row = args.lastmove[0], int(args.lastmove[1]), int(args.lastmove[2])
+        gray = cv2.imread(fname, cv2.IMREAD_GRAYSCALE)
+        borderGray, borderMask = board, masked_pattern(board, free) > MASK_LEVEL
+        match = cv2.matchTemplate(gray, borderGray, cv2.TM_CCOEFF_NORMED, mask=borderMask.astype(np.uint8)*255)
+        match = np.nan_to_num(match, nan=-1, posinf=-1, neginf=-1)
+        _, score, _, origin = cv2.minMaxLoc(match)
+        center = corner + patternGrid*(col, row)
+        marked = crop_center(gray[origin[1]:origin[1]+borderSize[1], origin[0]:origin[0]+borderSize[0]], center, markerSize)
+        unmarked = crop_center(board, center, markerSize)
+        if marked is None or unmarked is None:
+            raise SystemExit(f'{fname}: last-move cell {col},{row} is outside the board')
+        mask = (cv2.absdiff(marked, unmarked) > MARKER_DIFF) & ~disk(markerSize, radius + 2)
+        if np.count_nonzero(mask) < markerSize[0]:
+            raise SystemExit(f'{fname}: no last-move marker found around {col},{row} (board score {score:.2f})')
+        # with the board just around it, a flat colored marker alone has no contrast to match
+        mask = cv2.dilate(mask.astype(np.uint8), np.ones((5,5), dtype=np.uint8)).astype(bool) & ~disk(markerSize, radius + 2)
+        write('lastMove', masked_pattern(marked, mask))
+        lastMove = {'file': fname, 'cell': [col, row], 'pixels': int(np.count_nonzero(mask))}
+    else:
+        # keep the old marker, at the new size
+        old = load_gray('lastMove', args.base)
+        scale = patternGrid.max() / approxGrid.max()
+        write('lastMove', cv2.resize(old, (0,0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA))
+        lastMove = {'scaledFrom': args.base}
+        print('** No --lastmove screenshot, the old last-move marker is only resized')
+
+    manifest = {
+        'source': [s[0] for s in shots],
+        'side': args.side,
+        'gridSize': patternGrid.tolist(),
+        'playStart': corner.tolist(),
+        'playSize': playSize.tolist(),
+        'borderSize': borderSize.tolist(),
+        'pieceSize': pieceSize.tolist(),
+        'lastMoveSize': list(cv2.imread(os.path.join(args.output, 'lastMove.png'), 0).shape[::-1]),
+        'screens': [{'file': s[0], 'playStart': s[3].tolist(), 'gridSize': s[2].tolist()} for s in shots],
+        'lastMove': lastMove,
+    }
+    manifest.update(validate(args.output, shots, layout))
+    print(json.dumps({k: manifest[k] for k in ('scores', 'thresholds')}, indent=2))
+    # the monitor load the thresholds from it: not from patterns that do not read the screenshots back
+    geometryFile = os.path.join(args.output, GEOMETRY_FILE)
+    if os.path.exists(geometryFile):
+        os.remove(geometryFile)
+    if not manifest['validated']:
+        raise SystemExit(f'Calibration failed, the patterns in {args.output} do not recognize the screenshots. '
+                         f'{GEOMETRY_FILE} not written')
+    with open(geometryFile, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f'Patterns written to {args.output}')
+
+# scan the calibration screenshots with the new patterns, and measure how far apart the right and
+# the wrong answers are: the thresholds are set in between, ZigaMonitor.do_init load them
+def validate(path, shots, layout):
+    mon = ZigaMonitor()
+    # the default thresholds, not the ones of a previous calibration
+    mon.do_init({'patternPath': path, 'locateMode': 'template', 'incremental': False, 'cellCacheSize': 0,
+                 'pieceThresh': PIECE_THRESH, 'occupancyThresh': OCCUPANCY_THRESH, 'borderThresh': BORDER_THRESH})
+    clf = mon.classifier
+    occupied = np.array([[c != '.' for c in row] for row in layout])
+    expected = np.array([[list(clf.symbols).index(c) if c != '.' else -1 for c in row] for row in layout])
+    right, wrong, outlineIn, outlineOut, borders, ok = [], [], [], [], [], True
+    for fname, gray, _, _ in shots:
+        mon.lastScanRegion = None
+        res = mon.scan_image(gray)
+        if res is None or [''.join(row) for row in res.positions] != layout:
+            print(f'** {fname}: not recognized with the new patterns')
+            ok = False
+        mon.lastScanRegion = None
+        board = mon.crop_image(gray)
+        if board is None:
+            continue
+        borders.append(max(score for _, score in mon.border_candidates(gray)))
+        patches = mon.stack_patches(board)
+        dy, dx, outline = clf.locate(patches)
+        outlineIn.append(outline[occupied].min())
+        outlineOut.append(outline[~occupied].max())
+        scores = clf.score(patches[occupied], dy[occupied], dx[occupied])
+        truth = expected[occupied]
+        right.append(scores[np.arange(len(truth)), truth].min())
+        scores[np.arange(len(truth)), truth] = -1
+        wrong.append(scores.max())
+    if not right:
+        return {'scores': {}, 'thresholds': {}, 'validated': False}
+    scores = {
+        'pieceMin': float(min(right)), 'wrongPieceMax': float(max(wrong)),
+        'occupiedMin': float(min(outlineIn)), 'emptyMax': float(max(outlineOut)),
+        'borderMin': float(min(borders)),
+    }
+    thresholds = {
+        'piece': round((scores['pieceMin'] + scores['wrongPieceMax']) / 2, 2),
+        'occupancy': round((scores['occupiedMin'] + scores['emptyMax']) / 2, 2),
+        'border': round(scores['borderMin'] - 0.05, 2),
+    }
+    return {'scores': scores, 'thresholds': thresholds, 'validated': ok}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Make ZigaMonitor patterns from screenshots of the start position')
+    parser.add_argument('shots', nargs='+', help='screenshots of the start position, same zoom')
+    parser.add_argument('-o', '--output', required=True, help='pattern directory to write')
+    parser.add_argument('--side', choices=['white', 'black'], default='white', help='side at the bottom of the board')
+    parser.add_argument('--lastmove', nargs=3, metavar=('FILE', 'COL', 'ROW'),
+                        help='screenshot with the last-move marker, and its cell counted from the top-left')
+    parser.add_argument('--base', default=PATTERN_PATH, help='current patterns, for the approximate cell size')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(logging.INFO)
+    calibrate(args)
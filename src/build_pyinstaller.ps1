@@ -1 +1,2 @@
+python -m BoardMonitor.PatternPack patterns/Ziga
 pyinstaller .\ZigaHelper.py --add-data="patterns;patterns" --add-data='js;js' --add-data='engine_exe;engine_exe' --onefile --windowed
\ No newline at end of file
@@ -12,7 +12,7 @@ parser.add_argument( '-log',
                      default='error',
                      help='Provide logging level. Example --loglevel debug, default=warning' )
 
-args = parser.parse_args()
+args, _ = parser.parse_known_args() # the bench scripts have their own arguments
 loglevel = 'INFO' if MYDEBUG else args.loglevel.upper()
 
 
@@ -0,0 +1,4 @@
+import os, sys
+
+# the sources are run from src/ (python ZigaMonitor.py ...), put it on the path for all tests
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# A UCI engine for the tests and for EngineBench.py without a real engine. 'go' is answered with one
+# info at once and the bestmove after its movetime, or at once on 'stop'. A 'go ponder' or 'go infinite'
+# search only end on 'stop' (or 'ponderhit' for the ponder). The positions with 'hang' in their fen
+# never get a bestmove, not even after a 'stop'
+import sys, threading
+
+lock = threading.Lock()
+search = None # the timer of the running search, None when idle
+
+def say(*lines):
+    with lock:
+        for line in lines:
+            print(line)
+        sys.stdout.flush()
+
+def bestmove(timer):
+    global search
+    with lock:
+        if search is not timer:
+            return
+        search = None
+    say('bestmove h3e3 ponder h10g8')
+
+def go(items, hang):
+    global search
+    say('info depth 1 score cp 10 pv h3e3 h10g8')
+    if hang:
+        return
+    movetime = int(items[items.index('movetime') + 1]) / 1000 if 'movetime' in items else None
+    timer = threading.Timer(movetime or 0, lambda: bestmove(timer))
+    with lock:
+        search = timer
+    if movetime is not None and 'ponder' not in items:
+        timer.start()
+
+position = ''
+for line in sys.stdin:
+    items = line.split()
+    if not items:
+        continue
+    match items[0]:
+        case 'uci':
+            say('id name fake_uci', 'uciok')
+        case 'isready':
+            say('readyok')
+        case 'position':
+            position = line
+        case 'go':
+            go(items, 'hang' in position)
+        case 'stop' | 'ponderhit':
+            timer = search
+            if timer is not None:
+                timer.cancel()
+                bestmove(timer)
+        case 'quit':
+            break
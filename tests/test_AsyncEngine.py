@@ -0,0 +1,33 @@
+import os, asyncio
+import pytest
+
+import AsyncEngine as async_engine
+from AsyncEngine import AsyncEngine
+
+FAKE_ENGINE = os.path.join(os.path.dirname(__file__), 'fake_uci.py')
+
+def test_analyse():
+    async def run():
+        engine = AsyncEngine(FAKE_ENGINE, continuity=False)
+        await engine.start()
+        try:
+            return await engine.analyse('x w - - 0 1', 10)
+        finally:
+            await engine.quit()
+    assert asyncio.run(run()).pv == ['h3e3', 'h10g8']
+
+# the engine never answer the 'stop': the waiting analyse fail, the process is killed and quit return
+def test_stop_timeout(monkeypatch):
+    monkeypatch.setattr(async_engine, 'SEARCH_STOP_TIMEOUT', 0.2)
+    async def run():
+        engine = AsyncEngine(FAKE_ENGINE, continuity=False)
+        await engine.start()
+        hung = asyncio.ensure_future(engine.analyse('hang w - - 0 1', 10))
+        await asyncio.sleep(0.05)
+        with pytest.raises(RuntimeError, match='No bestmove'):
+            await asyncio.wait_for(engine.analyse('x w - - 0 1', 10), 2)
+        with pytest.raises(RuntimeError, match='No bestmove'):
+            await hung
+        await asyncio.wait_for(engine.quit(), 2)
+        return await asyncio.wait_for(engine.process.wait(), 2)
+    assert asyncio.run(run()) is not None
@@ -0,0 +1,77 @@
+import threading
+
+from BoardMonitor.BaseMonitor import BaseMonitor, BoardMonitorListener, MonitorResult
+
+class StaticMonitor(BaseMonitor):
+    def do_init(self, params):
+        pass
+
+    def do_board_scan(self):
+        return MonitorResult()
+
+class Collector(BoardMonitorListener):
+    def __init__(self) -> None:
+        self.boards = []
+        self.threads = set()
+        self.received = threading.Event()
+
+    def on_monitor_msg(self, level, msg):
+        pass
+
+    def on_board_updated(self, mon):
+        self.boards.append(mon)
+        self.threads.add(threading.current_thread().name)
+        self.received.set()
+
+def test_listeners_per_monitor():
+    a, b = StaticMonitor(), StaticMonitor()
+    listener = Collector()
+    a.add_event_listener(listener)
+    a.add_event_listener(listener) # i.e. added again by a restart
+    assert a.eventListeners == [listener] and b.eventListeners == []
+
+def test_sync_delivery_by_default():
+    mon = StaticMonitor()
+    listener = Collector()
+    mon.add_event_listener(listener)
+    mon.start(dict(delaySecond=0.01))
+    try:
+        assert listener.received.wait(2)
+        assert mon.channels == []
+        assert listener.threads == {mon.engine_thread.name}
+    finally:
+        mon.stop()
+    # restarted with the same listener, it still get each board once
+    listener.boards.clear()
+    listener.received.clear()
+    mon.add_event_listener(listener)
+    mon.start(dict(delaySecond=0.01, asyncListeners=True))
+    try:
+        assert listener.received.wait(2)
+        assert len(mon.channels) == 1
+    finally:
+        mon.stop()
+    assert len(listener.boards) == 1
+
+def board(piece):
+    result = MonitorResult()
+    result.positions[0][0] = piece
+    return result
+
+def emitted(mon, boards):
+    return [mon.track_board(b)[1] for b in boards]
+
+def test_first_frame_emitted():
+    mon = StaticMonitor()
+    assert emitted(mon, [board('R'), board('R')]) == [True, False]
+
+# a board flickering between two states (i.e. a piece being dragged)
+def test_flicker():
+    mon = StaticMonitor()
+    A, B = board('R'), board('r')
+    assert emitted(mon, [A, B, A, B]) == [True, True, True, True]
+    # opt-in stability: nothing is sent until one of them stays
+    mon = StaticMonitor()
+    mon.stableFrames = 2
+    assert emitted(mon, [A, B, A, B, B, B]) == [False, False, False, False, True, False]
+    assert mon.unstableFrames == 4
@@ -0,0 +1,39 @@
+import numpy as np
+
+from BoardMonitor.CellCache import CellCache
+
+def test_lru_eviction():
+    cache = CellCache(2)
+    cache.put('a', 'R', 0.9)
+    cache.put('b', 'n', 0.8)
+    assert cache.get('a') == ('R', 0.9) # a is now the most recent
+    cache.put('c', '.', 0.0)
+    assert cache.get('b') is None
+    assert cache.get('a') == ('R', 0.9) and cache.get('c') == ('.', 0.0)
+    assert len(cache) == 2 and cache.evictions == 1
+    assert (cache.hits, cache.misses) == (3, 1)
+    assert cache.hitRate == 0.75
+
+def test_key_hits():
+    rng = np.random.default_rng(1)
+    board = rng.integers(0, 256, (100, 100), dtype=np.uint8)
+    cache = CellCache()
+    # a patch of the board is a strided view, same key as the same pixels elsewhere
+    patch = board[10:64, 20:74]
+    cache.put(cache.key(patch), 'C', 0.7)
+    assert cache.get(cache.key(patch.copy())) == ('C', 0.7)
+    changed = patch.copy()
+    changed[-1, -1] ^= 1
+    assert cache.get(cache.key(changed)) is None
+    cache.clear()
+    assert cache.get(cache.key(patch)) is None
+
+def test_validate_clears_on_new_signature():
+    cache = CellCache()
+    cache.validate(('batch', 0.8))
+    cache.put('a', 'R', 0.9)
+    cache.validate(('batch', 0.8))
+    assert cache.get('a') == ('R', 0.9)
+    cache.validate(('batch', 0.9))
+    assert cache.get('a') is None and len(cache) == 0
+    assert cache.invalidations == 1
@@ -0,0 +1,48 @@
+from EngineGame import START_FEN, GameTracker, fen_board, board_fen, apply_move, opposite, infer_moves, square_index
+
+# the fens after each move from the start position
+def positions(moves):
+    board, side = fen_board(START_FEN), 'w'
+    fens = [START_FEN]
+    for mv in moves.split():
+        board, side = apply_move(board, mv), opposite(side)
+        fens.append(board_fen(board, side))
+    return fens
+
+def test_follow_game():
+    line = 'h3e3 h10g8 h1g3 i10h10 i1h1 b10c8 b1c3 c7c6 g4g5 b8b4 a1b1 a10b10 c4c5 g7g6 h1h7 c10e8'
+    game = GameTracker()
+    for fen in positions(line)[::2]:
+        newgame, start, moves = game.update(fen)
+    assert start == START_FEN and moves == line.split()
+    assert game.rerooted == 0
+
+def test_one_ply_and_capture():
+    fens = positions('h3h10 i10h10')
+    assert infer_moves(fen_board(fens[0]), 'w', fen_board(fens[1]), 'b') == ['h3h10']
+    assert infer_moves(fen_board(fens[0]), 'w', fen_board(fens[2]), 'w') == ['h3h10', 'i10h10']
+
+# going back 2 plies has the same board difference as a pawn moving backward: not a move of the game
+def test_takeback_reroot():
+    fens = positions('h3e3 h10g8 g4g5 i10h10')
+    assert infer_moves(fen_board(fens[4]), 'w', fen_board(fens[2]), 'w') is None
+    game = GameTracker()
+    for fen in (fens[0], fens[2], fens[4]):
+        game.update(fen)
+    newgame, start, moves = game.update(fens[2])
+    assert not newgame and start == fens[2] and moves == []
+    assert game.rerooted == 1
+
+def test_blocked_pieces():
+    # the horse leg blocked
+    board = fen_board(START_FEN)
+    board[square_index('b2')] = 'P'
+    assert infer_moves(board, 'w', apply_move(board, 'b1c3'), 'b') is None
+    assert infer_moves(fen_board(START_FEN), 'w', fen_board(positions('b1c3')[1]), 'b') == ['b1c3']
+    assert infer_moves(fen_board(START_FEN), 'w', fen_board(positions('c1e3')[1]), 'b') == ['c1e3']
+    assert infer_moves(fen_board(START_FEN), 'w', fen_board(positions('d1e2')[1]), 'b') == ['d1e2']
+    # the advisor out of the palace, the elephant over the river
+    board = fen_board(positions('c1e3 a7a6 e3c5')[3])
+    assert board[square_index('c5')] == 'B'
+    assert infer_moves(board, 'w', apply_move(board, 'c5e7'), 'b') is None
+    assert infer_moves(fen_board(START_FEN), 'w', apply_move(fen_board(START_FEN), 'd1c2'), 'b') is None
@@ -0,0 +1,46 @@
+import os, time
+import pytest
+
+from EnginePool import EnginePool, POOL_MAX_ATTEMPTS
+
+FAKE_ENGINE = os.path.join(os.path.dirname(__file__), 'fake_uci.py')
+HANG_FEN = 'hang w - - 0 1'
+
+def wait_until(cond, timeout=5):
+    end = time.time() + timeout
+    while not cond():
+        assert time.time() < end, 'timeout'
+        time.sleep(0.01)
+
+@pytest.fixture
+def pool():
+    pool = EnginePool(size=1, enginePath=FAKE_ENGINE)
+    pool.start()
+    yield pool
+    pool.quit()
+
+def test_analyse(pool):
+    assert pool.analyse('x w - - 0 1', 10).result(5).pv == ['h3e3', 'h10g8']
+    assert pool.busy == 0
+
+def test_retry_until_max_attempts(pool):
+    request = pool.analyse(HANG_FEN)
+    for attempt in range(1, POOL_MAX_ATTEMPTS + 1):
+        wait_until(lambda: request.attempts == attempt and pool.workers[0].request is request)
+        assert not request.future.done()
+        pool.workers[0].engine.process.kill()
+    with pytest.raises(RuntimeError, match=f'failed {POOL_MAX_ATTEMPTS} times'):
+        request.result(5)
+    # the replacement take the next request
+    assert pool.analyse('x w - - 0 1', 10).result(5) is not None
+
+def test_quit_fails_requeued_request(pool):
+    request = pool.analyse(HANG_FEN)
+    wait_until(lambda: pool.workers[0].request is request)
+    pool.dispatch = lambda: None # the request stay queued after the failure
+    pool.workers[0].engine.process.kill()
+    wait_until(lambda: request in pool.pending)
+    assert request.future.running()
+    pool.quit()
+    with pytest.raises(RuntimeError, match='stopped'):
+        request.result(1)
@@ -0,0 +1,83 @@
+import os, queue, time
+import pytest
+
+import EngineUCI as engine_uci
+from EngineUCI import Engine, EngineEventListener, SearchState
+from EngineGame import START_FEN, fen_board, board_fen, apply_move
+
+FAKE_ENGINE = os.path.join(os.path.dirname(__file__), 'fake_uci.py')
+
+class Collector(EngineEventListener):
+    def __init__(self) -> None:
+        self.results = queue.Queue()
+    def on_move_calculated(self, fen, info):
+        self.results.put((fen, info))
+    def on_engine_fatal(self, msg):
+        self.results.put((None, msg))
+
+@pytest.fixture
+def engine():
+    engine = Engine(FAKE_ENGINE, ponder=True)
+    engine.uci_movetime = 10
+    engine.start()
+    yield engine
+    engine.quit()
+
+# the fake engine always answer h3e3 ponder h10g8: the next position is a ponder hit
+def test_ponder_hit(engine):
+    collector = Collector()
+    engine.add_event_listener(collector)
+    engine.start_next_move(START_FEN)
+    assert collector.results.get(timeout=5)[0] == START_FEN
+    fen = board_fen(apply_move(apply_move(fen_board(START_FEN), 'h3e3'), 'h10g8'))
+    end = time.time() + 5
+    while engine.state != SearchState.Searching:
+        assert time.time() < end, 'no ponder search'
+        time.sleep(0.01)
+    assert engine.search.ponder and engine.search.fen == fen
+    engine.start_next_move(fen)
+    assert collector.results.get(timeout=5)[0] == fen
+    assert (engine.ponderHits, engine.ponderMisses) == (1, 0)
+
+# the engine never answer the 'hang' positions: the watchdog report the search once it is late, without
+# waiting for a next position, and only once
+def test_hung_search_reported(monkeypatch):
+    monkeypatch.setattr(engine_uci, 'SEARCH_STOP_TIMEOUT', 0.2)
+    monkeypatch.setattr(engine_uci, 'WATCHDOG_PERIOD', 0.02)
+    engine = Engine(FAKE_ENGINE, continuity=False, ponder=False)
+    engine.uci_movetime = 10
+    collector = Collector()
+    engine.add_event_listener(collector)
+    engine.start()
+    try:
+        engine.start_next_move('hang w - - 0 1')
+        fen, msg = collector.results.get(timeout=5)
+        assert fen is None and 'searching' in msg
+        time.sleep(0.3)
+        assert collector.results.empty()
+    finally:
+        engine.quit()
+
+# a long search stopped by a new position, the engine never answer the 'stop'
+def test_hung_stop_reported(monkeypatch):
+    monkeypatch.setattr(engine_uci, 'SEARCH_STOP_TIMEOUT', 0.2)
+    monkeypatch.setattr(engine_uci, 'WATCHDOG_PERIOD', 0.02)
+    engine = Engine(FAKE_ENGINE, continuity=False, ponder=False)
+    engine.uci_movetime = 60000
+    collector = Collector()
+    engine.add_event_listener(collector)
+    engine.start()
+    try:
+        engine.start_next_move('hang w - - 0 1')
+        end = time.time() + 5
+        while engine.state != SearchState.Searching:
+            assert time.time() < end, 'no search'
+            time.sleep(0.01)
+        engine.start_next_move('x w - - 0 1')
+        fen, msg = collector.results.get(timeout=5)
+        assert fen is None
+        time.sleep(0.3)
+        assert collector.results.empty()
+        assert engine.state == SearchState.Stopping
+    finally:
+        engine.quit()
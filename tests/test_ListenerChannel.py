@@ -0,0 +1,48 @@
+import threading, time
+
+from BoardMonitor.ListenerChannel import ListenerChannel
+
+# block on the first board until released
+class SlowListener:
+    def __init__(self) -> None:
+        self.boards = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def on_board_updated(self, result):
+        self.started.set()
+        self.release.wait(5)
+        self.boards.append(result)
+
+def test_latest_wins():
+    listener = SlowListener()
+    channel = ListenerChannel(listener)
+    channel.publish(1)
+    assert listener.started.wait(5)
+    for board in (2, 3, 4):
+        channel.publish(board)
+    listener.release.set()
+    channel.close(5)
+    assert listener.boards == [1, 4]
+    assert (channel.published, channel.delivered, channel.coalesced) == (4, 2, 2)
+
+class FailingListener:
+    def __init__(self) -> None:
+        self.boards = []
+
+    def on_board_updated(self, result):
+        self.boards.append(result)
+        if result == 1:
+            raise RuntimeError('listener error')
+
+def test_listener_error_does_not_stop_the_channel():
+    listener = FailingListener()
+    channel = ListenerChannel(listener)
+    channel.publish(1)
+    end = time.time() + 5
+    while channel.delivered < 1:
+        assert time.time() < end, 'not delivered'
+        time.sleep(0.01)
+    channel.publish(2)
+    channel.close(5) # the board in the slot is still delivered
+    assert listener.boards == [1, 2] and channel.delivered == 2
@@ -0,0 +1,61 @@
+import os, sys, json
+import pytest
+import numpy as np
+import cv2
+
+import BoardMonitor.PatternPack as pattern_pack
+from BoardMonitor.PatternPack import PatternPack, compile_pack
+
+def write_patterns(path):
+    rng = np.random.default_rng(2)
+    for name in ('WhiteRook', 'lastMove'):
+        cv2.imwrite(str(path / f'{name}.png'), rng.integers(0, 256, (12, 10), dtype=np.uint8))
+
+def test_pack_round_trip(tmp_path):
+    write_patterns(tmp_path)
+    compiled = compile_pack(str(tmp_path))
+    pack = PatternPack.from_pack(str(tmp_path), 1)
+    assert set(pack.images) == {'WhiteRook', 'lastMove', 'lastMove.mask'}
+    assert np.array_equal(pack.gray('WhiteRook'), compiled.gray('WhiteRook'))
+    assert list(pack.size('lastMove')) == [10, 12]
+
+# touched files, same content: the pack is mapped, not rebuilt, and the digest is only computed once
+def test_touched_files_keep_the_pack(tmp_path, monkeypatch):
+    write_patterns(tmp_path)
+    compile_pack(str(tmp_path))
+    data = tmp_path / 'pack.npy'
+    built = data.stat().st_mtime_ns
+    st = os.stat(tmp_path / 'WhiteRook.png')
+    os.utime(tmp_path / 'WhiteRook.png', ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    digests = []
+    digest = pattern_pack.source_digest
+    monkeypatch.setattr(pattern_pack, 'source_digest', lambda path: digests.append(path) or digest(path))
+    assert PatternPack.from_pack(str(tmp_path), 1) is not None
+    assert len(digests) == 1
+    assert data.stat().st_mtime_ns == built
+    with open(tmp_path / 'pack.json') as f:
+        assert json.load(f)['sources'] == pattern_pack.source_stats(str(tmp_path))
+    assert PatternPack.from_pack(str(tmp_path), 1) is not None
+    assert len(digests) == 1
+
+def test_changed_files_make_the_pack_stale(tmp_path):
+    write_patterns(tmp_path)
+    compile_pack(str(tmp_path))
+    cv2.imwrite(str(tmp_path / 'WhiteRook.png'), np.zeros((12, 10), dtype=np.uint8))
+    assert PatternPack.from_pack(str(tmp_path), 1) is None
+    assert PatternPack.from_pack(str(tmp_path), 2) is None # other scale
+
+# PyInstaller bundle: new mtimes at each start, the PNG files are neither stat nor hashed
+def test_frozen_skip_the_source_check(tmp_path, monkeypatch):
+    write_patterns(tmp_path)
+    compile_pack(str(tmp_path))
+    st = os.stat(tmp_path / 'WhiteRook.png')
+    os.utime(tmp_path / 'WhiteRook.png', ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    index = (tmp_path / 'pack.json').read_text()
+
+    monkeypatch.setattr(sys, 'frozen', True, raising=False)
+    monkeypatch.setattr(pattern_pack, 'source_digest', lambda path: pytest.fail('digest computed'))
+    monkeypatch.setattr(pattern_pack, 'source_stats', lambda path: pytest.fail('files stat'))
+    assert PatternPack.from_pack(str(tmp_path), 1) is not None
+    assert (tmp_path / 'pack.json').read_text() == index
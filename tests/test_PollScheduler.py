@@ -0,0 +1,40 @@
+import threading
+import pytest
+
+from BoardMonitor.PollScheduler import PollScheduler
+
+def frame(poll, changed, urgent=False):
+    poll.frame_start()
+    return poll.frame_done(changed, urgent)
+
+def test_backoff_and_reset():
+    poll = PollScheduler(0.1, 0.5, 2, fastFrames=2)
+    intervals = []
+    for changed in (False, False, False, False, False, True, False, False):
+        frame(poll, changed)
+        intervals.append(poll.interval)
+    # the fast frames after the start and after the change, backed off to the max in between
+    assert intervals == pytest.approx([0.1, 0.1, 0.2, 0.4, 0.5, 0.1, 0.1, 0.2])
+    frame(poll, False, urgent=True)
+    assert poll.interval == pytest.approx(0.1)
+    assert frame(poll, False) <= 0.2
+
+def test_scan_time_taken_out_of_the_wait():
+    poll = PollScheduler(0.1, 0.5, 2, fastFrames=0)
+    poll.frame_start()
+    poll.frameStart -= 0.04 # the scan took 40ms
+    assert poll.frame_done(True) == pytest.approx(0.06, abs=0.01)
+    poll.frame_start()
+    poll.frameStart -= 0.3
+    assert poll.frame_done(True) == 0.0
+
+def test_wake():
+    poll = PollScheduler(0.1, 0.5, 2, fastFrames=0)
+    for _ in range(4):
+        frame(poll, False)
+    assert poll.interval == pytest.approx(0.5)
+    threading.Timer(0.05, poll.wake).start()
+    poll.sleep(5)
+    assert poll.lastWait < 1
+    assert poll.interval == pytest.approx(0.1) and poll.fastLeft == 0
+    assert poll.frames == 1
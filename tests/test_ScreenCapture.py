@@ -0,0 +1,44 @@
+import numpy as np
+import cv2
+import pytest
+
+from BoardMonitor.ScreenCapture import FrameBufferPool, create_capture
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match='Unknown capture backend'):
+        create_capture('nope')
+
+def test_replay_capture(tmp_path):
+    for i in range(2):
+        cv2.imwrite(str(tmp_path / f'{i}.png'), np.full((20, 30), i * 100, dtype=np.uint8))
+    capture = create_capture('replay', {'replayPath': str(tmp_path), 'replayLoop': False})
+    first = capture.grab((5, 2, 15, 8))
+    assert first.shape == (6, 10) and first.max() == 0
+    assert capture.grab().min() == 100
+    with pytest.raises(EOFError):
+        capture.grab()
+    assert capture.frames == 2
+
+def test_frame_pool_reuse():
+    pool = FrameBufferPool(2)
+    a, b = pool.acquire((4, 5)), pool.acquire((4, 5))
+    c = pool.acquire((4, 5)) # the pool is empty
+    assert pool.misses == 1 and c is not a and c is not b
+    pool.release(a)
+    pool.release(b)
+    pool.release(c) # more than the pool size, dropped
+    assert pool.acquire((4, 5)) is b and pool.acquire((4, 5)) is a
+    pool.release(a)
+    # a new region size re-allocate the buffers, the old ones are not taken back
+    d = pool.acquire((6, 5))
+    assert d.shape == (6, 5) and d is not a
+    pool.release(a)
+    assert len(pool.free) == 1 and pool.misses == 1
+
+def test_replay_capture_into_pool(tmp_path):
+    cv2.imwrite(str(tmp_path / '0.png'), np.full((20, 30), 7, dtype=np.uint8))
+    capture = create_capture('replay', {'replayPath': str(tmp_path)})
+    pool = FrameBufferPool(1)
+    img = capture.grab(None, pool)
+    pool.release(img)
+    assert capture.grab(None, pool) is img and img.min() == 7
@@ -0,0 +1,61 @@
+import os, json
+import pytest
+
+from EngineGame import START_FEN, fen_board, board_fen, apply_move
+from BoardMonitor.SnapshotDriver import SnapshotDriver
+from BoardMonitor.XqchessMonitor import XqchessMonitor
+from XqchessReplay import SCAN_MODES, replay, check, open_browser
+
+SNAPSHOTS = os.path.join(os.path.dirname(__file__), 'snapshots', 'xqchess')
+# the moves shown by the snapshots 01 to 06, 03 is the same board as 02
+GAME = 'h3e3 h10g8 h10g8 h1g3 i10h10 e3e7'
+
+@pytest.fixture(scope='module')
+def snapshots():
+    return SnapshotDriver.from_path(SNAPSHOTS).snapshots
+
+@pytest.fixture(scope='module')
+def expected():
+    with open(os.path.join(SNAPSHOTS, 'expected.json')) as f:
+        return json.load(f)
+
+def test_expected_fens(snapshots, expected):
+    board, fens = fen_board(START_FEN), [START_FEN]
+    for i, mv in enumerate(GAME.split()):
+        board = board if i == 2 else apply_move(board, mv)
+        fens.append(board_fen(board))
+    assert [name for name, _ in snapshots] == sorted(expected)
+    assert [expected[name]['fen'] for name, _ in snapshots] == [fen.split()[0] for fen in fens]
+
+@pytest.mark.parametrize('mode', SCAN_MODES)
+def test_replay(snapshots, expected, mode):
+    records, _, msgs = replay(snapshots, mode)
+    assert check(records, expected) == []
+    assert msgs == []
+
+# the in-page scripts of XqchessMonitor, run in a headless Chrome
+@pytest.fixture(scope='module')
+def browser():
+    try:
+        browser = open_browser('chrome')
+    except Exception as e:
+        pytest.skip(f'no headless Chrome: {e}')
+    yield browser
+    browser.quit()
+
+@pytest.mark.parametrize('mode', SCAN_MODES + ['observer-wait'])
+def test_replay_browser(browser, snapshots, expected, mode):
+    records, _, msgs = replay(snapshots, mode, browser)
+    assert check(records, expected) == []
+    assert msgs == []
+
+# a piece the in-page serializer does not know is '?', not a White piece
+def test_compact_unknown_piece():
+    mon = XqchessMonitor()
+    mon.do_init({'wdriver': None, 'scanMode': 'compact'})
+    placement = 'rnbakabnr' + '.' * 72 + 'RNBAKABNR'
+    assert mon.parse_compact(placement, '', '').positions[9] == list('RNBAKABNR')
+    with pytest.raises(ValueError, match='Unknown piece'):
+        mon.parse_compact(placement.replace('A', '?', 1), '', '')
+    with pytest.raises(ValueError, match='Unknown piece'):
+        mon.parse_compact(placement[:-1], '', '')
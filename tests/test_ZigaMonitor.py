@@ -0,0 +1,142 @@
+import json, shutil
+import numpy as np
+import pytest
+
+import BoardMonitor.ZigaMonitor as ZigaMonitor_module
+from BoardMonitor.ZigaMonitor import ZigaMonitor
+from ziga_board import PATTERN_PATH, render_board, render_screen, fen_positions, START_FEN
+
+@pytest.fixture
+def mon():
+    mon = ZigaMonitor()
+    mon.do_init(dict(patternPath=PATTERN_PATH))
+    return mon
+
+@pytest.mark.parametrize('mode', ['batch', 'loop'])
+def test_cache_invalidated_by_thresholds(mon, mode):
+    mon.do_init(dict(patternPath=PATTERN_PATH, scanMode=mode))
+    board = render_board()
+    assert mon.scan_cells(board) == fen_positions(START_FEN)
+    # no piece can reach this score: a cached result would still give the pieces
+    mon.classifier.thresh = 1.01
+    mon.classifier.occupancyThresh = 1.01
+    assert mon.scan_cells(board) == fen_positions('9/' * 9 + '9')
+    assert mon.cellCache.invalidations == 1
+    mon.classifier.thresh = 0.8
+    mon.classifier.occupancyThresh = 0.45
+    assert mon.scan_cells(board) == fen_positions(START_FEN)
+
+def test_template_calls_saved_per_frame(mon):
+    board = render_board()
+    mon.scan_image(board)
+    assert mon.emptyCells == 90 - 32
+    assert mon.templateCallsSaved == (90 - 32) * len(mon.piecePatterns)
+    # nothing changed: nothing classified, nothing saved
+    mon.scan_image(board)
+    assert mon.cellsRescanned == 0 and mon.templateCallsSaved == 0
+    # the cannon h3e3 only rescan the 2 cells, one is empty now
+    mon.scan_image(render_board('rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C2C4/9/RNBAKABNR', lastMove=(4,7)))
+    assert mon.cellsRescanned == 2
+    assert mon.templateCallsSaved == len(mon.piecePatterns)
+
+def test_template_calls_saved_cache_hits(mon):
+    mon.do_init(dict(patternPath=PATTERN_PATH, incremental=False))
+    board = render_board()
+    mon.scan_image(board)
+    assert mon.templateCallsSaved > 0
+    mon.scan_image(board)
+    assert mon.cellCache.hits == 90 and mon.templateCallsSaved == 0
+
+# the thresholds ZigaCalibrate measured come with its patterns, the params still win
+def test_calibrated_thresholds(tmp_path):
+    path = tmp_path / 'ZigaNew'
+    shutil.copytree(PATTERN_PATH, path, ignore=shutil.ignore_patterns('pack.*'))
+    with open(path / 'geometry.json', 'w') as f:
+        json.dump({'thresholds': {'piece': 0.7, 'occupancy': 0.4, 'border': 0.9}}, f)
+    mon = ZigaMonitor()
+    mon.do_init(dict(patternPath=str(path)))
+    assert (mon.classifier.thresh, mon.classifier.occupancyThresh, mon.borderThresh) == (0.7, 0.4, 0.9)
+    mon.do_init(dict(patternPath=str(path), occupancyThresh=0.5))
+    assert mon.classifier.occupancyThresh == 0.5
+    mon.do_init(dict(patternPath=PATTERN_PATH))
+    assert (mon.classifier.thresh, mon.borderThresh) == (ZigaMonitor_module.PIECE_THRESH, ZigaMonitor_module.BORDER_THRESH)
+
+# the board at every offset from the downscaled pixel grid of the coarse level
+@pytest.mark.parametrize('dx', range(4))
+def test_pyramid_finds_board(mon, dx):
+    board = render_board()
+    for dy in range(4):
+        pos = (301 + dx, 203 + dy)
+        found = mon.find_border_pyramid(render_screen(board, pos=pos, seed=dx*4 + dy))
+        assert [tuple(p) for p in found] == [pos]
+
+def test_pyramid_miss_full_search(mon, monkeypatch):
+    screen = render_screen(render_board(), pos=(301, 203))
+    monkeypatch.setattr(ZigaMonitor_module, 'PYRAMID_THRESH', 1.01) # the coarse level find nothing
+    assert [tuple(p) for p in mon.find_board(screen)] == [(301, 203)]
+    assert mon.pyramidMisses == 1
+    # the full search is not repeated on each frame
+    assert len(mon.find_board(screen)) == 0
+    assert mon.pyramidMisses == 1
+    monkeypatch.setattr(ZigaMonitor_module, 'FULL_SEARCH_EVERY', 0)
+    assert len(mon.find_board(screen)) == 1
+    assert mon.pyramidMisses == 2
+
+def test_no_board(mon):
+    screen = render_screen(render_board(), pos=(301, 203))
+    screen[:] = 230
+    assert mon.scan_image(screen) is None
+    assert mon.pyramidMisses == 1
+
+# the browser zoom: the lattice search find the scale, then the next frames are region captures
+@pytest.mark.parametrize('zoom', [0.8, 1.25, 1.5])
+def test_zoomed_board(mon, zoom):
+    screen = render_screen(render_board(), pos=(301, 203), zoom=zoom)
+    result = mon.scan_image(screen)
+    assert result is not None and result.positions == fen_positions(START_FEN)
+    assert mon.boardScale == pytest.approx(zoom, rel=0.005)
+    assert mon.boardOrigin == pytest.approx((301, 203), abs=1)
+    region = mon.lastScanRegion
+    x0, y0, x1, y1 = region
+    result = mon.scan_image(render_screen(render_board(lastMove=(4,7)), pos=(301, 203), zoom=zoom)[y0:y1, x0:x1])
+    assert result is not None and result.positions == fen_positions(START_FEN)
+    assert mon.lastScanRegion == region
+
+def test_locate_retry_rate_limited(mon, monkeypatch):
+    calls = []
+    locate = mon.locate_board_scale
+    monkeypatch.setattr(mon, 'locate_board_scale', lambda screen: calls.append(1) or locate(screen))
+    screen = render_screen(render_board(), pos=(301, 203))
+    screen[:] = 230
+    assert mon.scan_image(screen) is None and mon.scan_image(screen) is None
+    assert len(calls) == 1
+    monkeypatch.setattr(ZigaMonitor_module, 'LOCATE_RETRY_EVERY', 0)
+    assert mon.scan_image(screen) is None
+    assert len(calls) == 2
+
+MIDGAME_FEN = 'r1bakab1r/9/1cn4cn/p1p1p1p1p/9/6P2/P1P1P3P/1C2C1N2/9/RNBAKAB1R'
+
+@pytest.mark.parametrize('occupancyThresh', [ZigaMonitor_module.OCCUPANCY_THRESH, None])
+def test_classifier(mon, occupancyThresh):
+    mon.classifier.occupancyThresh = occupancyThresh
+    positions = np.array(fen_positions(MIDGAME_FEN))
+    symbols, confidence, occupied = mon.classifier.classify(mon.stack_patches(render_board(MIDGAME_FEN)))
+    assert symbols.tolist() == positions.tolist()
+    assert (confidence[positions != '.'] >= mon.classifier.thresh).all()
+    if occupancyThresh is None:
+        assert occupied.all()
+    else:
+        # the empty cells are not scored at all
+        assert (occupied == (positions != '.')).all()
+        assert (confidence[~occupied] == 0).all()
+
+def test_changed_cells(mon):
+    mon.prevBoard = render_board()
+    # the cannon h3e3: its 2 cells, the marker is around the destination only
+    changed = mon.changed_cells(render_board('rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C2C4/9/RNBAKABNR', lastMove=(4,7)))
+    assert sorted(zip(*np.nonzero(changed))) == [(7, 4), (7, 7)]
+    assert not mon.changed_cells(render_board()).any()
+    # more cells than maxChangedCells (i.e. an animation, a new game): full scan
+    assert mon.changed_cells(render_board(MIDGAME_FEN)) is None
+    mon.framesSinceFullScan = mon.fullScanEvery
+    assert mon.changed_cells(render_board()) is None
@@ -0,0 +1,102 @@
+import os
+import numpy as np
+import cv2
+
+from BoardMonitor.BaseMonitor import GRID_WIDTH, GRID_HEIGHT, PIECE_SYMBOL
+
+# Draw a Ziga board from the pattern images, as the site show it: the border frame, the grid lines on
+# a wood texture, the pieces at the intersections and the last move marker. There is no real screenshot
+# in the repo, the monitor tests and the ZigaBench runs scan these
+
+PATTERN_PATH = os.path.join(os.path.dirname(__file__), '..', 'src', 'patterns', 'Ziga')
+START_FEN = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR'
+WOOD = 150 # gray of the board and of its grid lines, as in play_area.png
+LINE = 82
+# the grid lines in play_area.png: the cells are 57 pixels, but the river is 63
+LINE_X = [0, 55.5, 112.5, 169.5, 226.5, 283.5, 340.5, 397.5, 454]
+LINE_Y = [0, 56.5, 113.5, 170.5, 227.5, 290.5, 347.5, 404.5, 461.5, 518]
+
+SYMBOL_PATTERN = {sym: name for name, sym in PIECE_SYMBOL.items()}
+
+def read(name):
+    return cv2.imread(os.path.join(PATTERN_PATH, f'{name}.png'), cv2.IMREAD_UNCHANGED)
+
+def gray(img):
+    return cv2.cvtColor(img[..., :3], cv2.COLOR_BGR2GRAY)
+
+# fen board part -> [row][col] symbols, row 0 is the top of the screen
+def fen_positions(fen):
+    positions = []
+    for rank in fen.split(' ')[0].split('/'):
+        row = []
+        for c in rank:
+            row += ['.'] * int(c) if c.isdigit() else [c]
+        positions.append(row)
+    return positions
+
+# the [X,Y] of the intersection in the board image
+def intersection(col, row):
+    playStart = np.array(read('corrner2playfield').shape[1::-1])
+    return playStart + np.array([LINE_X[col], LINE_Y[row]])
+
+def paste(board, img, center, mask=None):
+    H, W = img.shape
+    x, y = np.round(center - np.array([W, H]) / 2).astype(int)
+    area = board[y:y+H, x:x+W]
+    if mask is None:
+        area[:] = img
+    else:
+        area[mask] = img[mask]
+
+# return the gray board, of the border pattern size
+# lastMove: [X/col, Y/row] of the marker, None for no marker
+def render_board(fen=START_FEN, lastMove=None, seed=0):
+    frame = read('borderFull')
+    H, W = frame.shape[:2]
+    rng = np.random.default_rng(seed)
+    # wood: smooth noise around the board color, the template matching need some texture
+    noise = cv2.GaussianBlur(rng.normal(0, 40, (H, W)).astype(np.float32), (0, 0), 3)
+    board = np.clip(WOOD + noise, 0, 255).astype(np.uint8)
+    inFrame = frame[..., 3] > 0
+    board[inFrame] = gray(frame)[inFrame]
+
+    left, top = intersection(0, 0).astype(int)
+    right, bottom = intersection(GRID_WIDTH-1, GRID_HEIGHT-1).astype(int)
+    for row in range(GRID_HEIGHT):
+        y = int(intersection(0, row)[1])
+        board[y:y+2, left:right+1] = LINE
+    for col in range(GRID_WIDTH):
+        x = int(intersection(col, 0)[0])
+        for r0, r1 in ((0, 4), (5, 9)) if 0 < col < GRID_WIDTH-1 else ((0, 9),): # the river cut the inner files
+            y0, y1 = int(intersection(col, r0)[1]), int(intersection(col, r1)[1])
+            board[y0:y1+1, x:x+2] = LINE
+    for r0, r1 in ((0, 2), (7, 9)): # the palaces
+        for (c0, ra), (c1, rb) in (((3, r0), (5, r1)), ((5, r0), (3, r1))):
+            p0, p1 = intersection(c0, ra).astype(int), intersection(c1, rb).astype(int)
+            cv2.line(board, tuple(map(int, p0)), tuple(map(int, p1)), LINE, 2)
+
+    for row, symbols in enumerate(fen_positions(fen)):
+        for col, sym in enumerate(symbols):
+            if sym != '.':
+                side = 'White' if sym.isupper() else 'Black'
+                paste(board, gray(read(side + SYMBOL_PATTERN[sym.upper()])), intersection(col, row))
+    if lastMove is not None:
+        marker = read('lastMove')
+        paste(board, gray(marker), intersection(*lastMove), marker[..., 3] > 0)
+    return board
+
+# a screen of the given [W,H] with the board zoomed and at [X,Y]
+def render_screen(board, size=(1920, 1080), pos=(300, 200), zoom=1.0, seed=0):
+    if zoom != 1:
+        board = cv2.resize(board, (0, 0), fx=zoom, fy=zoom, interpolation=cv2.INTER_AREA if zoom < 1 else cv2.INTER_LINEAR)
+    W, H = size
+    rng = np.random.default_rng(seed)
+    # a desktop: flat background with a few windows
+    screen = np.full((H, W), 230, dtype=np.uint8)
+    for _ in range(6):
+        x, y = rng.integers(0, W), rng.integers(0, H)
+        cv2.rectangle(screen, (int(x), int(y)), (int(x + rng.integers(100, 600)), int(y + rng.integers(50, 400))),
+                      int(rng.integers(40, 250)), -1)
+    x, y = pos
+    screen[y:y+board.shape[0], x:x+board.shape[1]] = board
+    return screen